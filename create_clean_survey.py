@@ -2,54 +2,55 @@
 """
 Create a clean version starting directly from (2).qsf,
 only modifying what's necessary and preserving all original structure.
+
+Run with --balanced to use a pair-balanced design (qsf_design.py) instead
+of the original cyclic combinations.
 """
 
-import json
+import sys
 
-def main():
-    input_file = 'ai-attribution-in-cs-ed-master (2).qsf'
-    output_file = 'ai-attribution-in-cs-ed-master-clean.qsf'
-    
-    print(f"Loading {input_file}...")
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+import qsf_instrument
+from qsf_clone import clone
+from qsf_design import combination_groups, design_rows
+from qsf_document import QSFDocument
+
+@qsf_instrument.transform('create_clean_survey')
+def main(input_file='ai-attribution-in-cs-ed-master (2).qsf',
+         output_file='ai-attribution-in-cs-ed-master-clean.qsf',
+         doc=None, design='cyclic', seed=42):
+    """
+    Run the transform; pass doc (and output_file=None) to work in memory.
+    design is 'cyclic' (the original combinations) or 'balanced'.
+    """
+    if doc is None:
+        print(f"Loading {input_file}...")
+        doc = QSFDocument.load(input_file)
+    qsf_instrument.phase('locate')
     
     # Keep original SurveyEntry unchanged
     print(f"✓ Preserving SurveyEntry")
     
     # Find blocks element
-    blocks_element = None
-    blocks_index = None
-    for i, elem in enumerate(data.get('SurveyElements', [])):
-        if elem.get('Element') == 'BL':
-            blocks_element = elem
-            blocks_index = i
-            break
-    
-    blocks_payload = blocks_element.get('Payload', [])
+    blocks_element = doc.blocks_element
     
     # Find per-vignette block
-    per_vig_block = None
-    for block in blocks_payload:
-        if block.get('ID') == 'BL_8xeykGPs5f8ULQy':
-            per_vig_block = block
-            break
+    per_vig_block = doc.block('BL_8xeykGPs5f8ULQy')
     
     print(f"✓ Found per-vignette block")
     
+    qsf_instrument.phase('clone')
     # Create 5 copies of per-vignette block
     for i in range(1, 6):
-        new_block = json.loads(json.dumps(per_vig_block))
+        new_block = clone(per_vig_block)
         new_block['Description'] = f'per-vignette-S{i}'
         new_block['ID'] = f'BL_PerVig_S{i}'
-        blocks_payload.append(new_block)
+        doc.add_blocks([new_block])
     
     print(f"✓ Created 5 per-vignette blocks")
     
     # Create 5 dynamic S blocks
     for i in range(1, 6):
-        blocks_payload.append({
+        doc.add_blocks([{
             "Type": "Default",
             "Description": f"S{i}_Dynamic",
             "ID": f"BL_S{i}_Dynamic",
@@ -59,12 +60,12 @@ def main():
                 "RandomizeQuestions": "false",
                 "BlockVisibility": "Expanded"
             }
-        })
+        }])
     
     print(f"✓ Created 5 dynamic S blocks")
     
     # Create display and input blocks
-    blocks_payload.append({
+    doc.add_blocks([{
         "Type": "Default",
         "Description": "Display Assigned Scenarios",
         "ID": "BL_DisplayScenarios",
@@ -74,9 +75,7 @@ def main():
             "RandomizeQuestions": "false",
             "BlockVisibility": "Expanded"
         }
-    })
-    
-    blocks_payload.append({
+    }, {
         "Type": "Default",
         "Description": "Input Scenario Numbers",
         "ID": "BL_InputScenarios",
@@ -86,16 +85,12 @@ def main():
             "RandomizeQuestions": "false",
             "BlockVisibility": "Expanded"
         }
-    })
+    }])
     
     print(f"✓ Created display and input blocks")
     
     # Get a sample SurveyID from existing questions
-    sample_survey_id = None
-    for elem in data['SurveyElements']:
-        if elem.get('Element') == 'SQ':
-            sample_survey_id = elem.get('SurveyID')
-            break
+    sample_survey_id = doc.survey_id
     
     # Create questions
     questions_to_add = []
@@ -185,17 +180,16 @@ def main():
         })
     
     # Insert questions before blocks element
-    for i, q in enumerate(questions_to_add):
-        data['SurveyElements'].insert(blocks_index + i, q)
+    with doc.batch() as batch:
+        batch.insert_before(blocks_element, questions_to_add)
     
     print(f"✓ Created {len(questions_to_add)} questions")
+    qsf_instrument.count('blocks', 12)
+    qsf_instrument.count('questions', len(questions_to_add))
+    qsf_instrument.phase('flow')
     
     # Modify Survey Flow
-    flow_element = None
-    for elem in data.get('SurveyElements', []):
-        if elem.get('Element') == 'FL':
-            flow_element = elem
-            break
+    flow_element = doc.flow_element
     
     flow_payload = flow_element.get('Payload', {})
     original_flow = flow_payload.get('Flow', [])
@@ -224,26 +218,12 @@ def main():
     }
     
     # Create 102 groups with different scenario combinations
-    for i in range(1, 103):
-        scenarios = []
-        for j in range(5):
-            idx = (i - 1 + j * 20) % 102
-            scenarios.append(idx + 1)
-        
-        randomizer["Flow"].append({
-            "Type": "Group",
-            "FlowID": f"FL_Group{i}",
-            "Description": f"Scenario Combo {i}",
-            "Flow": [{
-                "Type": "EmbeddedData",
-                "FlowID": f"FL_SetScenarios{i}",
-                "EmbeddedData": [
-                    {"Description": f"scenario{j+1}", "Type": "Custom", "Field": f"scenario{j+1}",
-                     "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(scenarios[j])}
-                    for j in range(5)
-                ]
-            }]
-        })
+    combinations = design_rows(102, 5, design, seed)
+    randomizer["Flow"] = combination_groups(
+        combinations,
+        lambda i: f"FL_Group{i}",
+        lambda i: f"FL_SetScenarios{i}",
+        lambda i: f"Scenario Combo {i}")
     
     new_flow.append(randomizer)
     
@@ -263,15 +243,17 @@ def main():
     
     # Replace flow
     flow_payload['Flow'] = new_flow
+    qsf_instrument.count('flow_nodes', len(new_flow))
+    doc.invalidate_flow_index()
     flow_payload['Properties'] = {"Count": len(new_flow)}
     
     print(f"✓ Created new flow with {len(new_flow)} items")
     
+    qsf_instrument.phase('dump')
     # Write output
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\\n✅ Successfully created {output_file}")
+    if output_file:
+        doc.save(output_file)
+        print(f"\\n✅ Successfully created {output_file}")
     print(f"   - Based directly on original (2).qsf")
     print(f"   - Preserves all original metadata")
     print(f"   - 5 dynamic iframe blocks with piped text")
@@ -281,4 +263,4 @@ def main():
     return True
 
 if __name__ == '__main__':
-    main()
+    main(design='balanced' if '--balanced' in sys.argv else 'cyclic')
@@ -2,105 +2,80 @@
 """
 Fix the BlockRandomizer to properly assign 5 DIFFERENT scenario numbers.
 Use a different approach: Web Service to generate 5 unique random numbers.
+
+Run with --balanced to use a pair-balanced design (qsf_design.py) instead
+of the original cyclic combinations.
 """
 
-import json
+import sys
 
-def main():
-    input_file = 'ai-attribution-in-cs-ed-master-simplified.qsf'
-    output_file = 'ai-attribution-in-cs-ed-master-fixed.qsf'
-    
-    print(f"Loading {input_file}...")
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+import qsf_instrument
+from qsf_design import combination_groups, design_rows
+from qsf_document import QSFDocument
+
+@qsf_instrument.transform('fix_randomizer')
+def main(input_file='ai-attribution-in-cs-ed-master-simplified.qsf',
+         output_file='ai-attribution-in-cs-ed-master-fixed.qsf',
+         doc=None, design='cyclic', seed=42):
+    """
+    Run the transform; pass doc (and output_file=None) to work in memory.
+    design is 'cyclic' (the original combinations) or 'balanced'.
+    """
+    if doc is None:
+        print(f"Loading {input_file}...")
+        doc = QSFDocument.load(input_file)
+    qsf_instrument.phase('locate')
     
     # Find Survey Flow
-    flow_element = None
-    for elem in data.get('SurveyElements', []):
-        if elem.get('Element') == 'FL':
-            flow_element = elem
-            break
+    flow_element = doc.flow_element
     
     if not flow_element:
         print("Error: Could not find Survey Flow element")
         return False
     
-    flow_payload = flow_element.get('Payload', {})
-    flow = flow_payload.get('Flow', [])
+    flow_index = doc.flow_index
     
     # Find and replace the BlockRandomizer
-    new_flow = []
-    
-    for item in flow:
-        if item.get('Type') == 'BlockRandomizer' and item.get('FlowID') == 'FL_ScenarioRandomizer':
-            print('✓ Found BlockRandomizer - replacing with correct structure')
-            
-            # Create a simpler randomizer that uses Groups
-            # Each group represents a unique combination of 5 scenarios
-            # This ensures 5 DIFFERENT numbers are selected
-            
-            # For now, let's use a JavaScript-based approach
-            # Add embedded data that will be populated via survey options
-            new_randomizer = {
-                "Type": "BlockRandomizer",
-                "FlowID": "FL_ScenarioRandomizer", 
-                "SubSet": "1",  # Select 1 group (which contains 5 scenarios)
-                "EvenPresentation": True,
-                "Flow": []
-            }
-            
-            # Create groups, each with 5 different scenario numbers
-            # We'll create enough combinations to ensure even distribution
-            # For simplicity, create 102 groups, each starting at a different number
-            import random
-            random.seed(42)  # For reproducibility
-            
-            all_scenarios = list(range(1, 103))
-            
-            for i in range(1, 103):
-                # Create a combination starting at scenario i
-                # Select 5 consecutive scenarios (wrapping around)
-                scenarios = []
-                for j in range(5):
-                    idx = (i - 1 + j * 20) % 102
-                    scenarios.append(all_scenarios[idx])
-                
-                group_flow = {
-                    "Type": "Group",
-                    "FlowID": f"FL_ScenarioCombination{i}",
-                    "Description": f"Scenario Combination {i}",
-                    "Flow": [
-                        {
-                            "Type": "EmbeddedData",
-                            "FlowID": f"FL_SetScenarios{i}",
-                            "EmbeddedData": [
-                                {"Description": "scenario1", "Type": "Custom", "Field": "scenario1", "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(scenarios[0])},
-                                {"Description": "scenario2", "Type": "Custom", "Field": "scenario2", "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(scenarios[1])},
-                                {"Description": "scenario3", "Type": "Custom", "Field": "scenario3", "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(scenarios[2])},
-                                {"Description": "scenario4", "Type": "Custom", "Field": "scenario4", "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(scenarios[3])},
-                                {"Description": "scenario5", "Type": "Custom", "Field": "scenario5", "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(scenarios[4])}
-                            ]
-                        }
-                    ]
-                }
-                
-                new_randomizer["Flow"].append(group_flow)
-            
-            new_flow.append(new_randomizer)
-            print(f'✓ Created new randomizer with 102 groups (each group has 5 different scenarios)')
-            
-        else:
-            new_flow.append(item)
+    old_randomizer = flow_index.node('FL_ScenarioRandomizer')
     
-    # Replace the flow
-    flow_payload['Flow'] = new_flow
+    if old_randomizer and old_randomizer.get('Type') == 'BlockRandomizer':
+        print('✓ Found BlockRandomizer - replacing with correct structure')
+        
+        qsf_instrument.phase('flow')
+        # Create a simpler randomizer that uses Groups
+        # Each group represents a unique combination of 5 scenarios
+        # This ensures 5 DIFFERENT numbers are selected
+        
+        # For now, let's use a JavaScript-based approach
+        # Add embedded data that will be populated via survey options
+        new_randomizer = {
+            "Type": "BlockRandomizer",
+            "FlowID": "FL_ScenarioRandomizer", 
+            "SubSet": "1",  # Select 1 group (which contains 5 scenarios)
+            "EvenPresentation": True,
+            "Flow": []
+        }
+        
+        # Create 102 groups, each with 5 different scenario numbers.
+        # 'cyclic' takes scenarios i, i+20, ..., i+80 (wrapping around);
+        # 'balanced' also shows every scenario 5 times but never pairs the
+        # same two scenarios twice
+        combinations = design_rows(102, 5, design, seed)
+        new_randomizer["Flow"] = combination_groups(
+            combinations,
+            lambda i: f"FL_ScenarioCombination{i}",
+            lambda i: f"FL_SetScenarios{i}",
+            lambda i: f"Scenario Combination {i}")
+        
+        flow_index.replace(old_randomizer, new_randomizer)
+        qsf_instrument.count('flow_nodes', len(new_randomizer["Flow"]))
+        print(f'✓ Created new randomizer with 102 groups (each group has 5 different scenarios)')
     
+    qsf_instrument.phase('dump')
     # Write output
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Successfully created {output_file}")
+    if output_file:
+        doc.save(output_file)
+        print(f"\n✅ Successfully created {output_file}")
     print(f"   - Fixed randomizer to assign 5 DIFFERENT scenario numbers")
     print(f"   - Each participant gets a unique combination of 5 scenarios")
     print(f"\n🎉 Ready to import into Qualtrics!")
@@ -108,4 +83,4 @@ def main():
     return True
 
 if __name__ == '__main__':
-    main()
+    main(design='balanced' if '--balanced' in sys.argv else 'cyclic')
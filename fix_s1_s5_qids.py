@@ -4,17 +4,23 @@ Fix duplicate Question IDs in per-vignette-S1 to S5 blocks.
 Each block should have unique QIDs for its 14 questions.
 """
 
-import json
 import sys
-import copy
 
-def fix_qids_for_s1_to_s5(qsf_file):
+import qsf_instrument
+from qsf_dedup import question_clones
+from qsf_document import QSFDocument
+from qsf_ids import IDAllocator
+
+@qsf_instrument.transform('fix_qids_for_s1_to_s5')
+def fix_qids_for_s1_to_s5(qsf_file, doc=None):
     """
     Fix QIDs for per-vignette-S1 to S5 blocks.
     Each block gets unique QIDs.
+    Pass an already loaded doc (and qsf_file=None) to fix it in memory.
     """
-    with open(qsf_file, 'r', encoding='utf-8') as f:
-        survey = json.load(f)
+    if doc is None:
+        doc = QSFDocument.load(qsf_file)
+    qsf_instrument.phase('locate')
     
     # The original QIDs used in all blocks
     original_qids = [
@@ -28,27 +34,19 @@ def fix_qids_for_s1_to_s5(qsf_file):
     target_blocks = ["per-vignette-S1", "per-vignette-S2", "per-vignette-S3", 
                      "per-vignette-S4", "per-vignette-S5"]
     
-    # Starting QID number for new unique IDs
-    # Using 1000+ range to avoid conflicts
-    next_qid_num = 1000
+    # New unique QIDs start at QID1000 and skip any QID already in the survey
+    new_qids = IDAllocator(doc).qids(start=1000)
+    created_count = 0
     
     # Map to store old QID -> new QID mappings for each block
     block_qid_mappings = {}
     
-    # Find the BL (Blocks) element
-    blocks_element = [e for e in survey['SurveyElements'] if e.get('Element') == 'BL'][0]
-    all_blocks = blocks_element['Payload']
-    
     # Process each target block
     for block_idx, target_block_desc in enumerate(target_blocks, start=1):
         print(f"\nProcessing {target_block_desc}...")
         
         # Find the block
-        block = None
-        for block_data in all_blocks:
-            if isinstance(block_data, dict) and block_data.get('Description') == target_block_desc:
-                block = block_data
-                break
+        block = doc.block_by_description(target_block_desc)
         
         if not block:
             print(f"Warning: Block {target_block_desc} not found")
@@ -66,10 +64,10 @@ def fix_qids_for_s1_to_s5(qsf_file):
         
         # Assign new QIDs
         for old_qid in question_qids:
-            new_qid = f"QID{next_qid_num}"
+            new_qid = next(new_qids)
             block_qid_mappings[target_block_desc][old_qid] = new_qid
             print(f"  {old_qid} -> {new_qid}")
-            next_qid_num += 1
+            created_count += 1
         
         # Update BlockElements with new QIDs
         for elem in block_elements:
@@ -78,51 +76,51 @@ def fix_qids_for_s1_to_s5(qsf_file):
                 new_qid = block_qid_mappings[target_block_desc][old_qid]
                 elem['QuestionID'] = new_qid
     
+    qsf_instrument.phase('clone')
     # Now create new SQ elements for each new QID
     # Find original question definitions
-    original_questions = {}
-    for element in survey['SurveyElements']:
-        if element.get('Element') == 'SQ':
-            qid = element.get('PrimaryAttribute')
-            if qid in original_qids:
-                original_questions[qid] = element
+    original_questions = doc.questions(original_qids)
     
     print(f"\nFound {len(original_questions)} original question definitions")
     
+    # One clone generator per original question, over its new QID in each
+    # block; the clones share everything but PrimaryAttribute/QuestionID
+    clones = {
+        old_qid: question_clones(template, [mapping[old_qid] for mapping in block_qid_mappings.values()
+                                            if old_qid in mapping])
+        for old_qid, template in original_questions.items()
+    }
+    
     # Create new question elements for each block
     new_elements = []
     for block_desc, qid_mapping in block_qid_mappings.items():
         for old_qid, new_qid in qid_mapping.items():
-            if old_qid in original_questions:
-                # Deep copy the original question element
-                new_question_element = copy.deepcopy(original_questions[old_qid])
-                # Update the PrimaryAttribute (which is the QID)
-                new_question_element['PrimaryAttribute'] = new_qid
-                # Update the QuestionID in the Payload
-                new_question_element['Payload']['QuestionID'] = new_qid
-                # Add to the list of new elements
-                new_elements.append(new_question_element)
+            if old_qid in clones:
+                new_elements.append(next(clones[old_qid]))
                 print(f"Created question element for {new_qid} (from {old_qid})")
     
     # Add new elements to SurveyElements
     # Find the position to insert (after the last SQ element)
-    last_sq_index = -1
-    for i, element in enumerate(survey['SurveyElements']):
-        if element.get('Element') == 'SQ':
-            last_sq_index = i
+    questions = doc.elements_of_type('SQ')
     
     # Insert new elements after the last SQ element
-    if last_sq_index >= 0:
-        survey['SurveyElements'][last_sq_index+1:last_sq_index+1] = new_elements
+    if questions:
+        with doc.batch() as batch:
+            batch.insert_after(questions[-1], new_elements)
         print(f"\nInserted {len(new_elements)} new question elements")
+    qsf_instrument.count('questions', len(new_elements))
+    
+    if qsf_file is None:
+        print(f"Created {created_count} new unique question IDs")
+        return doc
     
+    qsf_instrument.phase('dump')
     # Save the modified survey
     output_file = qsf_file.replace('.qsf', '-fixed-s1-s5.qsf')
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(survey, f, indent=2)
+    doc.save(output_file, ensure_ascii=True)
     
     print(f"\n✅ Fixed survey saved to: {output_file}")
-    print(f"Created {next_qid_num - 1000} new unique question IDs")
+    print(f"Created {created_count} new unique question IDs")
     
     return output_file
 
@@ -4,131 +4,182 @@ Script to generate 102 groups (S1-S102) in the Qualtrics QSF file.
 Each group will have an iframe pointing to pages/1 through pages/102.
 """
 
-import json
 import sys
 
-def generate_groups(input_file, output_file):
-    """Generate 102 groups with iframes for each page number."""
+import qsf_instrument
+from qsf_clone import clone
+from qsf_document import QSFBatch, QSFDocument
+from qsf_ids import IDAllocator
+
+# Kinds of per-scenario item build_scenarios() returns
+FRAGMENT_KINDS = ('questions', 'groups', 's_blocks', 'per_vig_blocks', 'post_vig_blocks',
+                  'teaching_groups', 'teaching_per_vig_blocks', 'teaching_post_vig_blocks')
+
+
+def _iframe_question(survey_id, qid, page_num):
+    return {
+        "SurveyID": survey_id,
+        "Element": "SQ",
+        "PrimaryAttribute": qid,
+        "SecondaryAttribute": "Click to write the question text",
+        "TertiaryAttribute": None,
+        "Payload": {
+            "QuestionText": f'<iframe src="https://hivelabuoft.github.io/ai-attribution-in-cs/pages/{page_num}" \n        width="100%" \n        height="1000px" \n        frameborder="0"\n        scrolling="auto">\n</iframe>',
+            "DefaultChoices": False,
+            "DataExportTag": "slide",
+            "QuestionType": "DB",
+            "Selector": "TB",
+            "DataVisibility": {
+                "Private": False,
+                "Hidden": False
+            },
+            "Configuration": {
+                "QuestionDescriptionOption": "UseText"
+            },
+            "QuestionDescription": "Click to write the question text",
+            "ChoiceOrder": [],
+            "Validation": {
+                "Settings": {
+                    "Type": "None"
+                }
+            },
+            "GradingData": [],
+            "Language": [],
+            "NextChoiceId": 4,
+            "NextAnswerId": 1,
+            "QuestionID": qid
+        }
+    }
+
+
+def _group(template, description, flow_ids, item_ids=()):
+    # flow_ids: the group's own FlowID followed by one per nested flow item;
+    # item_ids: (index, block ID) pairs for the nested flow items
+    group = clone(template)  # Copy-on-write
+    if description is not None:
+        group['Description'] = description
+    group['FlowID'] = flow_ids[0]
+    if 'Flow' in group:
+        for flow_item, flow_id in zip(group['Flow'], flow_ids[1:]):
+            flow_item['FlowID'] = flow_id
+        for index, block_id in item_ids:
+            group['Flow'][index]['ID'] = block_id
+    return group
+
+
+def _block(template, description, block_id):
+    block = clone(template)  # Copy-on-write
+    block['Description'] = description
+    block['ID'] = block_id
+    return block
+
+
+def build_scenarios(templates, scenario_count, qids, student_flow_ids, teaching_flow_ids):
+    """
+    Build every per-scenario item for scenarios 1..scenario_count, using
+    the IDs already allocated to them, and return {kind: [items]} in
+    scenario order.
+    """
+    built = {kind: [] for kind in FRAGMENT_KINDS}
+    built['teaching_groups'] = [[] for _ in templates['teaching_groups']]
+    s1_block = templates['s1_block']
+    per_vig_block = templates['per_vig_block']
+    post_vig_block = templates['post_vig_block']
+
+    for num in range(1, scenario_count + 1):
+        if num >= 3:
+            qid = qids[num]
+            built['questions'].append(_iframe_question(templates['survey_id'], qid, num))
+            item_ids = []
+            if s1_block is not None:
+                # Sn block (iframe) with its own question
+                new_s_block = _block(s1_block, f'S{num}', f'BL_S{num}Generated')
+                new_s_block['BlockElements'] = [{"Type": "Question", "QuestionID": qid}]
+                built['s_blocks'].append(new_s_block)
+                item_ids.append((0, new_s_block['ID']))
+                # Unique per-vignette and post-vig-reflect blocks keep the same questions
+                if per_vig_block:
+                    built['per_vig_blocks'].append(
+                        _block(per_vig_block, f'per-vignette-S{num}', f'BL_PerVig_S{num}'))
+                    item_ids.append((1, f'BL_PerVig_S{num}'))
+                if post_vig_block:
+                    built['post_vig_blocks'].append(
+                        _block(post_vig_block, f'post-vig-reflect-S{num}', f'BL_PostVig_S{num}'))
+                    item_ids.append((2, f'BL_PostVig_S{num}'))
+            # Point the group's three flow items at the new blocks
+            if len(templates['student_group'].get('Flow', [])) < 3:
+                item_ids = []
+            built['groups'].append(_group(templates['student_group'], f'S{num}', student_flow_ids[num], item_ids))
+
+        # Teaching branch groups S1-S102; S1 keeps its Description.
+        # Teaching branch doesn't have iframe blocks, just per-vig and post-vig
+        for k, teaching_template in enumerate(templates['teaching_groups']):
+            item_ids = [(0, f'BL_PerVig_T{num}'), (1, f'BL_PostVig_T{num}')]
+            item_ids = item_ids[:len(teaching_template.get('Flow', []))]
+            built['teaching_groups'][k].append(
+                _group(teaching_template, f'S{num}' if num > 1 else None, teaching_flow_ids[k][num], item_ids))
+
+        if templates['teaching_blocks']:
+            built['teaching_per_vig_blocks'].append(
+                _block(per_vig_block, f'per-vignette-T{num}', f'BL_PerVig_T{num}'))
+            built['teaching_post_vig_blocks'].append(
+                _block(post_vig_block, f'post-vig-reflect-T{num}', f'BL_PostVig_T{num}'))
+    return built
+
+
+@qsf_instrument.transform('generate_groups')
+def generate_groups(input_file, output_file, doc=None, scenario_count=102):
+    """
+    Generate 102 groups with iframes for each page number.
+    Pass an already loaded doc (and output_file=None) to work in memory;
+    scenario_count replaces 102 (the scaling benchmark uses this).
+    """
     
     # Read the QSF file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if doc is None:
+        doc = QSFDocument.load(input_file)
+    qsf_instrument.phase('locate')
+    
+    # All SurveyElements and block payload edits are queued and applied in one pass
+    batch = QSFBatch(doc)
     
-    # Find the existing QID53 and QID54 questions (the iframe questions)
-    survey_elements = data.get('SurveyElements', [])
+    # Every FlowID/QID already in the survey is recorded so new ones never collide
+    ids = IDAllocator(doc)
     
     # We'll use QID53 as the template (it has pages/1)
-    template_question = None
-    for element in survey_elements:
-        if element.get('Element') == 'SQ' and element.get('PrimaryAttribute') == 'QID53':
-            template_question = element
-            break
+    template_question = doc.question('QID53')
     
     if not template_question:
         print("Error: Could not find template question QID53")
         return False
     
-    # Store the base QID number - we'll start from QID53 + 2 = QID55
+    # New QIDs start from QID53 + 2 = QID55
     # (since QID54 is already used for pages/2)
-    base_qid = 55
-    
-    # Generate questions for pages 3 through 102
-    new_questions = []
-    
-    for page_num in range(3, 103):
-        qid = f"QID{base_qid}"
-        base_qid += 1
-        
-        # Create new question based on template
-        new_question = {
-            "SurveyID": template_question["SurveyID"],
-            "Element": "SQ",
-            "PrimaryAttribute": qid,
-            "SecondaryAttribute": "Click to write the question text",
-            "TertiaryAttribute": None,
-            "Payload": {
-                "QuestionText": f'<iframe src="https://hivelabuoft.github.io/ai-attribution-in-cs/pages/{page_num}" \n        width="100%" \n        height="1000px" \n        frameborder="0"\n        scrolling="auto">\n</iframe>',
-                "DefaultChoices": False,
-                "DataExportTag": "slide",
-                "QuestionType": "DB",
-                "Selector": "TB",
-                "DataVisibility": {
-                    "Private": False,
-                    "Hidden": False
-                },
-                "Configuration": {
-                    "QuestionDescriptionOption": "UseText"
-                },
-                "QuestionDescription": "Click to write the question text",
-                "ChoiceOrder": [],
-                "Validation": {
-                    "Settings": {
-                        "Type": "None"
-                    }
-                },
-                "GradingData": [],
-                "Language": [],
-                "NextChoiceId": 4,
-                "NextAnswerId": 1,
-                "QuestionID": qid
-            }
-        }
-        
-        new_questions.append(new_question)
+    # Questions for pages 3 through 102 are built with the other per-scenario items below
+    question_ids = ids.qids(start=55)
+    page_qids = {page_num: next(question_ids) for page_num in range(3, scenario_count + 1)}
     
     # Find where to insert the new questions (after QID54)
-    insert_index = None
-    for i, element in enumerate(survey_elements):
-        if element.get('Element') == 'SQ' and element.get('PrimaryAttribute') == 'QID54':
-            insert_index = i + 1
-            break
-    
-    if insert_index is None:
+    qid54 = doc.question('QID54')
+    if qid54 is None:
         print("Error: Could not find insertion point after QID54")
         return False
     
-    # Insert all new questions
-    for i, new_q in enumerate(new_questions):
-        survey_elements.insert(insert_index + i, new_q)
-    
-    print(f"✓ Generated {len(new_questions)} new iframe questions (QID55-QID{base_qid-1})")
+    print(f"✓ Generated {len(page_qids)} new iframe questions ({page_qids[3]}-{page_qids[scenario_count]})")
     
     # Now we need to create 102 groups in the Survey Flow
     # Find the Survey Flow element
-    flow_element = None
-    for element in data.get('SurveyElements', []):
-        if element.get('Element') == 'FL':
-            flow_element = element
-            break
+    flow_element = doc.flow_element
     
     if not flow_element:
         print("Error: Could not find Survey Flow element")
         return False
     
-    # Find the existing S1 and S2 groups in the flow to use as templates
-    flow_payload = flow_element.get('Payload', {})
-    flow_items = flow_payload.get('Flow', [])
+    # The flow index is built once and answers the lookups below without re-walking the flow
+    flow_index = doc.flow_index
     
     # We need to find the BlockRandomizer that contains the S1/S2 groups
-    def find_randomizer_with_groups(flow_items):
-        """Recursively find the BlockRandomizer containing S1/S2 groups."""
-        for item in flow_items:
-            if item.get('Type') == 'BlockRandomizer':
-                # Check if this randomizer has groups
-                inner_flow = item.get('Flow', [])
-                for inner_item in inner_flow:
-                    if inner_item.get('Type') == 'Group':
-                        desc = inner_item.get('Description', '')
-                        if desc == 'S1' or desc == 'S2':
-                            return item  # Return the randomizer itself
-            # Recursively search in nested flows
-            if 'Flow' in item:
-                result = find_randomizer_with_groups(item['Flow'])
-                if result:
-                    return result
-        return None
-    
-    randomizer = find_randomizer_with_groups(flow_items)
+    randomizer = flow_index.randomizer_with_groups('S1', 'S2')
     
     if not randomizer:
         print("Error: Could not find BlockRandomizer with S1/S2 groups")
@@ -157,288 +208,154 @@ def generate_groups(input_file, output_file):
     
     print(f"✓ Found template group: {s1_template.get('Description')}")
     
-    # Generate groups S3 through S102
-    new_groups = []
-    next_flow_id = 1000  # Start with a high number to avoid conflicts
+    # Teaching branches with an S1 group get S1-S102 in a new BlockRandomizer
+    teaching_branches = []
+    for item in flow_index.branches('Teaching'):
+        for i, sub_item in enumerate(item.get('Flow', [])):
+            if sub_item.get('Type') == 'Group' and sub_item.get('Description') == 'S1':
+                teaching_branches.append((item, sub_item, i))
+                break
+    
+    # Find S1 and S2 blocks, per-vignette block, and post-vig-reflect block as templates
+    blocks = doc.blocks_element
+    s1_block = None
+    per_vig_block = None
+    post_vig_block = None
+    if blocks:
+        for block in blocks.get('Payload', []):
+            desc = block.get('Description', '')
+            if desc == 'S1':
+                s1_block = block
+            elif desc == 'S2':
+                pass
+            elif 'per-vignette' in desc.lower() or desc == 'per-vig':
+                per_vig_block = block
+            elif 'post-vig' in desc.lower():
+                post_vig_block = block
     
-    for group_num in range(3, 103):
-        # Create new group based on S1 template
-        new_group = json.loads(json.dumps(s1_template))  # Deep copy
-        
-        # Update the description and FlowID
-        new_group['Description'] = f'S{group_num}'
-        new_group['FlowID'] = f'FL_{next_flow_id}'
-        next_flow_id += 1
-        
-        # Update all nested FlowIDs within the group
-        if 'Flow' in new_group:
-            for i, flow_item in enumerate(new_group['Flow']):
-                flow_item['FlowID'] = f'FL_{next_flow_id}'
-                next_flow_id += 1
-        
-        new_groups.append(new_group)
+    # FlowIDs are taken in the order the groups appear: Student S3-S102, then
+    # each Teaching branch's S1-S102 followed by its randomizer
+    def group_flow_ids(sequence, template, numbers):
+        per_group = 1 + len(template.get('Flow', [])) if 'Flow' in template else 1
+        return {num: [next(sequence) for _ in range(per_group)] for num in numbers}
+    
+    student_flow_ids = group_flow_ids(ids.flow_ids(start=1000), s1_template, range(3, scenario_count + 1))
+    teaching_flow_ids = []
+    teaching_randomizer_ids = []
+    for _, teaching_s1_group, _ in teaching_branches:
+        teaching_sequence = ids.flow_ids(start=2000)  # Different starting point for teaching branch
+        teaching_flow_ids.append(group_flow_ids(teaching_sequence, teaching_s1_group, range(1, scenario_count + 1)))
+        teaching_randomizer_ids.append(next(teaching_sequence))
+    
+    templates = {
+        'survey_id': template_question["SurveyID"],
+        'student_group': s1_template,
+        'teaching_groups': [group for _, group, _ in teaching_branches],
+        's1_block': s1_block,
+        'per_vig_block': per_vig_block,
+        'post_vig_block': post_vig_block,
+        'teaching_blocks': bool(s1_block and per_vig_block and post_vig_block),
+    }
+    qsf_instrument.phase('clone')
+    built = build_scenarios(templates, scenario_count, page_qids, student_flow_ids, teaching_flow_ids)
+    for kind in FRAGMENT_KINDS:
+        items = built[kind]
+        qsf_instrument.count(kind, sum(map(len, items)) if kind == 'teaching_groups' else len(items))
+    qsf_instrument.phase('flow')
+    new_questions = built['questions']
+    new_groups = built['groups']
+    
+    # Insert all new questions
+    batch.insert_after(qid54, new_questions)
     
     # Insert new groups after S2 in the randomizer
     if group_insert_index is not None:
         # Find position after S2
         s2_index = group_insert_index + 1 if len(existing_groups) > 1 else group_insert_index
         
-        for i, new_group in enumerate(new_groups):
-            randomizer_flow.insert(s2_index + 1 + i, new_group)
+        flow_index.insert(randomizer, s2_index + 1, new_groups)
     
-    print(f"✓ Generated {len(new_groups)} new groups (S3-S102) in BlockRandomizer")
+    print(f"✓ Generated {len(new_groups)} new groups (S3-S{scenario_count}) in BlockRandomizer")
     
     # Update the randomizer to select 5 of 102 instead of 1 of 2
     randomizer['SubSet'] = '5'  # Select 5 groups
     print(f"✓ Updated BlockRandomizer to select 5 of {len(randomizer_flow)} groups")
     
-    # Now handle the Teaching branch - find and add groups there too
+    # Now handle the Teaching branch - replace S1 with a randomizer over S1-S102
     teaching_groups_added = False
-    for item in flow_items:
-        if item.get('Type') == 'Branch':
-            branch_logic = item.get('BranchLogic', {})
-            # Check if this is the Teaching branch
-            is_teaching = False
-            for key in branch_logic:
-                if isinstance(branch_logic[key], dict):
-                    for subkey in branch_logic[key]:
-                        if isinstance(branch_logic[key][subkey], dict):
-                            desc = branch_logic[key][subkey].get('Description', '')
-                            if 'Teaching' in desc:
-                                is_teaching = True
-                                break
-            
-            if is_teaching:
-                teaching_flow = item.get('Flow', [])
-                # Find existing S1 group in teaching branch
-                teaching_s1_group = None
-                teaching_s1_index = None
-                
-                for i, sub_item in enumerate(teaching_flow):
-                    if sub_item.get('Type') == 'Group' and sub_item.get('Description') == 'S1':
-                        teaching_s1_group = sub_item
-                        teaching_s1_index = i
-                        break
-                
-                if teaching_s1_group:
-                    # Generate all groups S1-S102 for teaching branch
-                    teaching_all_groups = []
-                    teaching_flow_id = 2000  # Different starting point for teaching branch
-                    
-                    # First, update S1 with unique FlowIDs
-                    s1_group_copy = json.loads(json.dumps(teaching_s1_group))
-                    s1_group_copy['FlowID'] = f'FL_{teaching_flow_id}'
-                    teaching_flow_id += 1
-                    if 'Flow' in s1_group_copy:
-                        for flow_item in s1_group_copy['Flow']:
-                            flow_item['FlowID'] = f'FL_{teaching_flow_id}'
-                            teaching_flow_id += 1
-                    teaching_all_groups.append(s1_group_copy)
-                    
-                    # Generate S2-S102
-                    for group_num in range(2, 103):
-                        new_group = json.loads(json.dumps(teaching_s1_group))  # Deep copy
-                        new_group['Description'] = f'S{group_num}'
-                        new_group['FlowID'] = f'FL_{teaching_flow_id}'
-                        teaching_flow_id += 1
-                        
-                        # Update nested FlowIDs and block references
-                        if 'Flow' in new_group:
-                            for i, flow_item in enumerate(new_group['Flow']):
-                                flow_item['FlowID'] = f'FL_{teaching_flow_id}'
-                                teaching_flow_id += 1
-                                
-                                # Update block IDs to reference unique blocks for each scenario
-                                # Teaching branch doesn't have iframe blocks, just per-vig and post-vig
-                                if i == 0:  # per-vignette block
-                                    flow_item['ID'] = f'BL_PerVig_T{group_num}'
-                                elif i == 1:  # post-vig-reflect block
-                                    flow_item['ID'] = f'BL_PostVig_T{group_num}'
-                        
-                        teaching_all_groups.append(new_group)
-                    
-                    # Also update S1 group to reference unique teaching blocks
-                    if 'Flow' in s1_group_copy:
-                        for i, flow_item in enumerate(s1_group_copy['Flow']):
-                            if i == 0:  # per-vignette block
-                                flow_item['ID'] = 'BL_PerVig_T1'
-                            elif i == 1:  # post-vig-reflect block
-                                flow_item['ID'] = 'BL_PostVig_T1'
-                    
-                    # Remove the old S1 group
-                    teaching_flow.pop(teaching_s1_index)
-                    
-                    # Create a BlockRandomizer for teaching branch
-                    teaching_randomizer = {
-                        'Type': 'BlockRandomizer',
-                        'FlowID': f'FL_{teaching_flow_id}',
-                        'SubSet': '5',
-                        'EvenPresentation': True,
-                        'Flow': teaching_all_groups
-                    }
-                    teaching_flow_id += 1
-                    
-                    # Insert the randomizer where S1 was
-                    teaching_flow.insert(teaching_s1_index, teaching_randomizer)
-                    
-                    teaching_groups_added = True
-                    print(f"✓ Created BlockRandomizer for Teaching branch with 102 groups (S1-S102)")
-                    print(f"✓ Teaching branch set to select 5 of 102 groups evenly")
-    
-    # Now create the corresponding blocks for S3-S102
-    # Find the blocks section
-    blocks = None
-    for element in survey_elements:
-        if element.get('Element') == 'BL':
-            blocks = element
-            break
-    
-    if not blocks:
-        print("Warning: Could not find blocks element")
-    else:
-        # Find S1 and S2 blocks, per-vignette block, and post-vig-reflect block as templates
-        blocks_payload = blocks.get('Payload', [])
-        s1_block = None
-        s2_block = None
-        per_vig_block = None
-        post_vig_block = None
+    for (item, teaching_s1_group, teaching_s1_index), teaching_all_groups, randomizer_id in zip(
+            teaching_branches, built['teaching_groups'], teaching_randomizer_ids):
+        # Remove the old S1 group
+        flow_index.remove(teaching_s1_group)
         
-        for block in blocks_payload:
-            desc = block.get('Description', '')
-            if desc == 'S1':
-                s1_block = block
-            elif desc == 'S2':
-                s2_block = block
-            elif 'per-vignette' in desc.lower() or desc == 'per-vig':
-                per_vig_block = block
-            elif 'post-vig' in desc.lower():
-                post_vig_block = block
+        # Create a BlockRandomizer for teaching branch
+        teaching_randomizer = {
+            'Type': 'BlockRandomizer',
+            'FlowID': randomizer_id,
+            'SubSet': '5',
+            'EvenPresentation': True,
+            'Flow': teaching_all_groups
+        }
         
-        if s1_block:
-            # First, create unique per-vignette and post-vig blocks for S1 and S2
-            if per_vig_block and post_vig_block:
-                # Create per-vignette-S1
-                per_vig_s1 = json.loads(json.dumps(per_vig_block))
-                per_vig_s1['Description'] = 'per-vignette-S1'
-                per_vig_s1['ID'] = 'BL_PerVig_S1'
-                
-                # Create per-vignette-S2
-                per_vig_s2 = json.loads(json.dumps(per_vig_block))
-                per_vig_s2['Description'] = 'per-vignette-S2'
-                per_vig_s2['ID'] = 'BL_PerVig_S2'
-                
-                # Create post-vig-reflect-S1
-                post_vig_s1 = json.loads(json.dumps(post_vig_block))
-                post_vig_s1['Description'] = 'post-vig-reflect-S1'
-                post_vig_s1['ID'] = 'BL_PostVig_S1'
-                
-                # Create post-vig-reflect-S2
-                post_vig_s2 = json.loads(json.dumps(post_vig_block))
-                post_vig_s2['Description'] = 'post-vig-reflect-S2'
-                post_vig_s2['ID'] = 'BL_PostVig_S2'
-                
-                # Add these to blocks
-                blocks_payload.extend([per_vig_s1, per_vig_s2, post_vig_s1, post_vig_s2])
-                
-                # Update S1 and S2 groups to reference their unique blocks
-                for group in existing_groups:
-                    if group['Description'] == 'S1' and 'Flow' in group and len(group['Flow']) >= 3:
-                        group['Flow'][1]['ID'] = 'BL_PerVig_S1'
-                        group['Flow'][2]['ID'] = 'BL_PostVig_S1'
-                    elif group['Description'] == 'S2' and 'Flow' in group and len(group['Flow']) >= 3:
-                        group['Flow'][1]['ID'] = 'BL_PerVig_S2'
-                        group['Flow'][2]['ID'] = 'BL_PostVig_S2'
-                
-                print(f"✓ Created unique per-vignette and post-vig blocks for S1 and S2")
-            
-            # Create new blocks for S3-S102
-            new_s_blocks = []
-            new_per_vig_blocks = []
-            new_post_vig_blocks = []
-            
-            for block_num in range(3, 103):
-                # Create Sn block (iframe)
-                new_s_block = json.loads(json.dumps(s1_block))  # Deep copy
-                new_s_block['Description'] = f'S{block_num}'
-                new_s_block['ID'] = f'BL_S{block_num}Generated'  # Unique block ID
-                
-                # Update the question ID in BlockElements
-                qid_for_block = f'QID{52 + block_num}'
-                new_s_block['BlockElements'] = [{"Type": "Question", "QuestionID": qid_for_block}]
-                
-                new_s_blocks.append(new_s_block)
-                
-                # Create unique per-vignette block for this scenario
-                if per_vig_block:
-                    new_per_vig = json.loads(json.dumps(per_vig_block))  # Deep copy
-                    new_per_vig['Description'] = f'per-vignette-S{block_num}'
-                    new_per_vig['ID'] = f'BL_PerVig_S{block_num}'
-                    # Keep all the same questions - just copy the BlockElements as-is
-                    new_per_vig_blocks.append(new_per_vig)
-                
-                # Create unique post-vig-reflect block for this scenario
-                if post_vig_block:
-                    new_post_vig = json.loads(json.dumps(post_vig_block))  # Deep copy
-                    new_post_vig['Description'] = f'post-vig-reflect-S{block_num}'
-                    new_post_vig['ID'] = f'BL_PostVig_S{block_num}'
-                    # Keep all the same questions - just copy the BlockElements as-is
-                    new_post_vig_blocks.append(new_post_vig)
-                
-                # Update the Flow references in the group to use these new blocks
-                for group in new_groups:
-                    if group['Description'] == f'S{block_num}':
-                        if 'Flow' in group and len(group['Flow']) >= 3:
-                            # Update block IDs for all three blocks in the group
-                            group['Flow'][0]['ID'] = new_s_block['ID']  # Sn block
-                            if per_vig_block:
-                                group['Flow'][1]['ID'] = f'BL_PerVig_S{block_num}'  # per-vignette
-                            if post_vig_block:
-                                group['Flow'][2]['ID'] = f'BL_PostVig_S{block_num}'  # post-vig-reflect
+        # Insert the randomizer where S1 was
+        flow_index.insert(item, teaching_s1_index, [teaching_randomizer])
+        
+        teaching_groups_added = True
+        print(f"✓ Created BlockRandomizer for Teaching branch with {scenario_count} groups (S1-S{scenario_count})")
+        print(f"✓ Teaching branch set to select 5 of {scenario_count} groups evenly")
+
+    # Now add the corresponding blocks for S3-S102
+    if not blocks:
+        print("Warning: Could not find blocks element")
+    elif s1_block:
+        # First, create unique per-vignette and post-vig blocks for S1 and S2
+        if per_vig_block and post_vig_block:
+            per_vig_s1 = _block(per_vig_block, 'per-vignette-S1', 'BL_PerVig_S1')
+            per_vig_s2 = _block(per_vig_block, 'per-vignette-S2', 'BL_PerVig_S2')
+            post_vig_s1 = _block(post_vig_block, 'post-vig-reflect-S1', 'BL_PostVig_S1')
+            post_vig_s2 = _block(post_vig_block, 'post-vig-reflect-S2', 'BL_PostVig_S2')
             
-            # Add new blocks to the blocks payload
-            blocks_payload.extend(new_s_blocks)
-            blocks_payload.extend(new_per_vig_blocks)
-            blocks_payload.extend(new_post_vig_blocks)
-            print(f"✓ Created {len(new_s_blocks)} new S blocks (S3-S102) with iframe questions")
-            print(f"✓ Created {len(new_per_vig_blocks)} new per-vignette blocks (unique for each scenario)")
-            print(f"✓ Created {len(new_post_vig_blocks)} new post-vig-reflect blocks (unique for each scenario)")
+            # Add these to blocks
+            batch.append_blocks([per_vig_s1, per_vig_s2, post_vig_s1, post_vig_s2])
             
-            # Now create Teaching branch blocks (T1-T102)
-            # Teaching branch doesn't have iframe blocks, only per-vignette and post-vig-reflect
-            teaching_per_vig_blocks = []
-            teaching_post_vig_blocks = []
+            # Update S1 and S2 groups to reference their unique blocks
+            for group in existing_groups:
+                if group['Description'] == 'S1' and 'Flow' in group and len(group['Flow']) >= 3:
+                    group['Flow'][1]['ID'] = 'BL_PerVig_S1'
+                    group['Flow'][2]['ID'] = 'BL_PostVig_S1'
+                elif group['Description'] == 'S2' and 'Flow' in group and len(group['Flow']) >= 3:
+                    group['Flow'][1]['ID'] = 'BL_PerVig_S2'
+                    group['Flow'][2]['ID'] = 'BL_PostVig_S2'
             
-            if per_vig_block and post_vig_block:
-                for block_num in range(1, 103):
-                    # Create unique per-vignette block for Teaching scenario
-                    new_teaching_per_vig = json.loads(json.dumps(per_vig_block))
-                    new_teaching_per_vig['Description'] = f'per-vignette-T{block_num}'
-                    new_teaching_per_vig['ID'] = f'BL_PerVig_T{block_num}'
-                    teaching_per_vig_blocks.append(new_teaching_per_vig)
-                    
-                    # Create unique post-vig-reflect block for Teaching scenario
-                    new_teaching_post_vig = json.loads(json.dumps(post_vig_block))
-                    new_teaching_post_vig['Description'] = f'post-vig-reflect-T{block_num}'
-                    new_teaching_post_vig['ID'] = f'BL_PostVig_T{block_num}'
-                    teaching_post_vig_blocks.append(new_teaching_post_vig)
-                
-                # Add Teaching branch blocks
-                blocks_payload.extend(teaching_per_vig_blocks)
-                blocks_payload.extend(teaching_post_vig_blocks)
-                print(f"✓ Created {len(teaching_per_vig_blocks)} Teaching per-vignette blocks (T1-T102)")
-                print(f"✓ Created {len(teaching_post_vig_blocks)} Teaching post-vig-reflect blocks (T1-T102)")
-    
-    # Write the modified QSF file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Successfully created {output_file}")
-    print(f"   - Added {len(new_questions)} iframe questions (pages 3-102)")
+            print(f"✓ Created unique per-vignette and post-vig blocks for S1 and S2")
+        
+        # Add new blocks to the blocks payload
+        batch.append_blocks(built['s_blocks'])
+        batch.append_blocks(built['per_vig_blocks'])
+        batch.append_blocks(built['post_vig_blocks'])
+        print(f"✓ Created {len(built['s_blocks'])} new S blocks (S3-S{scenario_count}) with iframe questions")
+        print(f"✓ Created {len(built['per_vig_blocks'])} new per-vignette blocks (unique for each scenario)")
+        print(f"✓ Created {len(built['post_vig_blocks'])} new post-vig-reflect blocks (unique for each scenario)")
+        
+        # Teaching branch doesn't have iframe blocks, only per-vignette and post-vig-reflect
+        if templates['teaching_blocks']:
+            batch.append_blocks(built['teaching_per_vig_blocks'])
+            batch.append_blocks(built['teaching_post_vig_blocks'])
+            print(f"✓ Created {len(built['teaching_per_vig_blocks'])} Teaching per-vignette blocks (T1-T{scenario_count})")
+            print(f"✓ Created {len(built['teaching_post_vig_blocks'])} Teaching post-vig-reflect blocks (T1-T{scenario_count})")
+    
+    # Apply the queued element and block edits, then write the modified QSF file
+    batch.apply()
+    qsf_instrument.phase('dump')
+    if output_file:
+        doc.save(output_file)
+        print(f"\n✅ Successfully created {output_file}")
+    print(f"   - Added {len(new_questions)} iframe questions (pages 3-{scenario_count})")
     print(f"   - Added {len(new_groups)} groups to Student branch BlockRandomizer")
-    print(f"   - Student BlockRandomizer: select 5 of 102 groups evenly")
+    print(f"   - Student BlockRandomizer: select 5 of {scenario_count} groups evenly")
     if teaching_groups_added:
-        print(f"   - Added 102 groups to Teaching branch BlockRandomizer")
-        print(f"   - Teaching BlockRandomizer: select 5 of 102 groups evenly")
+        print(f"   - Added {scenario_count} groups to Teaching branch BlockRandomizer")
+        print(f"   - Teaching BlockRandomizer: select 5 of {scenario_count} groups evenly")
     
     return True
 
@@ -12,52 +12,32 @@ When 5 are randomly selected, only those 5 scenario numbers will be set,
 and we can display them.
 """
 
-import json
 import sys
 
-def modify_qsf(input_file, output_file):
-    """Modify the QSF file for 102-scenario randomization."""
+from qsf_document import QSFDocument
+from qsf_ids import IDAllocator
+
+def modify_qsf(input_file, output_file, doc=None, scenario_count=102):
+    """Modify the QSF file for 102-scenario randomization.
+    Pass an already loaded doc (and output_file=None) to work in memory;
+    scenario_count replaces 102."""
     
     # Read the QSF file
-    print(f"Reading {input_file}...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if doc is None:
+        print(f"Reading {input_file}...")
+        doc = QSFDocument.load(input_file)
     
     # Find the Survey Flow element
-    flow_element = None
-    for element in data.get('SurveyElements', []):
-        if element.get('Element') == 'FL':
-            flow_element = element
-            break
+    flow_element = doc.flow_element
     
     if not flow_element:
         print("Error: Could not find Survey Flow element")
         return False
     
-    flow_payload = flow_element.get('Payload', {})
-    flow_items = flow_payload.get('Flow', [])
+    flow_index = doc.flow_index
     
     # Find the Student branch and its BlockRandomizer
-    student_branch = None
-    student_branch_index = None
-    
-    for i, item in enumerate(flow_items):
-        if item.get('Type') == 'Branch':
-            # Check if this is the Student branch
-            branch_logic = item.get('BranchLogic', {})
-            is_student = False
-            for key in branch_logic:
-                if isinstance(branch_logic[key], dict):
-                    for subkey in branch_logic[key]:
-                        if isinstance(branch_logic[key][subkey], dict):
-                            desc = branch_logic[key][subkey].get('Description', '')
-                            if 'Student' in desc:
-                                is_student = True
-                                break
-            if is_student:
-                student_branch = item
-                student_branch_index = i
-                break
+    student_branch = flow_index.branch('Student')
     
     if not student_branch:
         print("Error: Could not find Student branch")
@@ -66,15 +46,7 @@ def modify_qsf(input_file, output_file):
     print("✓ Found Student branch")
     
     # Find the BlockRandomizer within the Student branch
-    student_flow = student_branch.get('Flow', [])
-    randomizer = None
-    randomizer_index = None
-    
-    for i, item in enumerate(student_flow):
-        if item.get('Type') == 'BlockRandomizer':
-            randomizer = item
-            randomizer_index = i
-            break
+    randomizer = flow_index.child_of_type(student_branch, 'BlockRandomizer')
     
     if not randomizer:
         print("Error: Could not find BlockRandomizer in Student branch")
@@ -88,14 +60,15 @@ def modify_qsf(input_file, output_file):
     
     # Step 2: Generate 102 embedded data elements
     flow_elements = []
-    flow_id_start = 5000  # Use high numbers to avoid conflicts
+    ids = IDAllocator(doc)
+    scenario_flow_ids = ids.flow_ids(start=5001)
     
-    for i in range(1, 103):  # 1 to 102
+    for i in range(1, scenario_count + 1):  # 1 to 102 by default
         # Each embedded data element sets all 5 position variables to its scenario number
         # When randomizer selects 5 of these, those 5 scenario numbers will be set
         flow_element = {
             "Type": "EmbeddedData",
-            "FlowID": f"FL_{flow_id_start + i}",
+            "FlowID": next(scenario_flow_ids),
             "EmbeddedData": [
                 {
                     "Description": f"Pos{j}",
@@ -111,12 +84,11 @@ def modify_qsf(input_file, output_file):
         flow_elements.append(flow_element)
     
     # Replace the randomizer's Flow with our 102 elements
-    randomizer['Flow'] = flow_elements
-    print(f"✓ Generated 102 embedded data elements in BlockRandomizer")
+    flow_index.set_children(randomizer, flow_elements)
+    print(f"✓ Generated {scenario_count} embedded data elements in BlockRandomizer")
     
     # Step 3: Add a Web Service / Embedded Data block AFTER the randomizer
     # This will collect the non-empty Pos values
-    collector_flow_id = f"FL_{flow_id_start + 200}"
     
     # We don't actually need JavaScript for this approach!
     # The Pos1-Pos5 variables will already contain the selected scenario numbers
@@ -127,42 +99,39 @@ def modify_qsf(input_file, output_file):
     # So we'll skip adding more embedded data and just update the question
     
     # Step 4: Find and update QID371 question text
-    survey_elements = data.get('SurveyElements', [])
+    element = doc.question('QID371')
     question_updated = False
     
-    for element in survey_elements:
-        if element.get('Element') == 'SQ' and element.get('PrimaryAttribute') == 'QID371':
-            payload = element.get('Payload', {})
-            
-            # Update question text to use piped text
-            new_question_text = (
-                'You have been assigned the following scenario IDs: '
-                '${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, '
-                '${e://Field/Pos4}, ${e://Field/Pos5}'
-                '<br><br>'
-                'Please write down each scenario ID individually in the text boxes below. '
-                'You will be asked to complete tasks for each of these scenarios later in the survey.'
-            )
-            
-            payload['QuestionText'] = new_question_text
-            
-            # Also update the description
-            payload['QuestionDescription'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
-            element['SecondaryAttribute'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
-            
-            question_updated = True
-            print("✓ Updated QID371 question text to display selected scenarios")
-            break
+    if element is not None:
+        payload = element.get('Payload', {})
+        
+        # Update question text to use piped text
+        new_question_text = (
+            'You have been assigned the following scenario IDs: '
+            '${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, '
+            '${e://Field/Pos4}, ${e://Field/Pos5}'
+            '<br><br>'
+            'Please write down each scenario ID individually in the text boxes below. '
+            'You will be asked to complete tasks for each of these scenarios later in the survey.'
+        )
+        
+        payload['QuestionText'] = new_question_text
+        
+        # Also update the description
+        payload['QuestionDescription'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
+        element['SecondaryAttribute'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
+        
+        question_updated = True
+        print("✓ Updated QID371 question text to display selected scenarios")
     
     if not question_updated:
         print("Warning: Could not find QID371 to update question text")
     
     # Write the modified QSF file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Successfully created {output_file}")
-    print(f"   - BlockRandomizer will select 5 of 102 scenarios")
+    if output_file:
+        doc.save(output_file)
+        print(f"\n✅ Successfully created {output_file}")
+    print(f"   - BlockRandomizer will select 5 of {scenario_count} scenarios")
     print(f"   - Selected scenario IDs will be stored in Pos1-Pos5")
     print(f"   - Question displays: ${{e://Field/Pos1}}, ${{e://Field/Pos2}}, etc.")
     
@@ -9,54 +9,82 @@ Then after the randomizer, we use JavaScript to:
 1. Check which of the 102 fields were set
 2. Collect those 5 scenario numbers
 3. Store them in Pos1-Pos5 for display
+
+Run with --packed for the packed mode instead (see qsf_packed.py): a
+SubSet 1 randomizer over precomputed combinations sets one
+AssignedScenarios field that QID371 pipes directly, with no JavaScript.
+Add --balanced to pack qsf_design.py's pair-balanced combinations.
 """
 
-import json
 import sys
 
-def modify_qsf_correct(input_file, output_file):
-    """Modify the QSF file for 102-scenario randomization - CORRECT VERSION."""
+import qsf_instrument
+from qsf_design import design_rows
+from qsf_document import QSFDocument
+from qsf_ids import IDAllocator
+from qsf_packed import ASSIGNMENT_FIELD, packed_children
+
+ASSIGNED_TEXT = (
+    'You have been assigned the following scenario IDs: '
+    '${e://Field/' + ASSIGNMENT_FIELD + '}'
+)
+
+
+def install_packed_assignment(doc, randomizer, scenario_count=102, design='cyclic', seed=42):
+    """
+    Packed mode: make randomizer pick one of scenario_count combinations of
+    5 scenarios, each setting AssignedScenarios, and pipe that field into
+    QID371 in place of the collector JavaScript.
+    """
+    randomizer['SubSet'] = 1
+    rows = design_rows(scenario_count, 5, design, seed)
+    ids = IDAllocator(doc)
+    doc.flow_index.set_children(randomizer, packed_children(rows, ids.flow_ids(start=5001)))
+    # Qualtrics hands out FL_<Count + 1> next, so Count must cover the new IDs
+    properties = doc.flow.setdefault('Properties', {})
+    properties['Count'] = max(properties.get('Count') or 0, ids.highest(IDAllocator.FLOW_PREFIX))
+    print(f"✓ Generated {len(rows)} {design} combinations setting {ASSIGNMENT_FIELD} (SubSet 1)")
+
+    element = doc.question('QID371')
+    if element is None:
+        print("Warning: Could not find QID371 to update")
+        return
+    payload = element.setdefault('Payload', {})
+    payload['QuestionText'] = (
+        ASSIGNED_TEXT + '<br><br>'
+        'Please write down each scenario ID individually in the text boxes below. '
+        'You will be asked to complete tasks for each of these scenarios later in the survey.'
+    )
+    payload.pop('QuestionJS', None)
+    payload['QuestionDescription'] = ASSIGNED_TEXT + ' Please write do...'
+    element['SecondaryAttribute'] = ASSIGNED_TEXT + ' Please write do...'
+    print(f"✓ Updated QID371 to pipe ${{e://Field/{ASSIGNMENT_FIELD}}} (no JavaScript)")
+
+
+@qsf_instrument.transform('modify_qsf_correct')
+def modify_qsf_correct(input_file, output_file, doc=None, scenario_count=102,
+                       packed=False, design='cyclic', seed=42):
+    """Modify the QSF file for 102-scenario randomization - CORRECT VERSION.
+    Pass an already loaded doc (and output_file=None) to work in memory;
+    scenario_count replaces 102. packed=True uses the packed field mode."""
     
     # Read the QSF file
-    print(f"Reading {input_file}...")
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if doc is None:
+        print(f"Reading {input_file}...")
+        doc = QSFDocument.load(input_file)
+    qsf_instrument.phase('locate')
     
     # Find the Survey Flow element
-    flow_element = None
-    for element in data.get('SurveyElements', []):
-        if element.get('Element') == 'FL':
-            flow_element = element
-            break
+    flow_element = doc.flow_element
     
     if not flow_element:
         print("Error: Could not find Survey Flow element")
         return False
     
-    flow_payload = flow_element.get('Payload', {})
-    flow_items = flow_payload.get('Flow', [])
+    flow_index = doc.flow_index
     
     # Find the Student branch and its BlockRandomizer
-    student_branch = None
-    student_branch_index = None
-    
-    for i, item in enumerate(flow_items):
-        if item.get('Type') == 'Branch':
-            # Check if this is the Student branch
-            branch_logic = item.get('BranchLogic', {})
-            is_student = False
-            for key in branch_logic:
-                if isinstance(branch_logic[key], dict):
-                    for subkey in branch_logic[key]:
-                        if isinstance(branch_logic[key][subkey], dict):
-                            desc = branch_logic[key][subkey].get('Description', '')
-                            if 'Student' in desc:
-                                is_student = True
-                                break
-            if is_student:
-                student_branch = item
-                student_branch_index = i
-                break
+    student_branch = flow_index.branch('Student')
     
     if not student_branch:
         print("Error: Could not find Student branch")
@@ -65,15 +93,7 @@ def modify_qsf_correct(input_file, output_file):
     print("✓ Found Student branch")
     
     # Find the BlockRandomizer within the Student branch
-    student_flow = student_branch.get('Flow', [])
-    randomizer = None
-    randomizer_index = None
-    
-    for i, item in enumerate(student_flow):
-        if item.get('Type') == 'BlockRandomizer':
-            randomizer = item
-            randomizer_index = i
-            break
+    randomizer = flow_index.child_of_type(student_branch, 'BlockRandomizer')
     
     if not randomizer:
         print("Error: Could not find BlockRandomizer in Student branch")
@@ -81,6 +101,22 @@ def modify_qsf_correct(input_file, output_file):
     
     print(f"✓ Found BlockRandomizer (current SubSet: {randomizer.get('SubSet')})")
     
+    if packed:
+        qsf_instrument.phase('flow')
+        install_packed_assignment(doc, randomizer, scenario_count, design, seed)
+        qsf_instrument.count('flow_nodes', scenario_count)
+        qsf_instrument.phase('dump')
+        if output_file:
+            doc.save(output_file)
+            print(f"\n✅ Successfully created {output_file}")
+        print(f"\nHow it works:")
+        print(f"   1. BlockRandomizer picks 1 of {scenario_count} precomputed 5-scenario combinations")
+        print(f"   2. The combination sets {ASSIGNMENT_FIELD} (e.g. \"1, 21, 41, 61, 81\")")
+        print(f"   3. QID371 pipes {ASSIGNMENT_FIELD} directly; no JavaScript runs")
+        print(f"   4. Decode exported responses with: python qsf_packed.py <responses.csv> <decoded.csv>")
+        return True
+    
+    qsf_instrument.phase('clone')
     # Step 1: Change SubSet to 5
     randomizer['SubSet'] = 5
     print("✓ Changed SubSet to 5")
@@ -88,12 +124,13 @@ def modify_qsf_correct(input_file, output_file):
     # Step 2: Generate 102 embedded data elements
     # Each one sets its OWN unique field (Selected1, Selected2, etc.)
     flow_elements = []
-    flow_id_start = 5000
+    ids = IDAllocator(doc)
+    scenario_flow_ids = ids.flow_ids(start=5001)
     
-    for i in range(1, 103):  # 1 to 102
+    for i in range(1, scenario_count + 1):  # 1 to 102 by default
         flow_element = {
             "Type": "EmbeddedData",
-            "FlowID": f"FL_{flow_id_start + i}",
+            "FlowID": next(scenario_flow_ids),
             "EmbeddedData": [
                 {
                     "Description": f"Selected{i}",
@@ -108,20 +145,22 @@ def modify_qsf_correct(input_file, output_file):
         }
         flow_elements.append(flow_element)
     
+    qsf_instrument.count('flow_nodes', len(flow_elements))
+    qsf_instrument.phase('flow')
     # Replace the randomizer's Flow with our 102 elements
-    randomizer['Flow'] = flow_elements
-    print(f"✓ Generated 102 embedded data elements (Selected1-Selected102)")
+    flow_index.set_children(randomizer, flow_elements)
+    print(f"✓ Generated {scenario_count} embedded data elements (Selected1-Selected{scenario_count})")
     
     # Step 3: Add a JavaScript block AFTER the randomizer to collect results
     # This will check which Selected1-Selected102 fields are set
     # and populate Pos1-Pos5 with those values
     
     # First, add embedded data fields to initialize Pos1-Pos5
-    collector_flow_id = 6200
+    collector_flow_id = next(ids.flow_ids(start=6200))
     
     collector_embedded_data = {
         "Type": "EmbeddedData",
-        "FlowID": f"FL_{collector_flow_id}",
+        "FlowID": collector_flow_id,
         "EmbeddedData": [
             {
                 "Description": "Pos1",
@@ -172,31 +211,30 @@ def modify_qsf_correct(input_file, output_file):
     }
     
     # Insert this AFTER the randomizer in the student flow
-    student_flow.insert(randomizer_index + 1, collector_embedded_data)
+    flow_index.insert(student_branch, flow_index.position(randomizer) + 1, [collector_embedded_data])
     print("✓ Added Pos1-Pos5 embedded data fields after randomizer")
     
     # Step 4: Find QID371 and add JavaScript to it
-    survey_elements = data.get('SurveyElements', [])
+    element = doc.question('QID371')
     question_updated = False
     
-    for element in survey_elements:
-        if element.get('Element') == 'SQ' and element.get('PrimaryAttribute') == 'QID371':
-            payload = element.get('Payload', {})
-            
-            # Update question text to use piped text
-            new_question_text = (
-                'You have been assigned the following scenario IDs: '
-                '${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, '
-                '${e://Field/Pos4}, ${e://Field/Pos5}'
-                '<br><br>'
-                'Please write down each scenario ID individually in the text boxes below. '
-                'You will be asked to complete tasks for each of these scenarios later in the survey.'
-            )
-            
-            payload['QuestionText'] = new_question_text
-            
-            # Add JavaScript to collect the selected scenarios
-            javascript_code = """
+    if element is not None:
+        payload = element.get('Payload', {})
+        
+        # Update question text to use piped text
+        new_question_text = (
+            'You have been assigned the following scenario IDs: '
+            '${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, '
+            '${e://Field/Pos4}, ${e://Field/Pos5}'
+            '<br><br>'
+            'Please write down each scenario ID individually in the text boxes below. '
+            'You will be asked to complete tasks for each of these scenarios later in the survey.'
+        )
+        
+        payload['QuestionText'] = new_question_text
+        
+        # Add JavaScript to collect the selected scenarios
+        javascript_code = """
 Qualtrics.SurveyEngine.addOnload(function() {
     // Find which Selected1-Selected102 fields were set by checking their values
     var selected = [];
@@ -225,28 +263,27 @@ Qualtrics.SurveyEngine.addOnload(function() {
     }, 100);
 });
 """
-            
-            payload['QuestionJS'] = javascript_code
-            
-            # Also update the description
-            payload['QuestionDescription'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
-            element['SecondaryAttribute'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
-            
-            question_updated = True
-            print("✓ Updated QID371 with JavaScript to collect selected scenarios")
-            break
+        
+        payload['QuestionJS'] = javascript_code.replace('i <= 102;', f'i <= {scenario_count};')
+        
+        # Also update the description
+        payload['QuestionDescription'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
+        element['SecondaryAttribute'] = 'You have been assigned the following scenario IDs: ${e://Field/Pos1}, ${e://Field/Pos2}, ${e://Field/Pos3}, ${e://Field/Pos4}, ${e://Field/Pos5} Please write do...'
+        
+        question_updated = True
+        print("✓ Updated QID371 with JavaScript to collect selected scenarios")
     
     if not question_updated:
         print("Warning: Could not find QID371 to update")
     
+    qsf_instrument.phase('dump')
     # Write the modified QSF file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Successfully created {output_file}")
+    if output_file:
+        doc.save(output_file)
+        print(f"\n✅ Successfully created {output_file}")
     print(f"\nHow it works:")
-    print(f"   1. BlockRandomizer selects 5 of 102 embedded data elements")
-    print(f"   2. Each selected element sets Selected1-Selected102 to its scenario number")
+    print(f"   1. BlockRandomizer selects 5 of {scenario_count} embedded data elements")
+    print(f"   2. Each selected element sets Selected1-Selected{scenario_count} to its scenario number")
     print(f"   3. JavaScript on QID371 checks which Selected# fields are set")
     print(f"   4. JavaScript populates Pos1-Pos5 with the 5 selected scenario numbers")
     print(f"   5. Question displays the 5 randomly selected scenario IDs")
@@ -256,14 +293,17 @@ Qualtrics.SurveyEngine.addOnload(function() {
 
 if __name__ == '__main__':
     input_file = 'ai-attribution-in-cs-ed-master (7).qsf'
-    output_file = 'ai-attribution-in-cs-ed-master-102random-fixed.qsf'
+    packed = '--packed' in sys.argv
+    output_file = ('ai-attribution-in-cs-ed-master-102random-packed.qsf' if packed
+                   else 'ai-attribution-in-cs-ed-master-102random-fixed.qsf')
     
     print("=" * 60)
     print("Modifying QSF for 102-scenario randomization (CORRECT)")
     print("=" * 60)
     print()
     
-    success = modify_qsf_correct(input_file, output_file)
+    success = modify_qsf_correct(input_file, output_file, packed=packed,
+                                 design='balanced' if '--balanced' in sys.argv else 'cyclic')
     
     if success:
         print("\n🎉 Done! Import the new QSF file into Qualtrics.")
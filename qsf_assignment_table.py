@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Assign scenarios offline with an import table instead of an in-survey randomizer.
+
+restructure_survey.py, simplify_survey.py and create_clean_survey.py put
+a BlockRandomizer with 102 children (EmbeddedData or Group combos) into the
+flow, and the flow grows with the number of scenarios. For large panels it
+is simpler to decide every participant's scenarios up front:
+
+- write_table() streams a contact-list / embedded-data import CSV with one
+  row per participant and scenario1..scenarioN (or Pos1..PosN) columns. It
+  cycles through a design from qsf_design.py, shuffling each cycle, so
+  every complete cycle shows each scenario equally often. A million rows
+  are written without building them in memory.
+- table_variant() removes the assignment randomizers from a QSF and leaves
+  only an EmbeddedData node declaring the same fields (empty Value, so they
+  are read from the contact list or URL), so the flow stays the same size
+  whatever the number of scenarios.
+
+Usage:
+    python qsf_assignment_table.py table <assignments.csv> --participants N
+        [--contacts contacts.csv] [--fields scenario|Pos] [--design cyclic|balanced]
+    python qsf_assignment_table.py survey <input.qsf> <output.qsf> [--fields scenario|Pos]
+"""
+
+import argparse
+import csv
+import random
+import sys
+
+from qsf_design import DESIGNS, design_rows
+from qsf_document import QSFDocument
+from qsf_ids import IDAllocator
+
+FIELD_PREFIXES = ('scenario', 'Pos')
+ID_COLUMN = 'ExternalDataReference'
+
+
+def field_names(prefix='scenario', n=5):
+    return [f'{prefix}{k}' for k in range(1, n + 1)]
+
+
+def assignments(count=None, m=102, n=5, design='cyclic', seed=42):
+    """
+    Yield count scenario lists (endlessly if count is None). Each cycle of
+    len(design rows) participants uses every row once, in a seeded random
+    order.
+    """
+    rows = design_rows(m, n, design, seed)
+    rng = random.Random(seed)
+    order = list(range(len(rows)))
+    produced = 0
+    while count is None or produced < count:
+        rng.shuffle(order)
+        take = order if count is None else order[:count - produced]
+        for i in take:
+            yield rows[i]
+        produced += len(take)
+
+
+def write_table(output_file, participants=None, contacts_file=None, m=102, n=5,
+                design='cyclic', seed=42, prefix='scenario'):
+    """
+    Stream an import CSV to output_file and return the number of rows.
+
+    With contacts_file, its rows are copied through with the assignment
+    columns appended; otherwise participants rows are written with
+    generated ExternalDataReference IDs (P0000001, ...).
+    """
+    fields = field_names(prefix, n)
+    with open(output_file, 'w', encoding='utf-8', newline='') as out:
+        writer = csv.writer(out)
+        if contacts_file:
+            with open(contacts_file, 'r', encoding='utf-8-sig', newline='') as f:
+                reader = csv.reader(f)
+                header = next(reader)
+                clashes = [name for name in fields if name in header]
+                if clashes:
+                    raise ValueError(f"{contacts_file} already has {', '.join(clashes)} columns")
+                writer.writerow(header + fields)
+                written = 0
+                # The contact count is unknown up front, so draw as rows arrive
+                assigned = assignments(None, m, n, design, seed)
+                for row, scenarios in zip(reader, assigned):
+                    writer.writerow(row + scenarios)
+                    written += 1
+                return written
+
+        if participants is None:
+            raise ValueError("Give a participant count or a contacts file")
+        writer.writerow([ID_COLUMN] + fields)
+        width = len(str(participants))
+        writer.writerows([f'P{i:0{width}d}'] + scenarios
+                         for i, scenarios in enumerate(assignments(participants, m, n, design, seed), start=1))
+        return participants
+
+
+def _assignment_only(node, fields):
+    """True if node's subtree only sets fields (no blocks or other data)."""
+    stack = list(node.get('Flow') or [])
+    seen_data = False
+    while stack:
+        current = stack.pop()
+        node_type = current.get('Type')
+        if node_type == 'EmbeddedData':
+            if any(item.get('Field') not in fields for item in current.get('EmbeddedData') or []):
+                return False
+            seen_data = True
+        elif node_type not in ('Group', 'BlockRandomizer'):
+            return False
+        stack.extend(current.get('Flow') or [])
+    return seen_data
+
+
+def _declaration(flow_id, fields):
+    return {
+        "Type": "EmbeddedData",
+        "FlowID": flow_id,
+        "EmbeddedData": [
+            {"Description": field, "Type": "Custom", "Field": field,
+             "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": ""}
+            for field in fields
+        ]
+    }
+
+
+def _declares(node, fields):
+    if node.get('Type') != 'EmbeddedData':
+        return False
+    declared = {item.get('Field') for item in node.get('EmbeddedData') or [] if not item.get('Value')}
+    return set(fields) <= declared
+
+
+def table_variant(doc, prefix='scenario', n=5):
+    """
+    Remove every BlockRandomizer that only assigns the table's fields and
+    make sure they are declared in its place. Returns the number removed.
+    """
+    fields = set(field_names(prefix, n))
+    flow_index = doc.flow_index
+    randomizers = [r for r in flow_index.nodes_of_type('BlockRandomizer')
+                   if _assignment_only(r, fields)]
+    # Pre-order, so outer randomizers go first and take nested ones with them
+    removed = 0
+    ids = IDAllocator(doc)
+    for randomizer in randomizers:
+        parent = flow_index.parent(randomizer)
+        if parent is None:
+            continue
+        position = flow_index.position(randomizer)
+        siblings = parent.get('Flow') or []
+        if any(_declares(sibling, fields) for sibling in siblings[:position]):
+            flow_index.remove(randomizer)
+        else:
+            flow_index.replace(randomizer, _declaration(ids.flow_id(), field_names(prefix, n)))
+        removed += 1
+
+    properties = doc.flow.setdefault('Properties', {})
+    properties['Count'] = max(properties.get('Count') or 0, ids.highest(IDAllocator.FLOW_PREFIX))
+    return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline scenario assignment tables and matching surveys.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    table = commands.add_parser('table', help="write an assignment import CSV")
+    table.add_argument('output_file')
+    table.add_argument('--participants', type=int, default=None)
+    table.add_argument('--contacts', default=None, help="contact list CSV to append assignments to")
+    table.add_argument('--scenarios', type=int, default=102, metavar='M')
+    table.add_argument('--per-respondent', type=int, default=5, metavar='N')
+    table.add_argument('--design', choices=DESIGNS, default='cyclic')
+    table.add_argument('--seed', type=int, default=42)
+    table.add_argument('--fields', choices=FIELD_PREFIXES, default='scenario')
+
+    survey = commands.add_parser('survey', help="drop the assignment randomizer from a QSF")
+    survey.add_argument('input_file')
+    survey.add_argument('output_file')
+    survey.add_argument('--per-respondent', type=int, default=5, metavar='N')
+    survey.add_argument('--fields', choices=FIELD_PREFIXES, default='scenario')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'table':
+            rows = write_table(args.output_file, args.participants, args.contacts, args.scenarios,
+                               args.per_respondent, args.design, args.seed, args.fields)
+            print(f"✅ Wrote {rows:,} assignments to {args.output_file}")
+            print(f"   - Columns: {', '.join(field_names(args.fields, args.per_respondent))}")
+            print(f"   - {args.design} design, {args.per_respondent} of {args.scenarios} scenarios")
+            return 0
+
+        print(f"Loading {args.input_file}...")
+        doc = QSFDocument.load(args.input_file)
+        removed = table_variant(doc, args.fields, args.per_respondent)
+        if not removed:
+            print(f"❌ No BlockRandomizer only assigns {args.fields}1..{args.fields}{args.per_respondent}")
+            return 1
+        doc.save(args.output_file)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    print(f"✓ Removed {removed} assignment randomizer(s)")
+    print(f"\n✅ Successfully created {args.output_file}")
+    print(f"   - {args.fields}1..{args.fields}{args.per_respondent} now come from the contact list or URL")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
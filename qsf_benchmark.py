@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Scaling benchmark for the QSF transforms.
+
+synthesize() builds a survey with the same shape as the real exports
+(Student/Teaching Branches on Role, a Student BlockRandomizer of S-groups
+[S<n>, per-vignette, post-vig-reflect], the 14-question per-vignette block,
+per-vignette-S1..S5 blocks and the template questions the scripts look
+for) at any scenario count. Each transform is then run at every scale with
+parse, transform and serialise timed separately and peak memory recorded
+per phase, and the results are written to a JSON file.
+
+Usage:
+    python qsf_benchmark.py                      # 102, 1000, 10000 scenarios
+    python qsf_benchmark.py --scales 102 1000 --only generate_groups simplify
+    python qsf_benchmark.py --output bench.json --compare previous.json
+    python qsf_benchmark.py --metrics metrics.jsonl   # per-phase breakdown
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import qsf_instrument
+import qsf_json
+import restructure_survey
+import simplify_survey
+from fix_s1_s5_qids import fix_qids_for_s1_to_s5
+from generate_102_groups import generate_groups
+from modify_for_102_randomization import modify_qsf
+from modify_for_102_randomization_fixed import modify_qsf_correct
+from qsf_document import QSFDocument
+from qsf_ids import IDAllocator
+from qsf_validate import validate
+
+DEFAULT_SCALES = (102, 1000, 10000)
+
+SURVEY_ID = 'SV_benchmark'
+
+# The 14 per-vignette questions fix_s1_s5_qids.py expects
+PER_VIG_QIDS = ['QID31', 'QID32', 'QID33', 'QID34', 'QID35', 'QID36', 'QID38',
+                'QID39', 'QID40', 'QID41', 'QID42', 'QID47', 'QID48', 'QID159']
+POST_VIG_QIDS = ['QID60', 'QID61', 'QID62']
+
+
+def _question(qid, text, export_tag):
+    return {
+        "SurveyID": SURVEY_ID,
+        "Element": "SQ",
+        "PrimaryAttribute": qid,
+        "SecondaryAttribute": text[:100],
+        "TertiaryAttribute": None,
+        "Payload": {
+            "QuestionText": text,
+            "DataExportTag": export_tag,
+            "QuestionType": "MC",
+            "Selector": "SAVR",
+            "SubSelector": "TX",
+            "Configuration": {"QuestionDescriptionOption": "UseText"},
+            "QuestionDescription": text[:100],
+            "Choices": {str(c): {"Display": f"Option {c}"} for c in range(1, 6)},
+            "ChoiceOrder": [str(c) for c in range(1, 6)],
+            "Validation": {"Settings": {"ForceResponse": "OFF", "Type": "None"}},
+            "Language": [],
+            "DataVisibility": {"Private": False, "Hidden": False},
+            "QuestionID": qid
+        }
+    }
+
+
+def _iframe_question(qid, page):
+    question = _question(qid, '', 'slide')
+    question['Payload'].update({
+        "QuestionText": f'<iframe src="https://hivelabuoft.github.io/ai-attribution-in-cs/pages/{page}" \n        width="100%" \n        height="1000px" \n        frameborder="0"\n        scrolling="auto">\n</iframe>',
+        "QuestionType": "DB",
+        "Selector": "TB",
+    })
+    for key in ("SubSelector", "Choices", "ChoiceOrder"):
+        del question['Payload'][key]
+    return question
+
+
+def _block(block_id, description, qids, block_type='Standard'):
+    return {
+        "Type": block_type,
+        "Description": description,
+        "ID": block_id,
+        "BlockElements": [{"Type": "Question", "QuestionID": qid} for qid in qids],
+        "Options": {"BlockLocking": "false", "RandomizeQuestions": "false", "BlockVisibility": "Expanded"}
+    }
+
+
+def _role_branch(flow_id, role, flow):
+    return {
+        "Type": "Branch",
+        "FlowID": flow_id,
+        "Description": "New Branch",
+        "BranchLogic": {
+            "0": {
+                "0": {
+                    "LogicType": "EmbeddedField",
+                    "LeftOperand": "Role",
+                    "Operator": "EqualTo",
+                    "RightOperand": role,
+                    "_HiddenExpression": False,
+                    "Type": "Expression",
+                    "Description": f'<span class="ConjDesc">If</span> <span class="LeftOpDesc">Role</span> <span class="OpDesc">Is Equal to</span> <span class="RightOpDesc"> {role} </span> '
+                },
+                "Type": "If"
+            },
+            "Type": "BooleanExpression"
+        },
+        "Flow": flow
+    }
+
+
+def synthesize(scenarios, groups=None):
+    """
+    Return QSF data shaped like the repo's exports with `groups` S-groups
+    (default: one per scenario) in the Student randomizer.
+    generate_groups() wants the two-group shape of the (1) export, so it is
+    benchmarked on synthesize(m, groups=2).
+    """
+    groups = scenarios if groups is None else groups
+    flow_ids = IDAllocator().flow_ids(start=1)
+    questions = [_iframe_question('QID53', 1), _iframe_question('QID54', 2)]
+    questions.append(_question('QID371', 'You have been assigned the following scenario IDs:', 'assigned'))
+    questions += [_question(qid, f'Per-vignette question {qid}', f'pv_{qid}') for qid in PER_VIG_QIDS]
+    questions += [_question(qid, f'Reflection question {qid}', f'post_{qid}') for qid in POST_VIG_QIDS]
+
+    blocks = [_block('BL_default', 'Default Question Block', ['QID371'], 'Default'),
+              _block('BL_trash', 'Trash / Unused Questions', [], 'Trash'),
+              _block('BL_8xeykGPs5f8ULQy', 'per-vignette', PER_VIG_QIDS),
+              _block('BL_postvig', 'post-vig-reflect', POST_VIG_QIDS)]
+    for k in range(1, 6):
+        blocks.append(_block(f'BL_PerVigFix_S{k}', f'per-vignette-S{k}', PER_VIG_QIDS))
+
+    student_groups = []
+    next_qid = 1000
+    for s in range(1, groups + 1):
+        if s <= 2:
+            qid = f'QID{52 + s}'
+        else:
+            qid = f'QID{next_qid}'
+            next_qid += 1
+            questions.append(_iframe_question(qid, s))
+        block_id = f'BL_S{s}' if s <= 2 else f'BL_S{s}Generated'
+        blocks.append(_block(block_id, f'S{s}', [qid]))
+        student_groups.append({
+            "Type": "Group", "FlowID": next(flow_ids), "Description": f"S{s}",
+            "Flow": [{"Type": "Standard", "ID": block_id, "FlowID": next(flow_ids), "Autofill": []},
+                     {"Type": "Standard", "ID": "BL_8xeykGPs5f8ULQy", "FlowID": next(flow_ids), "Autofill": []},
+                     {"Type": "Standard", "ID": "BL_postvig", "FlowID": next(flow_ids), "Autofill": []}]
+        })
+
+    student = _role_branch(next(flow_ids), 'Student', [
+        {"Type": "Block", "ID": "BL_default", "FlowID": next(flow_ids), "Autofill": []},
+        {"Type": "BlockRandomizer", "FlowID": next(flow_ids), "SubSet": "1", "EvenPresentation": True,
+         "Flow": student_groups},
+    ])
+    teaching = _role_branch(next(flow_ids), 'Teaching', [
+        {"Type": "Group", "FlowID": next(flow_ids), "Description": "S1",
+         "Flow": [{"Type": "Standard", "ID": "BL_8xeykGPs5f8ULQy", "FlowID": next(flow_ids), "Autofill": []},
+                  {"Type": "Standard", "ID": "BL_postvig", "FlowID": next(flow_ids), "Autofill": []}]}
+    ])
+    embedded = {"Type": "EmbeddedData", "FlowID": next(flow_ids), "EmbeddedData": [
+        {"Description": "Role", "Type": "Recipient", "Field": "Role", "VariableType": "String",
+         "DataVisibility": [], "AnalyzeText": False}]}
+    flow = [embedded, student, teaching]
+    count = next(flow_ids)
+
+    elements = [
+        {"SurveyID": SURVEY_ID, "Element": "FL", "PrimaryAttribute": "Survey Flow",
+         "SecondaryAttribute": None, "TertiaryAttribute": None,
+         "Payload": {"Flow": flow, "Properties": {"Count": int(count[3:])}, "FlowID": "FL_1", "Type": "Root"}},
+        {"SurveyID": SURVEY_ID, "Element": "BL", "PrimaryAttribute": "Survey Blocks",
+         "SecondaryAttribute": None, "TertiaryAttribute": None, "Payload": blocks},
+    ]
+    return {
+        "SurveyEntry": {"SurveyID": SURVEY_ID, "SurveyName": f"benchmark-{scenarios}",
+                        "SurveyLanguage": "EN", "SurveyStatus": "Inactive"},
+        "SurveyElements": elements + questions,
+    }
+
+
+def _walk_flow(doc, scenarios):
+    # Builds the FlowIndex from scratch (the flow-walker every script uses)
+    doc.invalidate_flow_index()
+    return doc.flow_index is not None
+
+
+# name -> (groups in the synthetic input, callable(doc, scenarios) -> truthy)
+BENCHMARKS = {
+    'generate_groups': (2, lambda doc, m: generate_groups(None, None, doc=doc, scenario_count=m)),
+    'modify_qsf': (None, lambda doc, m: modify_qsf(None, None, doc=doc, scenario_count=m)),
+    'modify_qsf_correct': (None, lambda doc, m: modify_qsf_correct(None, None, doc=doc, scenario_count=m)),
+    'fix_qids_for_s1_to_s5': (None, lambda doc, m: fix_qids_for_s1_to_s5(None, doc=doc)),
+    'restructure': (None, lambda doc, m: restructure_survey.main(output_file=None, doc=doc, scenario_count=m)),
+    'simplify': (None, lambda doc, m: simplify_survey.main(output_file=None, doc=doc, scenario_count=m)),
+    'flow_index': (None, _walk_flow),
+    'id_allocator': (None, lambda doc, m: IDAllocator(doc)),
+    'validate': (None, lambda doc, m: validate(doc) is not None),
+}
+
+
+def _measure(fn, trace_memory):
+    """Run fn once; return (seconds, peak bytes or None, result)."""
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak, result
+
+
+def run_case(name, scenarios, repeat=1, trace_memory=True, profile='human', metrics=None):
+    """
+    Benchmark one transform at one scale; returns a result dict. With
+    metrics, one more run appends its per-phase lines to that file.
+    """
+    groups, transform = BENCHMARKS[name]
+    source = qsf_json.dumps(synthesize(scenarios, groups), 'human')
+    timings = {'parse': [], 'transform': [], 'serialise': []}
+    peaks = {}
+
+    # Untraced runs for timing, then one traced run for peak memory
+    runs = [False] * repeat + ([True] if trace_memory else [])
+    output = b''
+    for traced in runs:
+        silent = io.StringIO()
+        with contextlib.redirect_stdout(silent):
+            seconds, peak_parse, doc = _measure(lambda: QSFDocument(json.loads(source)), traced)
+            parse = (seconds, peak_parse)
+            seconds, peak_transform, ok = _measure(lambda: transform(doc, scenarios), traced)
+            transform_result = (seconds, peak_transform)
+            seconds, peak_serialise, output = _measure(lambda: doc.dumps(profile=profile), traced)
+            serialise = (seconds, peak_serialise)
+        if not ok:
+            raise RuntimeError(f"{name} failed at {scenarios} scenarios:\n{silent.getvalue()}")
+        if traced:
+            peaks = {'parse': parse[1], 'transform': transform_result[1], 'serialise': serialise[1]}
+        else:
+            timings['parse'].append(parse[0])
+            timings['transform'].append(transform_result[0])
+            timings['serialise'].append(serialise[0])
+
+    if metrics:
+        # A separate run, so the phase memory tracing does not skew the timings above
+        doc = QSFDocument(json.loads(source))
+        qsf_instrument.enable(metrics)
+        qsf_instrument.tag(benchmark=name, scenarios=scenarios)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                transform(doc, scenarios)
+        finally:
+            qsf_instrument.tag(benchmark=None, scenarios=None)
+            qsf_instrument.disable()
+
+    result = {
+        'transform': name,
+        'scenarios': scenarios,
+        'input_bytes': len(source),
+        'output_bytes': len(output),
+        'input_elements': len(json.loads(source)['SurveyElements']),
+    }
+    for phase, values in timings.items():
+        result[f'{phase}_seconds'] = round(min(values), 6)
+    for phase, peak in peaks.items():
+        result[f'{phase}_peak_bytes'] = peak
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales=DEFAULT_SCALES, names=None, repeat=1, trace_memory=True, profile='human',
+                   metrics=None):
+    """Run every selected benchmark at every scale, printing one line per case."""
+    names = names or list(BENCHMARKS)
+    results = []
+    for scenarios in scales:
+        for name in names:
+            result = run_case(name, scenarios, repeat, trace_memory, profile, metrics)
+            results.append(result)
+            peak = max((result.get(f'{p}_peak_bytes') or 0) for p in ('parse', 'transform', 'serialise'))
+            print(f"  {name:<22} {scenarios:>6}  parse {result['parse_seconds']:8.3f}s  "
+                  f"transform {result['transform_seconds']:8.3f}s  serialise {result['serialise_seconds']:8.3f}s  "
+                  f"peak {peak / 1e6:8.1f} MB  out {result['output_bytes'] / 1e6:8.1f} MB")
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'json_backend': qsf_json.default_backend(),
+            'profile': profile,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(current, previous):
+    """Print per-phase time ratios (current / previous) for matching cases."""
+    before = {(r['transform'], r['scenarios']): r for r in previous['results']}
+    print(f"\nCompared with {previous['meta'].get('commit') or 'previous run'} "
+          f"({previous['meta'].get('timestamp')}):")
+    matched = [r for r in current['results'] if (r['transform'], r['scenarios']) in before]
+    if not matched:
+        print("  no benchmark/scale pairs in common")
+    for result in matched:
+        old = before[(result['transform'], result['scenarios'])]
+        ratios = []
+        for phase in ('parse', 'transform', 'serialise'):
+            new_time, old_time = result[f'{phase}_seconds'], old[f'{phase}_seconds']
+            ratios.append(f"{phase} {new_time / old_time:5.2f}x" if old_time else f"{phase}   n/a")
+        print(f"  {result['transform']:<22} {result['scenarios']:>6}  " + "  ".join(ratios))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the QSF transforms on synthetic surveys.")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(DEFAULT_SCALES))
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per case (fastest is kept)")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc run")
+    parser.add_argument('--profile', choices=sorted(qsf_json.PROFILES), default='human')
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--compare', metavar='PREVIOUS_JSON')
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="also append per-phase transform metrics (qsf_instrument.py) here")
+    args = parser.parse_args(argv)
+
+    print(f"Benchmarking {', '.join(args.only or BENCHMARKS)} at {', '.join(map(str, args.scales))} scenarios...\n")
+    report = run_benchmarks(args.scales, args.only, args.repeat, not args.no_memory, args.profile,
+                            args.metrics)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Content-hash build cache for pipeline steps.
+
+Each step's output document is stored under a key made of:
+
+- the SHA-256 of the step's input (the source file for the first step,
+  the previous step's stored output after that)
+- the step name and its parameters (the source of its TRANSFORMS entry)
+- a hash of the transform's source: the module it calls and every repo
+  module that one imports, transitively
+
+The output digest is recorded with each entry, so the key of every step
+can be worked out from the cache alone. run_pipeline() walks the chain,
+skips every step up to the last one whose key is cached, parses only that
+step's output and runs the rest. Changing a script, its parameters or the
+input invalidates that step and everything after it.
+
+Entries are <key>.qsf (compact JSON) plus <key>.json (metadata) in the
+cache directory; a hit touches the .qsf so prune() drops the least
+recently used entries first.
+
+Usage:
+    python qsf_cache.py inspect [--cache-dir .qsf_cache]
+    python qsf_cache.py prune --max-size 200M [--cache-dir .qsf_cache]
+    python qsf_cache.py clear [--cache-dir .qsf_cache]
+"""
+
+import argparse
+import ast
+import dis
+import hashlib
+import inspect
+import json
+import os
+import sys
+import time
+import types
+
+from qsf_document import QSFDocument
+
+DEFAULT_CACHE_DIR = '.qsf_cache'
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _local_module_path(name):
+    path = os.path.join(_REPO_DIR, name.split('.')[0] + '.py')
+    return path if os.path.exists(path) else None
+
+
+def _module_paths(fn):
+    """Repo modules fn refers to by name (a lambda's callee, or its own module)."""
+    paths = set()
+    codes = [fn.__code__]
+    while codes:
+        code = codes.pop()
+        codes.extend(const for const in code.co_consts if isinstance(const, types.CodeType))
+        names = {ins.argval for ins in dis.get_instructions(code) if ins.opname == 'LOAD_GLOBAL'}
+        for name in names:
+            target = fn.__globals__.get(name)
+            if isinstance(target, types.ModuleType):
+                path = getattr(target, '__file__', None)
+            elif callable(target):
+                path = _local_module_path(getattr(target, '__module__', '') or '')
+            else:
+                continue
+            if path and os.path.dirname(os.path.abspath(path)) == _REPO_DIR:
+                paths.add(os.path.abspath(path))
+    return paths
+
+
+def _imports(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            yield from (alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            yield node.module
+
+
+def source_hash(fn):
+    """SHA-256 over the transform's module and the repo modules it imports."""
+    pending = list(_module_paths(fn))
+    seen = set()
+    while pending:
+        path = pending.pop()
+        if path in seen:
+            continue
+        seen.add(path)
+        for name in _imports(path):
+            imported = _local_module_path(name)
+            if imported:
+                pending.append(imported)
+    digest = hashlib.sha256()
+    for path in sorted(seen):
+        digest.update(os.path.basename(path).encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def step_params(fn):
+    """A transform's parameters: the source of the callable itself."""
+    try:
+        return inspect.getsource(fn).strip()
+    except (OSError, TypeError):
+        return repr(fn)
+
+
+def step_key(input_sha256, step, params, source_sha256):
+    material = json.dumps([input_sha256, step, params, source_sha256])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class BuildCache:
+    """Step outputs stored by content key in a directory."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        self._source_hashes = {}
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def key(self, input_sha256, step, fn):
+        if fn not in self._source_hashes:
+            self._source_hashes[fn] = source_hash(fn)
+        return step_key(input_sha256, step, step_params(fn), self._source_hashes[fn])
+
+    def lookup(self, key):
+        """The entry's metadata, or None if it is missing or incomplete."""
+        try:
+            with open(self._path(key, '.json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._path(key, '.qsf')):
+            return None
+        return meta
+
+    def load(self, key):
+        """Parse a cached output and mark the entry as used."""
+        path = self._path(key, '.qsf')
+        os.utime(path)
+        return QSFDocument.load(path)
+
+    def store(self, key, doc, step, input_sha256):
+        """Save doc as the output for key; return the output's SHA-256."""
+        os.makedirs(self.directory, exist_ok=True)
+        raw = doc.dumps(profile='compact')
+        output_sha256 = hashlib.sha256(raw).hexdigest()
+        meta = {
+            'step': step,
+            'input_sha256': input_sha256,
+            'output_sha256': output_sha256,
+            'size': len(raw),
+            'created': time.time(),
+        }
+        # Output first, so an entry is never indexed without its document
+        with open(self._path(key, '.qsf'), 'wb') as f:
+            f.write(raw)
+        with open(self._path(key, '.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return output_sha256
+
+    def entries(self):
+        """[(key, metadata, last used)] for every complete entry, oldest use first."""
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            key = name[:-len('.json')]
+            meta = self.lookup(key)
+            if meta is not None:
+                result.append((key, meta, os.path.getmtime(self._path(key, '.qsf'))))
+        result.sort(key=lambda entry: entry[2])
+        return result
+
+    def total_size(self):
+        return sum(meta['size'] for _, meta, _ in self.entries())
+
+    def remove(self, key):
+        for suffix in ('.json', '.qsf'):
+            try:
+                os.remove(self._path(key, suffix))
+            except FileNotFoundError:
+                pass
+
+    def prune(self, max_size):
+        """Drop least recently used entries until the cache fits max_size bytes."""
+        entries = self.entries()
+        total = sum(meta['size'] for _, meta, _ in entries)
+        removed = []
+        for key, meta, _ in entries:
+            if total <= max_size:
+                break
+            self.remove(key)
+            total -= meta['size']
+            removed.append(key)
+        return removed, total
+
+
+def parse_size(value):
+    """'200M' -> bytes (K, M and G suffixes, powers of 1024)."""
+    text = value.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ''
+    number = text[:-1] if unit else text
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size '{value}'") from None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect and prune the pipeline build cache.")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('inspect', help="list cached step outputs, least recently used first")
+    prune = commands.add_parser('prune', help="drop least recently used entries")
+    prune.add_argument('--max-size', type=parse_size, required=True, help="e.g. 500K, 200M, 1G")
+    commands.add_parser('clear', help="remove every entry")
+    args = parser.parse_args(argv)
+
+    cache = BuildCache(args.cache_dir)
+    if args.command == 'inspect':
+        entries = cache.entries()
+        if not entries:
+            print(f"📋 {args.cache_dir} is empty")
+            return 0
+        print(f"📋 {len(entries)} cached step output(s) in {args.cache_dir}")
+        now = time.time()
+        for key, meta, used in entries:
+            print(f"   {key[:12]}  {meta['step']:<32} {meta['size']:>12,} bytes  "
+                  f"input {meta['input_sha256'][:12]}  used {(now - used) / 3600:.1f}h ago")
+        print(f"   Total: {sum(meta['size'] for _, meta, _ in entries):,} bytes")
+        return 0
+
+    removed, total = cache.prune(0 if args.command == 'clear' else args.max_size)
+    print(f"✓ Removed {len(removed)} entr{'y' if len(removed) == 1 else 'ies'}; "
+          f"{total:,} bytes remain in {args.cache_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Copy-on-write cloning for QSF blocks, questions and flow items.
+
+The transform scripts used to copy a template with
+json.loads(json.dumps(x)) or copy.deepcopy(x) before overriding a couple of
+fields (ID, Description, QuestionID, FlowID, QuestionText). clone() instead
+returns a CowDict that stores only the overridden fields and reads every
+other field through to the template. Nested dicts/lists are wrapped the
+first time they are accessed, so writing to clone['Flow'][0]['FlowID'] never
+touches the template either.
+
+Clones stay lazy until the document is written out: materialize() turns a
+tree containing clones into plain dicts/lists for the JSON encoder.
+
+The template must not be modified after it has been cloned, otherwise the
+change shows through in every clone that has not overridden that field.
+"""
+
+from collections.abc import Mapping, MutableMapping
+
+_MISSING = object()
+
+
+class CowDict(MutableMapping):
+    """A dict-like view of a template with its own overrides on top."""
+
+    __slots__ = ('_template', '_overrides', '_hidden')
+
+    def __init__(self, template, overrides=None):
+        self._template = template
+        self._overrides = {}
+        self._hidden = set()
+        if overrides:
+            for key, value in overrides.items():
+                self[key] = value
+
+    def __getitem__(self, key):
+        value = self._overrides.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if key in self._hidden:
+            raise KeyError(key)
+        value = self._template[key]
+        if isinstance(value, (Mapping, list)):
+            # Copy on access: later writes through the returned container
+            # must land in this clone, not in the shared template
+            value = clone(value)
+            self._overrides[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._overrides[key] = value
+
+    def __delitem__(self, key):
+        if key in self._overrides:
+            del self._overrides[key]
+        elif key not in self._template or key in self._hidden:
+            raise KeyError(key)
+        if key in self._template:
+            self._hidden.add(key)
+
+    def __contains__(self, key):
+        if key in self._overrides:
+            return True
+        return key in self._template and key not in self._hidden
+
+    def __iter__(self):
+        # Same key order a real copy would have: template order first, then
+        # keys that were added (or deleted and re-added) on the clone
+        overrides = self._overrides
+        hidden = self._hidden
+        for key in self._template:
+            if key not in hidden:
+                yield key
+        for key in overrides:
+            if key not in self._template or key in hidden:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f'CowDict({dict(self.items())!r})'
+
+    def raw_items(self):
+        """Iterate (key, value) pairs without copying shared containers."""
+        overrides = self._overrides
+        for key in self:
+            value = overrides.get(key, _MISSING)
+            yield key, (self._template[key] if value is _MISSING else value)
+
+    @property
+    def overrides(self):
+        """The fields stored on this clone (everything else is shared)."""
+        return self._overrides
+
+
+def clone(template, **overrides):
+    """
+    Return a structural-sharing copy of a QSF value.
+
+    Dicts become CowDicts holding only the given overrides; lists become new
+    lists whose items are cloned the same way; scalars are returned as-is.
+    """
+    if isinstance(template, Mapping):
+        return CowDict(template, overrides)
+    if isinstance(template, list):
+        return [clone(item) for item in template]
+    return template
+
+
+def materialize(value):
+    """
+    Return value with every CowDict replaced by a plain dict.
+
+    Subtrees without clones are returned unchanged (not copied), so this is
+    a single walk over the document rather than a full copy.
+    """
+    if isinstance(value, CowDict):
+        return {key: materialize(item) for key, item in value.raw_items()}
+    if isinstance(value, dict):
+        result = None
+        for key, item in value.items():
+            plain = materialize(item)
+            if plain is not item:
+                if result is None:
+                    result = dict(value)
+                result[key] = plain
+        return value if result is None else result
+    if isinstance(value, Mapping):
+        # Other lazy mappings, e.g. qsf_lazy.LazyElement
+        return {key: materialize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        result = None
+        for i, item in enumerate(value):
+            plain = materialize(item)
+            if plain is not item:
+                if result is None:
+                    result = list(value)
+                result[i] = plain
+        return value if result is None else result
+    return value
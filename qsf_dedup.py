@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Find and share SQ elements that differ only in their IDs.
+
+fix_s1_s5_qids.py gives every per-vignette block its own copy of the 14
+per-vignette questions, and generated surveys can hold thousands of SQ
+elements that are identical apart from PrimaryAttribute and
+Payload.QuestionID. This module:
+
+- fingerprints each SQ element with its ID fields blanked out and groups
+  the identical ones (duplicate_groups)
+- measures what the copies cost in the serialised file (duplication_cost)
+- rewrites every copy as a clone of the group's first question holding
+  only its own IDs (share_duplicates). The clones are expanded back into
+  full questions by materialize() when the survey is saved, so the output
+  is unchanged but the in-memory document holds each question once.
+  question_clones() builds new copies the same way from the start.
+
+Usage:
+    python qsf_dedup.py <survey.qsf> [--ignore Payload.DataExportTag ...] [--share output.qsf]
+"""
+
+import argparse
+import gc
+import hashlib
+import json
+import sys
+import tracemalloc
+from collections.abc import Mapping
+
+import qsf_json
+from qsf_clone import clone, materialize
+from qsf_document import QSFDocument
+
+ID_FIELDS = ('PrimaryAttribute', 'Payload.QuestionID')
+
+_MISSING = object()
+
+
+def _get(element, path):
+    value = element
+    for part in path.split('.'):
+        if not isinstance(value, Mapping) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _without(value, parts):
+    # Shallow copies along the path only; the rest is shared
+    if not isinstance(value, Mapping) or parts[0] not in value:
+        return value
+    stripped = dict(value)
+    if len(parts) == 1:
+        stripped[parts[0]] = None
+    else:
+        stripped[parts[0]] = _without(value[parts[0]], parts[1:])
+    return stripped
+
+
+def fingerprint(element, ignore=ID_FIELDS):
+    """Digest of an SQ element with the ignored fields blanked (key order kept)."""
+    value = materialize(element)
+    for path in ignore:
+        value = _without(value, path.split('.'))
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def duplicate_groups(doc, ignore=ID_FIELDS):
+    """Lists of SQ elements sharing a fingerprint (only groups of 2+), in document order."""
+    groups = {}
+    for element in doc.elements_of_type('SQ'):
+        groups.setdefault(fingerprint(element, ignore), []).append(element)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def duplication_cost(doc, groups, profile='human'):
+    """Bytes the copies (every group member after the first) add to the file."""
+    copies = {id(element) for group in groups for element in group[1:]}
+    data = materialize(doc.data)
+    without = dict(data)
+    without['SurveyElements'] = [e for e, original in zip(data['SurveyElements'], doc.elements)
+                                 if id(original) not in copies]
+    return len(qsf_json.dumps(data, profile)) - len(qsf_json.dumps(without, profile))
+
+
+def question_clones(template, qids):
+    """
+    Yield a clone of template per QID. The clones share every field with
+    the template except the ID fields, which materialize() fills in when
+    the survey is written.
+    """
+    for qid in qids:
+        copy = clone(template)
+        for path in ID_FIELDS:
+            _set(copy, path, qid)
+        yield copy
+
+
+def _set(element, path, value):
+    parts = path.split('.')
+    target = element
+    for part in parts[:-1]:
+        target = target[part]
+    if value is _MISSING:
+        target.pop(parts[-1], None)
+    else:
+        target[parts[-1]] = value
+
+
+def share_duplicates(doc, groups, ignore=ID_FIELDS):
+    """
+    Replace every copy in groups by a clone of the group's first element
+    carrying the copy's own values for the ignored fields. Returns the
+    number of elements replaced.
+    """
+    replaced = 0
+    with doc.batch() as batch:
+        for group in groups:
+            template = group[0]
+            for element in group[1:]:
+                copy = clone(template)
+                for path in ignore:
+                    _set(copy, path, _get(element, path))
+                batch.replace(element, copy)
+                replaced += 1
+    return replaced
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report and share duplicated SQ elements.")
+    parser.add_argument('qsf_file')
+    parser.add_argument('--ignore', nargs='*', default=[],
+                        help="extra dotted fields to ignore, e.g. Payload.DataExportTag")
+    parser.add_argument('--share', default=None, metavar='OUTPUT',
+                        help="rewrite copies as shared clones and save the survey here")
+    parser.add_argument('--profile', choices=sorted(qsf_json.PROFILES), default='human')
+    args = parser.parse_args(argv)
+    ignore = ID_FIELDS + tuple(args.ignore)
+
+    print(f"Reading {args.qsf_file}...")
+    tracemalloc.start()
+    doc = QSFDocument.load(args.qsf_file)
+    questions = len(doc.elements_of_type('SQ'))
+    groups = duplicate_groups(doc, ignore)
+    copies = sum(len(group) - 1 for group in groups)
+    total = len(doc.dumps(profile=args.profile))
+    cost = duplication_cost(doc, groups, args.profile)
+
+    print(f"\n📋 {questions:,} questions, {questions - copies:,} distinct "
+          f"(ignoring {', '.join(ignore)})")
+    print(f"   - {len(groups):,} group(s) of identical questions, {copies:,} copies")
+    print(f"   - Copies cost {cost:,} of {total:,} bytes ({cost / total:.1%}) in the {args.profile} layout")
+    for group in sorted(groups, key=len, reverse=True)[:10]:
+        qids = [element.get('PrimaryAttribute') for element in group]
+        shown = ', '.join(qids[:6]) + (f", ... (+{len(qids) - 6})" if len(qids) > 6 else "")
+        print(f"     {len(group):>5} x {shown}")
+
+    if args.share:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        replaced = share_duplicates(doc, groups, ignore)
+        # The groups are the last references to the replaced copies
+        del groups
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+        doc.save(args.share, profile=args.profile)
+        print(f"\n✓ Replaced {replaced:,} copies with shared clones "
+              f"({(before - after) / 1e6:.1f} MB less in memory)")
+        print(f"✅ Successfully created {args.share}")
+    tracemalloc.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
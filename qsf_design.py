@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Assignment designs: which N of M scenarios each randomizer Group shows.
+
+fix_randomizer.py and create_clean_survey.py used a cyclic layout, row i
+= {i, i+20, i+40, i+60, i+80} mod 102. Every scenario is shown equally
+often, but the same scenarios always travel together: scenario 1 is only
+ever paired with 21, 41, 61, 81 (and the mirror images), four times each,
+while almost every other pair never meets.
+
+balanced_design() builds rows that keep exposure exactly uniform (each
+scenario appears rows*N/M times, +-1 when that is not a whole number) and
+spreads pairwise co-occurrence as evenly as possible: no scenario twice
+in a row, and no pair appearing more than ceil(lambda) times, where lambda
+is the average number of rows per pair. It is seeded and reproducible.
+
+Placement, pair counting and conflict detection are vectorised with NumPy;
+the repair step only visits cells that are actually in conflict, so 10k
+scenarios x 5 positions takes a few seconds at most. When lambda is just
+under a whole number (rows=500 for 102 x 5 gives 0.97) ceil(lambda) is
+close to a perfect packing; the repair then relaxes the pair limit a step
+at a time, to at most two above ceil(lambda), and stops at a fixed number
+of candidate swaps, so any row count returns within seconds.
+
+Usage:
+    python qsf_design.py [M] [N] [--rows R] [--seed S]
+"""
+
+import argparse
+import math
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+DESIGNS = ('cyclic', 'balanced')
+
+
+def cyclic_design(m, n):
+    """
+    The layout the scripts have always used, as a list of 1-based rows: M
+    combinations of N distinct scenarios in which every scenario appears
+    exactly N times (row i takes i, i + M//N, i + 2*M//N, ... mod M).
+    """
+    step = m // n
+    return [[(i + j * step) % m + 1 for j in range(n)] for i in range(m)]
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("balanced designs need NumPy (pip install numpy)")
+
+
+def _pair_keys(design, m):
+    # Every unordered in-row pair as a single int key (low * m + high), per row
+    n = design.shape[1]
+    left, right = np.triu_indices(n, k=1)
+    a = design[:, left]
+    b = design[:, right]
+    return np.minimum(a, b) * m + np.maximum(a, b)
+
+
+def pair_target(m, n, rows):
+    """Largest pair count a near-uniform design should need: ceil(lambda)."""
+    pairs = rows * n * (n - 1) // 2
+    possible = m * (m - 1) // 2
+    return max(1, math.ceil(pairs / possible))
+
+
+def _initial_placement(m, n, rows, rng):
+    # Each scenario used rows*n/m times (+-1), in random cells
+    cells = rows * n
+    counts = np.full(m, cells // m, dtype=np.int64)
+    counts[rng.permutation(m)[:cells % m]] += 1
+    return rng.permutation(np.repeat(np.arange(m, dtype=np.int64), counts)).reshape(rows, n)
+
+
+def _conflict_cells(design, m, target):
+    """(row, col) of every cell in a repeated scenario or an over-used pair."""
+    rows, n = design.shape
+    keys = _pair_keys(design, m)
+    left, right = np.triu_indices(n, k=1)
+    same = design[:, left] == design[:, right]
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    over = counts[inverse.reshape(keys.shape)] > target
+    bad = same | over
+    cell_bad = np.zeros(design.shape, dtype=bool)
+    row_idx, pair_idx = np.nonzero(bad)
+    cell_bad[row_idx, left[pair_idx]] = True
+    cell_bad[row_idx, right[pair_idx]] = True
+    return np.argwhere(cell_bad)
+
+
+def _pair_counts(design, m):
+    keys, counts = np.unique(_pair_keys(design, m), return_counts=True)
+    return dict(zip(keys.tolist(), counts.tolist()))
+
+
+def _swap_delta(pair_counts, row1, c1, row2, c2, m, target):
+    """
+    (penalty change, sum of count^2 change, pair count changes) for a swap;
+    the penalty counts repeats and pair uses over target. None if the swap
+    would put a scenario into a row that already has it.
+    """
+    a, b = row1[c1], row2[c2]
+    others1 = [x for i, x in enumerate(row1) if i != c1]
+    others2 = [x for i, x in enumerate(row2) if i != c2]
+    if a == b or b in others1 or a in others2:
+        return None, None, None
+    changes = {}
+    for value, others, sign in ((a, others1, -1), (b, others2, -1), (b, others1, 1), (a, others2, 1)):
+        for other in others:
+            key = min(value, other) * m + max(value, other)
+            changes[key] = changes.get(key, 0) + sign
+    penalty = 0
+    spread = 0
+    for key, change in changes.items():
+        if change == 0:
+            continue
+        before = pair_counts.get(key, 0)
+        after = before + change
+        spread += after * after - before * before
+        penalty += max(0, after - target) - max(0, before - target)
+    repeats_before = (len(set(row1)) < len(row1)) + (len(set(row2)) < len(row2))
+    repeats_after = (len(set(others1 + [b])) < len(row1)) + (len(set(others2 + [a])) < len(row2))
+    penalty += repeats_after - repeats_before
+    return penalty, spread, changes
+
+
+def _repair(design, m, target, limit, rng, max_passes, candidates, patience, budget):
+    """
+    Swap conflicting cells with random partners until nothing is over
+    target. After patience passes without fewer conflicts, or an eighth of
+    budget spent on one target, the target goes up by one, but never past
+    limit. Returns (target, swaps evaluated); stops early once budget swaps
+    have been evaluated.
+    """
+    rows, n = design.shape
+    evaluations = 0
+    level_start = 0
+    best = None
+    stalled = 0
+    for _ in range(max_passes):
+        conflicts = _conflict_cells(design, m, target)
+        if len(conflicts) == 0 or evaluations >= budget:
+            break
+        if best is not None and len(conflicts) >= best:
+            stalled += 1
+        else:
+            best, stalled = len(conflicts), 0
+        relax = target < limit
+        if relax and (stalled >= patience or evaluations - level_start >= budget // 8):
+            target += 1
+            level_start = evaluations
+            best, stalled = None, 0
+            continue
+        pair_counts = _pair_counts(design, m)
+        # Candidate partners for every conflicting cell, drawn in one go
+        partner_rows = rng.integers(0, rows, size=(len(conflicts), candidates))
+        partner_cols = rng.integers(0, n, size=(len(conflicts), candidates))
+        for (r1, c1), r2s, c2s in zip(conflicts.tolist(), partner_rows.tolist(), partner_cols.tolist()):
+            if evaluations >= budget or (relax and evaluations - level_start >= budget // 8):
+                break
+            row1 = design[r1].tolist()
+            for r2, c2 in zip(r2s, c2s):
+                if r2 == r1:
+                    continue
+                row2 = design[r2].tolist()
+                evaluations += 1
+                penalty, spread, changes = _swap_delta(pair_counts, row1, c1, row2, c2, m, target)
+                if penalty is None or penalty > 0:
+                    continue
+                # Penalty-neutral moves keep pairs even unless the search
+                # has stalled, when any of them may be taken to move on
+                if penalty == 0 and spread > 0 and stalled < 3:
+                    continue
+                design[r1, c1], design[r2, c2] = row2[c2], row1[c1]
+                for key, change in changes.items():
+                    pair_counts[key] = pair_counts.get(key, 0) + change
+                break
+    return target, evaluations
+
+
+def balanced_design(m, n, rows=None, seed=42, max_passes=200, candidates=64,
+                    patience=8, max_evaluations=300_000, max_slack=2):
+    """
+    Return a (rows, n) NumPy array of 1-based scenario numbers.
+
+    rows defaults to m, so every scenario appears exactly n times. Pairs
+    are first held to ceil(lambda); when the repair stops making progress
+    the limit is relaxed one step at a time up to ceil(lambda) + max_slack,
+    and the search ends after max_passes passes or max_evaluations
+    candidate swaps. Exposure is always exact and no row repeats a
+    scenario. Only if the budget runs out before the pairs fit that limit
+    is it dropped to clear the remaining repeats. Raises ValueError only if
+    repeats cannot be removed.
+    """
+    _require_numpy()
+    rows = m if rows is None else rows
+    if not 0 < n <= m:
+        raise ValueError(f"Need 0 < N <= M (got N={n}, M={m})")
+    rng = np.random.default_rng(seed)
+    design = _initial_placement(m, n, rows, rng)
+
+    target = pair_target(m, n, rows)
+    target, _ = _repair(design, m, target, target + max_slack, rng, max_passes, candidates,
+                        patience, max_evaluations)
+    if len(_conflict_cells(design, m, target)):
+        # Out of budget: drop the pair limit and clear any repeats left
+        _repair(design, m, rows, rows, rng, max_passes, candidates, patience, max_evaluations)
+    if len(_conflict_cells(design, m, rows)):
+        raise ValueError(f"Could not remove repeated scenarios for M={m}, N={n}, rows={rows}")
+
+    # Rows sorted so a Group's scenarios read in ascending order
+    design.sort(axis=1)
+    return design + 1
+
+
+def design_rows(m, n, design='cyclic', seed=42, rows=None):
+    """Rows (lists of 1-based scenario numbers) for the given design name."""
+    if design == 'cyclic':
+        return cyclic_design(m, n)
+    if design == 'balanced':
+        return balanced_design(m, n, rows=rows, seed=seed).tolist()
+    raise ValueError(f"Unknown design '{design}' (expected one of {', '.join(DESIGNS)})")
+
+
+def combination_groups(rows, group_flow_id, set_flow_id, description):
+    """
+    BlockRandomizer Group children for rows, in the shape fix_randomizer.py
+    and create_clean_survey.py emit: each Group holds one EmbeddedData node
+    setting scenario1..scenarioN. The three arguments are callables of the
+    1-based row number.
+    """
+    groups = []
+    for i, scenarios in enumerate(rows, start=1):
+        groups.append({
+            "Type": "Group",
+            "FlowID": group_flow_id(i),
+            "Description": description(i),
+            "Flow": [{
+                "Type": "EmbeddedData",
+                "FlowID": set_flow_id(i),
+                "EmbeddedData": [
+                    {"Description": f"scenario{j}", "Type": "Custom", "Field": f"scenario{j}",
+                     "VariableType": "String", "DataVisibility": [], "AnalyzeText": False, "Value": str(s)}
+                    for j, s in enumerate(scenarios, start=1)
+                ]
+            }]
+        })
+    return groups
+
+
+def summarize(rows, m):
+    """Exposure and pair co-occurrence spread of a design (list or array of rows)."""
+    _require_numpy()
+    design = np.asarray(rows, dtype=np.int64) - 1
+    exposure = np.bincount(design.ravel(), minlength=m)
+    keys = _pair_keys(design, m)
+    _, pair_counts = np.unique(keys, return_counts=True)
+    possible = m * (m - 1) // 2
+    return {
+        'rows': int(design.shape[0]),
+        'exposure_min': int(exposure.min()),
+        'exposure_max': int(exposure.max()),
+        'pairs_covered': int(len(pair_counts)),
+        'pairs_possible': possible,
+        'pair_max': int(pair_counts.max()) if len(pair_counts) else 0,
+        'repeats_in_row': int((np.diff(np.sort(design, axis=1), axis=1) == 0).any(axis=1).sum()),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare cyclic and balanced assignment designs.")
+    parser.add_argument('m', nargs='?', type=int, default=102)
+    parser.add_argument('n', nargs='?', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    print(f"Assignment designs for {args.n} of {args.m} scenarios:\n")
+    for name in DESIGNS:
+        start = time.perf_counter()
+        rows = design_rows(args.m, args.n, name, args.seed, args.rows)
+        seconds = time.perf_counter() - start
+        stats = summarize(rows, args.m)
+        print(f"{name:<9} {stats['rows']:>6} rows  exposure {stats['exposure_min']}-{stats['exposure_max']}  "
+              f"pairs covered {stats['pairs_covered']:,}/{stats['pairs_possible']:,}  "
+              f"max pair count {stats['pair_max']}  ({seconds:.2f}s)")
+    target = pair_target(args.m, args.n, args.rows or args.m)
+    print(f"\n✓ Pair target (ceil lambda) for the balanced design: {target}")
+    if stats['pair_max'] > target:
+        print(f"⚠️  Relaxed to {stats['pair_max']} within the search budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Measure the scenario assignment design inside a QSF before importing it.
+
+Every BlockRandomizer whose children set numeric embedded data is read as
+an assignment design, in one of three shapes the repo has produced:
+
+- 'rows': SubSet 1 over precomputed combinations, each child setting
+  scenario1..scenarioN (create_clean_survey.py, fix_randomizer.py and the
+  flow compiler) or one packed field (qsf_packed.py). A respondent gets
+  one row.
+- 'subset': SubSet N over M children that each set their own field
+  (Selected1..Selected102 in modify_for_102_randomization_fixed.py). A
+  respondent gets N random children, collected in field order.
+- 'overwrite': SubSet N over children that all write the same fields
+  (modify_for_102_randomization.py, restructure_survey.py). The last child
+  wins, so every position ends up holding one scenario; it is analysed as
+  rows so the repeats show up.
+
+For each design the analyzer builds the per-scenario exposure vector, the
+M x M co-occurrence matrix (diagonal = exposure) and the position x
+scenario matrix as NumPy arrays. Rows designs are counted with bincount
+over flattened pair keys and subset designs are computed exactly from
+hypergeometric terms, so nothing loops over pairs in Python.
+
+Usage:
+    python qsf_design_report.py <survey.qsf> [--scenarios M] [--save arrays.npz]
+"""
+
+import argparse
+import re
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from qsf_document import QSFDocument
+from qsf_packed import unpack
+
+MODES = ('rows', 'subset', 'overwrite')
+
+PACKED_VALUE = re.compile(r'^\d+(\s*,\s*\d+)+$')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("qsf_design_report.py needs NumPy (pip install numpy)")
+
+
+def _numeric_fields(node):
+    """[(field, int value)] set by EmbeddedData in node and its descendants."""
+    fields = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.get('Type') == 'EmbeddedData':
+            for item in current.get('EmbeddedData') or []:
+                value = str(item.get('Value', '')).strip()
+                if value.isdigit():
+                    fields.append((item.get('Field'), int(value)))
+                elif PACKED_VALUE.match(value):
+                    # One packed field (qsf_packed.py) holds every position
+                    fields.extend((f"{item.get('Field')}[{k}]", s)
+                                  for k, s in enumerate(unpack(value), start=1))
+        stack.extend(reversed(current.get('Flow') or []))
+    return fields
+
+
+def subset_size(randomizer, children):
+    """A randomizer's SubSet as an int (all children if unset)."""
+    subset = randomizer.get('SubSet')
+    if isinstance(subset, str) and subset.isdigit():
+        return int(subset)
+    return subset if isinstance(subset, int) else children
+
+
+def extract_designs(doc):
+    """
+    Every assignment design in doc's flow, as dicts with flow_id, mode,
+    subset, fields and either rows (list of scenario lists) or scenarios
+    (one scenario per child, in child order, for 'subset').
+    """
+    designs = []
+    for randomizer in doc.flow_index.nodes_of_type('BlockRandomizer'):
+        children = [_numeric_fields(child) for child in randomizer.get('Flow') or []]
+        children = [fields for fields in children if fields]
+        if not children:
+            continue
+        subset = subset_size(randomizer, len(children))
+        design = {'flow_id': randomizer.get('FlowID'), 'subset': subset}
+        field_sets = [tuple(field for field, _ in fields) for fields in children]
+        single_valued = all(len({value for _, value in fields}) == 1 for fields in children)
+        distinct_fields = len({f for fields in field_sets for f in fields}) == sum(len(f) for f in field_sets)
+
+        if subset == 1:
+            design['mode'] = 'rows'
+        elif single_valued and distinct_fields:
+            design['mode'] = 'subset'
+        else:
+            design['mode'] = 'overwrite'
+        design['fields'] = sorted({f for fields in field_sets for f in fields}) \
+            if design['mode'] == 'subset' else list(field_sets[0])
+
+        if design['mode'] == 'subset':
+            design['scenarios'] = [fields[0][1] for fields in children]
+        else:
+            design['rows'] = [[value for _, value in fields] for fields in children]
+        designs.append(design)
+    return designs
+
+
+def _rows_array(rows):
+    width = max(len(row) for row in rows)
+    if any(len(row) != width for row in rows):
+        raise ValueError("Rows set different numbers of scenario fields")
+    return np.asarray(rows, dtype=np.int64) - 1
+
+
+def analyze_rows(rows, m=None):
+    """
+    Exposure (M,), co-occurrence (M, M) and positions (N, M) counts over
+    the rows of a design; weight is the number of rows, so counts / weight
+    is the per-respondent probability when one row is drawn uniformly.
+    """
+    _require_numpy()
+    design = _rows_array(rows)
+    r, n = design.shape
+    m = int(design.max()) + 1 if m is None else m
+    if design.min() < 0 or design.max() >= m:
+        raise ValueError(f"Scenario numbers must be between 1 and {m}")
+
+    exposure = np.bincount(design.ravel(), minlength=m)
+    # All ordered pairs within a row, self-pairs included, as flat keys
+    keys = design[:, :, None] * m + design[:, None, :]
+    cooccurrence = np.bincount(keys.ravel(), minlength=m * m).reshape(m, m)
+    # A scenario repeated in a row should count once on the diagonal
+    np.fill_diagonal(cooccurrence, exposure)
+    positions = np.bincount((np.arange(n) * m + design).ravel(), minlength=n * m).reshape(n, m)
+    repeats = int((np.diff(np.sort(design, axis=1), axis=1) == 0).any(axis=1).sum())
+    return {'exposure': exposure, 'cooccurrence': cooccurrence, 'positions': positions,
+            'weight': r, 'repeats_in_row': repeats}
+
+
+def analyze_subset(scenarios, n, m=None):
+    """
+    Exact per-respondent probabilities for a SubSet n draw over children
+    that each set one scenario, collected in child order: exposure n/M,
+    co-occurrence n(n-1)/(M(M-1)) and P(child k lands in position p) =
+    C(k, p) C(M-1-k, n-1-p) / C(M, n).
+    """
+    _require_numpy()
+    scenarios = np.asarray(scenarios, dtype=np.int64) - 1
+    children = len(scenarios)
+    m = int(scenarios.max()) + 1 if m is None else m
+    if n > children:
+        raise ValueError(f"SubSet {n} exceeds its {children} children")
+
+    shown = n / children
+    exposure = np.bincount(scenarios, minlength=m) * shown
+    pair = n * (n - 1) / (children * (children - 1)) if children > 1 else 0.0
+    counts = np.bincount(scenarios, minlength=m).astype(float)
+    cooccurrence = np.outer(counts, counts) * pair
+    np.fill_diagonal(cooccurrence, exposure)
+
+    # log C(a, b) from a table of log factorials
+    log_fact = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, children + 1)))))
+    k = np.arange(children)[None, :]
+    p = np.arange(n)[:, None]
+    before, after = k - p, (children - 1 - k) - (n - 1 - p)
+    valid = (before >= 0) & (after >= 0)
+    log_terms = (log_fact[k] - log_fact[p] - log_fact[np.clip(before, 0, None)]
+                 + log_fact[children - 1 - k] - log_fact[n - 1 - p] - log_fact[np.clip(after, 0, None)]
+                 - (log_fact[children] - log_fact[n] - log_fact[children - n]))
+    by_child = np.where(valid, np.exp(log_terms), 0.0)
+    positions = np.zeros((n, m))
+    np.add.at(positions, (slice(None), scenarios), by_child)
+    return {'exposure': exposure, 'cooccurrence': cooccurrence, 'positions': positions,
+            'weight': 1, 'repeats_in_row': 0}
+
+
+def analyze(design, m=None):
+    """Arrays for a design dict from extract_designs()."""
+    if design['mode'] == 'subset':
+        return analyze_subset(design['scenarios'], design['subset'], m)
+    return analyze_rows(design['rows'], m)
+
+
+def summarize(arrays):
+    """Scale-free balance figures for the arrays from analyze()."""
+    exposure = arrays['exposure'] / arrays['weight']
+    cooccurrence = arrays['cooccurrence']
+    positions = arrays['positions'] / arrays['weight']
+    m = len(exposure)
+    n = positions.shape[0]
+
+    off_diagonal = cooccurrence.astype(float)
+    np.fill_diagonal(off_diagonal, np.nan)
+    pairs = m * (m - 1) // 2
+    covered = (np.count_nonzero(cooccurrence) - np.count_nonzero(np.diagonal(cooccurrence))) // 2
+    pair_mean = np.nanmean(off_diagonal) if m > 1 else 0.0
+
+    seen = exposure > 0
+    expected = exposure[seen] / n
+    deviation = np.abs(positions[:, seen] - expected) / expected if seen.any() else np.zeros(1)
+    return {
+        'scenarios': m,
+        'per_respondent': n,
+        'unseen': int((~seen).sum()),
+        'exposure_min': float(exposure.min()),
+        'exposure_max': float(exposure.max()),
+        'pairs_covered': int(covered),
+        'pairs_possible': pairs,
+        'pair_min': float(np.nanmin(off_diagonal)) / arrays['weight'] if m > 1 else 0.0,
+        'pair_max': float(np.nanmax(off_diagonal)) / arrays['weight'] if m > 1 else 0.0,
+        'pair_cv': float(np.nanstd(off_diagonal) / pair_mean) if pair_mean else 0.0,
+        'position_max_deviation': float(deviation.max()),
+        'repeats_in_row': arrays['repeats_in_row'],
+    }
+
+
+def print_report(design, stats):
+    weight = 'row' if design['mode'] != 'subset' else 'respondent'
+    print(f"\n📊 {design['flow_id']}: {design['mode']} design, SubSet {design['subset']}, "
+          f"{stats['per_respondent']} of {stats['scenarios']} scenarios")
+    print(f"   - Exposure per {weight}: {stats['exposure_min']:.4f}-{stats['exposure_max']:.4f}"
+          f" ({stats['unseen']} scenario(s) never shown)")
+    print(f"   - Pairs covered: {stats['pairs_covered']:,}/{stats['pairs_possible']:,}"
+          f", co-occurrence {stats['pair_min']:.4f}-{stats['pair_max']:.4f} per {weight}"
+          f" (CV {stats['pair_cv']:.2f})")
+    print(f"   - Position balance: worst scenario is {stats['position_max_deviation']:.0%} off uniform")
+    if stats['repeats_in_row']:
+        print(f"   ⚠️  {stats['repeats_in_row']} row(s) show the same scenario more than once")
+    if design['mode'] == 'overwrite':
+        print("   ⚠️  Children overwrite the same fields, so only the last one presented counts")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report on the assignment designs in a QSF.")
+    parser.add_argument('qsf_file')
+    parser.add_argument('--scenarios', type=int, default=None, metavar='M',
+                        help="number of scenarios (default: the highest one used)")
+    parser.add_argument('--save', default=None, metavar='NPZ',
+                        help="write every design's arrays to a .npz file")
+    args = parser.parse_args(argv)
+    _require_numpy()
+
+    print(f"Reading {args.qsf_file}...")
+    designs = extract_designs(QSFDocument.load(args.qsf_file))
+    if not designs:
+        print("❌ No BlockRandomizer sets numeric embedded data")
+        return 1
+
+    saved = {}
+    for design in designs:
+        try:
+            arrays = analyze(design, args.scenarios)
+        except ValueError as e:
+            print(f"\n❌ {design['flow_id']}: {e}")
+            continue
+        print_report(design, summarize(arrays))
+        for name in ('exposure', 'cooccurrence', 'positions'):
+            saved[f"{design['flow_id']}_{name}"] = arrays[name]
+
+    if args.save and saved:
+        np.savez_compressed(args.save, **saved)
+        print(f"\n✅ Saved {len(saved)} arrays to {args.save}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Semantic diff between two QSF surveys.
+
+A text diff of two 1 MB indent=2 files is slow and mostly noise: moving
+one flow node re-indents hundreds of lines. diff_documents() instead keys
+both surveys by identity and compares like with like:
+
+- questions by SQ PrimaryAttribute (QID)
+- blocks by BL payload ID
+- flow nodes by FlowID; each node is compared without its children, with
+  its parent FlowID and its list of child FlowIDs as fields, so a move or
+  an insertion shows up once instead of on every later sibling
+- every other SurveyElement by Element type (+ PrimaryAttribute), and
+  SurveyEntry as a whole
+
+Each side is indexed in one pass and unchanged elements are skipped with
+a single == check, so the cost is linear in the size of the two files.
+
+Usage:
+    python qsf_diff.py <old.qsf> <new.qsf> [--json] [--limit N]
+    python qsf_diff.py --all [<survey.qsf> ...]
+"""
+
+import argparse
+import glob
+import json
+import re
+import sys
+import time
+from collections import namedtuple
+from collections.abc import Mapping
+
+from qsf_document import QSFDocument
+
+Change = namedtuple('Change', ['kind', 'section', 'key', 'fields'])
+
+ADDED = 'added'
+REMOVED = 'removed'
+MODIFIED = 'modified'
+
+SECTIONS = ('survey', 'element', 'question', 'block', 'flow')
+
+# Larger values are summarised rather than printed in full
+PREVIEW = 80
+
+
+def _keyed(items, key):
+    """{key: item}; repeated keys get '#2', '#3', ... in document order."""
+    result = {}
+    for item in items:
+        base = key(item)
+        name, n = base, 1
+        while name in result:
+            n += 1
+            name = f'{base}#{n}'
+        result[name] = item
+    return result
+
+
+def _flow_nodes(doc):
+    """{FlowID: shallow node with Parent/Children fields}."""
+    nodes = []
+    flow = doc.flow
+    if flow is None:
+        return {}
+    stack = [(child, 'Flow') for child in reversed(flow.get('Flow') or [])]
+    while stack:
+        node, parent = stack.pop()
+        children = node.get('Flow') or []
+        shallow = {k: v for k, v in node.items() if k != 'Flow'}
+        shallow['Parent'] = parent
+        if 'Flow' in node:
+            shallow['Children'] = [child.get('FlowID') for child in children]
+        nodes.append(shallow)
+        stack.extend((child, node.get('FlowID')) for child in reversed(children))
+    return _keyed(nodes, lambda node: node.get('FlowID') or f"<{node.get('Type')} in {node['Parent']}>")
+
+
+def index_survey(doc):
+    """{section: {key: value}} for every comparable part of a survey."""
+    elements = [e for e in doc.elements if e.get('Element') not in ('SQ', 'BL', 'FL')]
+    sections = {
+        'survey': {'SurveyEntry': doc.data.get('SurveyEntry')},
+        'element': _keyed(elements, lambda e: '/'.join(str(p) for p in (e.get('Element'), e.get('PrimaryAttribute')) if p)),
+        'question': _keyed(doc.elements_of_type('SQ'), lambda e: e.get('PrimaryAttribute')),
+        'block': _keyed([b for b in doc.blocks if isinstance(b, Mapping)], lambda b: b.get('ID')),
+        'flow': _flow_nodes(doc),
+    }
+    flow_element = doc.flow_element
+    if flow_element is not None:
+        payload = flow_element.get('Payload') or {}
+        sections['survey']['FlowProperties'] = {k: v for k, v in payload.items() if k != 'Flow'}
+    return sections
+
+
+def field_changes(old, new, path=''):
+    """[(path, old, new)] for every leaf that differs between two JSON values."""
+    changes = []
+    stack = [(old, new, path)]
+    while stack:
+        a, b, at = stack.pop()
+        if a == b:
+            continue
+        if isinstance(a, Mapping) and isinstance(b, Mapping):
+            for key in list(a) + [k for k in b if k not in a]:
+                sub = f'{at}.{key}' if at else str(key)
+                if key not in b:
+                    changes.append((sub, a[key], None))
+                elif key not in a:
+                    changes.append((sub, None, b[key]))
+                else:
+                    stack.append((a[key], b[key], sub))
+        elif isinstance(a, list) and isinstance(b, list):
+            for i in range(max(len(a), len(b))):
+                sub = f'{at}[{i}]'
+                if i >= len(b):
+                    changes.append((sub, a[i], None))
+                elif i >= len(a):
+                    changes.append((sub, None, b[i]))
+                else:
+                    stack.append((a[i], b[i], sub))
+        else:
+            changes.append((at, a, b))
+    changes.sort(key=lambda change: _natural(change[0]))
+    return changes
+
+
+def _natural(path):
+    # 'BlockElements[2]' before 'BlockElements[10]'
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', path)]
+
+
+def diff_indexes(old_index, new_index):
+    """Changes between two index_survey() results, section by section."""
+    changes = []
+    for section in SECTIONS:
+        before, after = old_index[section], new_index[section]
+        for key, value in before.items():
+            if key not in after:
+                changes.append(Change(REMOVED, section, key, []))
+            elif value != after[key]:
+                changes.append(Change(MODIFIED, section, key, field_changes(value, after[key])))
+        for key in after:
+            if key not in before:
+                changes.append(Change(ADDED, section, key, []))
+    return changes
+
+
+def diff_documents(old, new):
+    """Changes between two QSFDocuments, section by section, in key order."""
+    return diff_indexes(index_survey(old), index_survey(new))
+
+
+def diff_files(old_file, new_file):
+    return diff_documents(QSFDocument.load(old_file), QSFDocument.load(new_file))
+
+
+def summarize(changes):
+    """{section: {kind: count}} for the sections that changed."""
+    summary = {}
+    for change in changes:
+        counts = summary.setdefault(change.section, {ADDED: 0, REMOVED: 0, MODIFIED: 0})
+        counts[change.kind] += 1
+    return summary
+
+
+def _preview(value):
+    text = json.dumps(value, ensure_ascii=False)
+    return text if len(text) <= PREVIEW else f'{text[:PREVIEW - 3]}...'
+
+
+def print_diff(changes, limit=20):
+    """Print changes per section, at most limit entries per section and kind."""
+    if not changes:
+        print("✅ No semantic differences")
+        return
+    summary = summarize(changes)
+    for section in SECTIONS:
+        if section not in summary:
+            continue
+        counts = summary[section]
+        print(f"\n📋 {section}: {counts[ADDED]} added, {counts[REMOVED]} removed, {counts[MODIFIED]} modified")
+        for kind, marker in ((ADDED, '+'), (REMOVED, '-'), (MODIFIED, '~')):
+            matching = [c for c in changes if c.section == section and c.kind == kind]
+            for change in matching[:limit]:
+                print(f"   {marker} {change.key}")
+                for path, before, after in change.fields[:limit]:
+                    print(f"       {path}: {_preview(before)} -> {_preview(after)}")
+                if len(change.fields) > limit:
+                    print(f"       ... {len(change.fields) - limit} more field(s)")
+            if len(matching) > limit:
+                print(f"   {marker} ... {len(matching) - limit} more")
+
+
+def compare_all(paths):
+    """Diff every pair of surveys in paths, loading each once; print a table."""
+    start = time.perf_counter()
+    indexes = {path: index_survey(QSFDocument.load(path)) for path in paths}
+    pairs = 0
+    for i, old_path in enumerate(paths):
+        for new_path in paths[i + 1:]:
+            changes = diff_indexes(indexes[old_path], indexes[new_path])
+            print(f"   {len(changes):>6} element(s) differ  {old_path}  ->  {new_path}")
+            pairs += 1
+    print(f"\n✓ Compared {pairs} pairs of {len(paths)} surveys in {time.perf_counter() - start:.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Semantic diff of QSF surveys.")
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--json', action='store_true', help="print the changes as JSON")
+    parser.add_argument('--limit', type=int, default=20, help="entries shown per section and kind")
+    parser.add_argument('--all', action='store_true', help="compare every pair of the given (or all *.qsf) files")
+    args = parser.parse_args(argv)
+
+    if args.all:
+        compare_all(args.files or sorted(glob.glob('*.qsf')))
+        return 0
+    if len(args.files) != 2:
+        parser.error("give <old.qsf> <new.qsf>, or --all")
+
+    changes = diff_files(*args.files)
+    if args.json:
+        print(json.dumps([change._asdict() for change in changes], ensure_ascii=False, indent=2))
+    else:
+        print_diff(changes, args.limit)
+    return 1 if changes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
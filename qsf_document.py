@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Shared QSF document model used by the survey transform scripts.
+
+A QSFDocument loads a Qualtrics survey once and keeps indexes over its
+SurveyElements so that lookups by element type, QID, block ID and block
+Description are dictionary lookups instead of a scan over every element.
+All mutations that can change an indexed field go through the document so
+the indexes stay correct while a transform runs.
+"""
+
+import json
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+import qsf_json
+from qsf_clone import materialize
+from qsf_flow import FlowIndex
+
+
+class QSFDocument:
+    """A parsed QSF survey with O(1) element, question and block indexes."""
+
+    def __init__(self, data):
+        self.data = data
+        self.reindex()
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read and index a QSF file. With snapshots enabled
+        (qsf_snapshot.enable()) an unchanged file is loaded from its snapshot.
+        """
+        import qsf_snapshot  # qsf_snapshot imports this module
+        snapshots = qsf_snapshot.active()
+        if snapshots is not None:
+            return snapshots.load(path, cls)
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def save(self, path, ensure_ascii=False, profile='human'):
+        """
+        Write the document out. The default 'human' profile is the repo's
+        usual indent=2 layout; 'compact' writes minified JSON for imports.
+        """
+        qsf_json.dump(materialize(self.data), path, profile, ensure_ascii)
+
+    def dumps(self, ensure_ascii=False, profile='human'):
+        """The serialised document as UTF-8 bytes."""
+        return qsf_json.dumps(materialize(self.data), profile, ensure_ascii)
+
+    # ------------------------------------------------------------------
+    # Indexes
+    # ------------------------------------------------------------------
+
+    def reindex(self):
+        """Rebuild every index from scratch (one pass over the elements)."""
+        self._by_type = None
+        self._positions = None
+        self._flow_index = None
+        self._questions = {}
+        self._first_index = {}
+        for i, element in enumerate(self.elements):
+            self._first_index.setdefault(element.get('Element'), i)
+            if element.get('Element') == 'SQ':
+                self._questions.setdefault(element.get('PrimaryAttribute'), element)
+        self._reindex_blocks()
+
+    def _index_question(self, element):
+        # Duplicate QIDs resolve to the first SQ in document order, as in reindex()
+        qid = element.get('PrimaryAttribute')
+        current = self._questions.get(qid)
+        if current is None or self.index_of(element) < self.index_of(current):
+            self._questions[qid] = element
+
+    def _unindex_question(self, element):
+        qid = element.get('PrimaryAttribute')
+        if self._questions.get(qid) is element:
+            del self._questions[qid]
+            # Fall back to the next SQ that shares the QID, if any
+            for other in self.elements:
+                if other is not element and other.get('Element') == 'SQ' and other.get('PrimaryAttribute') == qid:
+                    self._questions[qid] = other
+                    break
+
+    def _reindex_blocks(self):
+        self._indexed_blocks = set()
+        self._blocks_by_id = {}
+        self._blocks_by_description = None
+        for block in self.blocks:
+            self._index_block(block)
+
+    def __getstate__(self):
+        # _indexed_blocks and _positions hold id()s, which a pickle cannot carry
+        state = dict(self.__dict__)
+        state['_positions'] = None
+        state['_indexed_blocks'] = [block for block in self.blocks if id(block) in self._indexed_blocks]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._indexed_blocks = {id(block) for block in state['_indexed_blocks']}
+
+    def _index_block(self, block):
+        if not isinstance(block, Mapping):
+            return
+        self._indexed_blocks.add(id(block))
+        self._blocks_by_id.setdefault(block.get('ID'), block)
+        if self._blocks_by_description is not None:
+            self._blocks_by_description.setdefault(block.get('Description', ''), []).append(block)
+
+    def _unindex_block(self, block):
+        if not isinstance(block, Mapping):
+            return
+        self._indexed_blocks.discard(id(block))
+        if self._blocks_by_id.get(block.get('ID')) is block:
+            del self._blocks_by_id[block.get('ID')]
+            # Fall back to a later block that shares the ID, if any
+            for other in self.blocks:
+                if other is not block and isinstance(other, Mapping) and other.get('ID') == block.get('ID'):
+                    self._blocks_by_id[other.get('ID')] = other
+                    break
+        self._blocks_by_description = None
+
+    def _descriptions(self):
+        if self._blocks_by_description is None:
+            self._blocks_by_description = {}
+            for block in self.blocks:
+                if isinstance(block, Mapping):
+                    self._blocks_by_description.setdefault(block.get('Description', ''), []).append(block)
+        return self._blocks_by_description
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    @property
+    def elements(self):
+        """The raw SurveyElements list."""
+        return self.data.setdefault('SurveyElements', [])
+
+    def element(self, element_type):
+        """Return the first SurveyElement of the given type (e.g. 'FL', 'BL')."""
+        index = self._first_index.get(element_type)
+        return self.elements[index] if index is not None else None
+
+    def elements_of_type(self, element_type):
+        """Return every SurveyElement of the given type, in document order."""
+        if self._by_type is None:
+            self._by_type = {}
+            for element in self.elements:
+                self._by_type.setdefault(element.get('Element'), []).append(element)
+        return self._by_type.get(element_type, [])
+
+    def index_of(self, element):
+        """Return the position of an element within SurveyElements."""
+        if self._positions is None:
+            self._positions = {id(e): i for i, e in enumerate(self.elements)}
+        return self._positions[id(element)]
+
+    def question(self, qid):
+        """Return the first SQ element whose PrimaryAttribute is qid, or None."""
+        return self._questions.get(qid)
+
+    def question_ids(self):
+        """Every QID that has an SQ element."""
+        return self._questions.keys()
+
+    def questions(self, qids):
+        """Return {qid: SQ element} for every qid that exists."""
+        return {qid: self._questions[qid] for qid in qids if qid in self._questions}
+
+    @property
+    def flow_element(self):
+        return self.element('FL')
+
+    @property
+    def flow(self):
+        """The Survey Flow payload ({'Flow': [...], 'Properties': ...})."""
+        flow_element = self.flow_element
+        return flow_element.setdefault('Payload', {}) if flow_element else None
+
+    @property
+    def flow_index(self):
+        """FlowIndex over the Survey Flow, built on first use."""
+        if self._flow_index is None or self._flow_index.root is not self.flow:
+            self._flow_index = FlowIndex(self.flow) if self.flow is not None else None
+        return self._flow_index
+
+    def invalidate_flow_index(self):
+        """Drop the flow index after restructuring the flow by hand."""
+        self._flow_index = None
+
+    @property
+    def blocks_element(self):
+        return self.element('BL')
+
+    @property
+    def blocks(self):
+        """The BL payload (list of block definitions)."""
+        blocks_element = self.blocks_element
+        return blocks_element.setdefault('Payload', []) if blocks_element else []
+
+    def block(self, block_id):
+        """Return the block with the given ID, or None."""
+        return self._blocks_by_id.get(block_id)
+
+    def block_by_description(self, description):
+        """Return the first block with the given Description, or None."""
+        matches = self._descriptions().get(description)
+        return matches[0] if matches else None
+
+    def blocks_by_description(self, description):
+        """Return every block with the given Description, in payload order."""
+        return list(self._descriptions().get(description, []))
+
+    @property
+    def survey_id(self):
+        """SurveyID taken from the first question (used for new SQ elements)."""
+        first_question = self.element('SQ')
+        return first_question.get('SurveyID') if first_question else None
+
+    # ------------------------------------------------------------------
+    # Mutations
+    # ------------------------------------------------------------------
+
+    def insert_elements(self, index, new_elements):
+        """Splice new SurveyElements in at index, keeping indexes current."""
+        new_elements = list(new_elements)
+        if index < 0:
+            index += len(self.elements)
+        index = min(max(index, 0), len(self.elements))
+        self.elements[index:index] = new_elements
+        self._by_type = None
+        self._positions = None
+        for element_type, first in self._first_index.items():
+            if first >= index:
+                self._first_index[element_type] = first + len(new_elements)
+        for offset, element in enumerate(new_elements):
+            element_type = element.get('Element')
+            first = self._first_index.get(element_type)
+            if first is None or index + offset < first:
+                self._first_index[element_type] = index + offset
+            if element_type == 'SQ':
+                self._index_question(element)
+        return new_elements
+
+    def append_elements(self, new_elements):
+        return self.insert_elements(len(self.elements), new_elements)
+
+    def remove_element(self, element):
+        """Remove a SurveyElement from the document."""
+        index = self.index_of(element)
+        del self.elements[index]
+        self._by_type = None
+        self._positions = None
+        element_type = element.get('Element')
+        if element_type == 'SQ':
+            self._unindex_question(element)
+        for other_type, first in list(self._first_index.items()):
+            if first > index:
+                self._first_index[other_type] = first - 1
+        if self._first_index.get(element_type) == index:
+            del self._first_index[element_type]
+            for i in range(index, len(self.elements)):
+                if self.elements[i].get('Element') == element_type:
+                    self._first_index[element_type] = i
+                    break
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue many SurveyElement/BL payload edits and apply them in one pass.
+
+            with doc.batch() as batch:
+                batch.insert_after(qid54, new_questions)
+                batch.append_blocks(new_blocks)
+        """
+        batch = QSFBatch(self)
+        yield batch
+        batch.apply()
+
+    def rename_question(self, element, qid):
+        """Give an SQ element a new QID (PrimaryAttribute and Payload.QuestionID)."""
+        self._unindex_question(element)
+        element['PrimaryAttribute'] = qid
+        element.setdefault('Payload', {})['QuestionID'] = qid
+        self._index_question(element)
+
+    def add_blocks(self, new_blocks):
+        """Append block definitions to the BL payload."""
+        new_blocks = list(new_blocks)
+        self.blocks.extend(new_blocks)
+        for block in new_blocks:
+            self._index_block(block)
+        return new_blocks
+
+    def remove_block(self, block):
+        """Remove a block definition from the BL payload."""
+        blocks = self.blocks
+        for i, other in enumerate(blocks):
+            if other is block:
+                del blocks[i]
+                break
+        self._unindex_block(block)
+
+    def update_block(self, block, **fields):
+        """Set ID/Description (or any other field) on a block, reindexing it."""
+        if id(block) not in self._indexed_blocks:
+            block.update(fields)
+            return block
+        self._unindex_block(block)
+        block.update(fields)
+        self._index_block(block)
+        return block
+
+
+class _ListEdits:
+    """Queued inserts/removals/replacements against one list, keyed by identity."""
+
+    def __init__(self):
+        self.before = {}
+        self.after = {}
+        self.replaced = {}
+        self.removed = set()
+        self.appended = []
+
+    def __bool__(self):
+        return bool(self.before or self.after or self.replaced or self.removed or self.appended)
+
+    def rebuild(self, items):
+        """Return a new list with every queued edit applied, preserving order."""
+        result = []
+        for item in items:
+            key = id(item)
+            result.extend(self.before.get(key, ()))
+            if key in self.replaced:
+                result.append(self.replaced[key])
+            elif key not in self.removed:
+                result.append(item)
+            result.extend(self.after.get(key, ()))
+        result.extend(self.appended)
+        return result
+
+
+class QSFBatch:
+    """
+    Transaction of edits against a QSFDocument.
+
+    Inserts are anchored on existing elements/blocks rather than on indexes,
+    so queuing order never shifts positions. Edits anchored on the same item
+    are applied in the order they were queued. Nothing touches the document
+    until apply(), which rebuilds SurveyElements and the BL payload once each
+    and reindexes.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._elements = _ListEdits()
+        self._blocks = _ListEdits()
+
+    # SurveyElements
+
+    def insert_before(self, element, new_elements):
+        self._elements.before.setdefault(id(element), []).extend(new_elements)
+
+    def insert_after(self, element, new_elements):
+        self._elements.after.setdefault(id(element), []).extend(new_elements)
+
+    def append(self, new_elements):
+        self._elements.appended.extend(new_elements)
+
+    def remove(self, element):
+        self._elements.removed.add(id(element))
+
+    def replace(self, element, new_element):
+        self._elements.replaced[id(element)] = new_element
+
+    # BL payload
+
+    def insert_blocks_before(self, block, new_blocks):
+        self._blocks.before.setdefault(id(block), []).extend(new_blocks)
+
+    def insert_blocks_after(self, block, new_blocks):
+        self._blocks.after.setdefault(id(block), []).extend(new_blocks)
+
+    def append_blocks(self, new_blocks):
+        self._blocks.appended.extend(new_blocks)
+
+    def remove_block(self, block):
+        self._blocks.removed.add(id(block))
+
+    def replace_block(self, block, new_block):
+        self._blocks.replaced[id(block)] = new_block
+
+    def apply(self):
+        """Rebuild the edited lists in one linear pass each and reindex."""
+        doc = self.doc
+        if not (self._elements or self._blocks):
+            return
+        # Look the BL payload up before SurveyElements moves under the index
+        blocks = doc.blocks
+        if self._elements:
+            doc.elements[:] = self._elements.rebuild(doc.elements)
+        if self._blocks:
+            blocks[:] = self._blocks.rebuild(blocks)
+        doc.reindex()
+        self._elements = _ListEdits()
+        self._blocks = _ListEdits()
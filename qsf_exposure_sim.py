@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo exposure simulator for a QSF BlockRandomizer.
+
+The scripts set SubSet 5 (or 1) and EvenPresentation on randomizers with
+102 children, and the question is how many completed responses each
+scenario ends up with for a given sample size. simulate() models the
+randomizer as Qualtrics describes it:
+
+- EvenPresentation: each respondent gets the SubSet children presented
+  least often so far, ties broken at random. Presentations count whether
+  or not the respondent finishes, so drop-outs unbalance completed n.
+- Otherwise: a uniformly random SubSet of the children.
+
+Children map to scenarios through the design read by qsf_design_report.py
+(a combination row, a Selected<i> field, or for 'overwrite' designs the
+one child presented last). Any other BlockRandomizer, such as the
+Student/Teaching randomizers over 102 Group nodes, is simulated as
+'subset' with each child as one scenario: S<n> from the child's
+Description when every child has a distinct one, else its position. Many independent surveys ("replications") run
+side by side as (replications x children) NumPy arrays, so each simulated
+respondent is one vectorised step for all of them; 1,000 replications of
+3,000 respondents is 3M synthetic respondents.
+
+Usage:
+    python qsf_exposure_sim.py <survey.qsf> [--flow-id FL_x] [--sizes 300 3000]
+        [--replications 1000] [--completion 0.8] [--seed 42] [--no-even]
+"""
+
+import argparse
+import re
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from qsf_design_report import extract_designs, subset_size
+from qsf_document import QSFDocument
+
+DEFAULT_SIZES = (300, 3000)
+
+SCENARIO_DESCRIPTION = re.compile(r'^S(\d+)$')
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("qsf_exposure_sim.py needs NumPy (pip install numpy)")
+
+
+def child_designs(doc, exclude=()):
+    """
+    A 'subset' design, one scenario per child, for every BlockRandomizer
+    with 2+ children whose FlowID is not in exclude.
+    """
+    designs = []
+    for randomizer in doc.flow_index.nodes_of_type('BlockRandomizer'):
+        children = randomizer.get('Flow') or []
+        if randomizer.get('FlowID') in exclude or len(children) < 2:
+            continue
+        matches = [SCENARIO_DESCRIPTION.match(child.get('Description') or '') for child in children]
+        scenarios = [int(match.group(1)) for match in matches if match]
+        if len(scenarios) != len(children) or len(set(scenarios)) != len(scenarios):
+            scenarios = list(range(1, len(children) + 1))
+        designs.append({'flow_id': randomizer.get('FlowID'), 'mode': 'subset', 'fields': [],
+                        'subset': subset_size(randomizer, len(children)), 'scenarios': scenarios})
+    return designs
+
+
+def incidence(design, m=None):
+    """(children x M) matrix: how many times each child shows each scenario."""
+    _require_numpy()
+    if design['mode'] == 'subset':
+        rows = [[s] for s in design['scenarios']]
+    elif design['mode'] == 'overwrite':
+        # Every field holds the child's one scenario; count it once
+        rows = [[row[0]] for row in design['rows']]
+    else:
+        rows = design['rows']
+    m = max(max(row) for row in rows) if m is None else m
+    matrix = np.zeros((len(rows), m), dtype=np.int64)
+    for child, row in enumerate(rows):
+        np.add.at(matrix[child], np.asarray(row) - 1, 1)
+    return matrix
+
+
+def simulate(matrix, subset, sizes=DEFAULT_SIZES, replications=1000, completion=1.0,
+             even=True, last_only=False, seed=42):
+    """
+    Per-scenario completed n after each sample size in sizes, as
+    {size: (replications x M) array}.
+
+    last_only models 'overwrite' designs, where of the SubSet children
+    presented only the last (a random one of them) determines the scenario.
+    """
+    _require_numpy()
+    if not 0 < completion <= 1:
+        raise ValueError("completion must be in (0, 1]")
+    children = matrix.shape[0]
+    subset = min(subset, children)
+    rng = np.random.default_rng(seed)
+    replicas = np.arange(replications)[:, None]
+
+    presented = np.zeros((replications, children), dtype=np.int64)
+    completed_by_child = np.zeros((replications, children), dtype=np.int64)
+    completes = np.zeros(replications, dtype=np.int64)
+    pending = sorted(set(sizes))
+    snapshots = {size: np.zeros((replications, children), dtype=np.int64) for size in pending}
+    recorded = {size: np.zeros(replications, dtype=bool) for size in pending}
+
+    while pending:
+        # Least presented first; the uniform draw only breaks ties
+        noise = rng.random((replications, children))
+        keys = presented + noise if even else noise
+        if subset < children:
+            chosen = np.argpartition(keys, subset - 1, axis=1)[:, :subset]
+        else:
+            chosen = np.broadcast_to(np.arange(children), (replications, children))
+        presented[replicas, chosen] += 1
+
+        finished = rng.random(replications) < completion
+        if last_only:
+            shown = chosen[np.arange(replications), rng.integers(0, subset, replications)][:, None]
+        else:
+            shown = chosen
+        completed_by_child[replicas, shown] += finished[:, None]
+        completes += finished
+
+        for size in list(pending):
+            reached = (completes == size) & ~recorded[size]
+            snapshots[size][reached] = completed_by_child[reached]
+            recorded[size] |= reached
+            if recorded[size].all():
+                pending.remove(size)
+
+    return {size: snapshots[size] @ matrix for size in sorted(set(sizes))}
+
+
+def exposure_stats(counts):
+    """Spread of per-scenario n across replications for one sample size."""
+    minimum = counts.min(axis=1)
+    maximum = counts.max(axis=1)
+    mean = counts.mean(axis=1)
+    return {
+        'mean_n': float(mean.mean()),
+        'expected_min_n': float(minimum.mean()),
+        'min_n_p05': float(np.percentile(minimum, 5)),
+        'worst_min_n': int(minimum.min()),
+        'expected_max_n': float(maximum.mean()),
+        'expected_spread': float((maximum - minimum).mean()),
+        'cv': float((counts.std(axis=1) / np.where(mean > 0, mean, 1)).mean()),
+    }
+
+
+def print_results(design, results, replications, completion, even):
+    print(f"\n📊 {design['flow_id']}: SubSet {design['subset']} of {design['children']} children, "
+          f"EvenPresentation {'on' if even else 'off'}, completion {completion:.0%}, "
+          f"{replications:,} replications")
+    print(f"   {'completes':>10} {'mean n':>8} {'E[min n]':>9} {'min n p5':>9} {'worst':>6} "
+          f"{'E[max n]':>9} {'spread':>7} {'CV':>6}")
+    for size, counts in results.items():
+        stats = exposure_stats(counts)
+        print(f"   {size:>10,} {stats['mean_n']:>8.1f} {stats['expected_min_n']:>9.1f} "
+              f"{stats['min_n_p05']:>9.1f} {stats['worst_min_n']:>6} {stats['expected_max_n']:>9.1f} "
+              f"{stats['expected_spread']:>7.1f} {stats['cv']:>6.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate per-scenario exposure for a QSF randomizer.")
+    parser.add_argument('qsf_file')
+    parser.add_argument('--flow-id', default=None, help="randomizer to simulate (default: every assignment design)")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="completed-response sample sizes to report")
+    parser.add_argument('--replications', type=int, default=1000)
+    parser.add_argument('--completion', type=float, default=1.0,
+                        help="share of respondents who finish (presentations still count)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--no-even', action='store_true', help="ignore EvenPresentation")
+    args = parser.parse_args(argv)
+    _require_numpy()
+
+    print(f"Reading {args.qsf_file}...")
+    doc = QSFDocument.load(args.qsf_file)
+    designs = extract_designs(doc)
+    designs += child_designs(doc, exclude={d['flow_id'] for d in designs})
+    designs = [d for d in designs if args.flow_id in (None, d['flow_id'])]
+    if not designs:
+        print("❌ No matching BlockRandomizer")
+        return 1
+
+    try:
+        for design in designs:
+            randomizer = doc.flow_index.node(design['flow_id'])
+            even = bool(randomizer.get('EvenPresentation')) and not args.no_even
+            matrix = incidence(design)
+            design['children'] = matrix.shape[0]
+            results = simulate(matrix, design['subset'], args.sizes, args.replications, args.completion,
+                               even, design['mode'] == 'overwrite', args.seed)
+            print_results(design, results, args.replications, args.completion, even)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
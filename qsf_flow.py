@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Index over a QSF Survey Flow tree.
+
+The transform scripts used to find things in the flow by walking it
+recursively each time (and, for the Teaching branch, by searching
+str(BranchLogic) for 'Teaching'). FlowIndex walks the flow once and keeps:
+
+- FlowID -> node, and node -> parent (the root is the FL payload itself)
+- Type -> nodes, in pre-order
+- Description -> nodes (Groups such as 'S1' are found this way)
+- Branch nodes by the operands and values of their BranchLogic conditions
+
+Edits made through insert()/remove()/replace()/set_children() keep the
+index current; anything else that restructures the flow should call
+QSFDocument.invalidate_flow_index().
+"""
+
+from collections.abc import Mapping
+
+
+def branch_conditions(branch):
+    """Yield every Expression dict in a Branch node's BranchLogic."""
+    logic = branch.get('BranchLogic') or {}
+    for key, group in logic.items():
+        if not isinstance(group, Mapping):
+            continue
+        for subkey, condition in group.items():
+            if isinstance(condition, Mapping):
+                yield condition
+
+
+class FlowIndex:
+    """Lookups over a Survey Flow payload that do not re-walk the tree."""
+
+    def __init__(self, root):
+        self.root = root
+        self.rebuild()
+
+    def rebuild(self):
+        """Walk the whole flow once and rebuild every index."""
+        self._parents = {}
+        self._by_flow_id = {}
+        self._by_type = {}
+        self._by_description = {}
+        self._branches_by_operand = {}
+        self._index_children(self.root)
+        self._renumber()
+
+    def _preorder(self):
+        nodes = []
+        stack = list(reversed(self.root.get('Flow') or []))
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(reversed(node.get('Flow') or []))
+        return nodes
+
+    def _renumber(self):
+        # Pre-order positions, used to return lookups in document order
+        self._order = {id(node): i for i, node in enumerate(self._preorder())}
+        self._order_dirty = False
+
+    def __getstate__(self):
+        # _parents and _order are keyed by id(), which a pickle cannot carry;
+        # store them against the nodes in pre-order instead
+        state = dict(self.__dict__)
+        nodes = self._preorder()
+        state['_order'] = nodes
+        state['_parents'] = [self._parents.get(id(node)) for node in nodes]
+        state['_order_dirty'] = False
+        return state
+
+    def __setstate__(self, state):
+        nodes = state['_order']
+        parents = state['_parents']
+        self.__dict__.update(state)
+        self._parents = {id(node): parent for node, parent in zip(nodes, parents)}
+        self._order = {id(node): i for i, node in enumerate(nodes)}
+
+    def _index_children(self, parent):
+        # Iterative pre-order walk; flows can be nested deeply enough that
+        # recursion depth matters for generated surveys
+        stack = [(parent, list(reversed(parent.get('Flow') or [])))]
+        while stack:
+            parent, pending = stack[-1]
+            if not pending:
+                stack.pop()
+                continue
+            node = pending.pop()
+            self._index_node(node, parent)
+            if node.get('Flow'):
+                stack.append((node, list(reversed(node['Flow']))))
+
+    def _index_node(self, node, parent):
+        self._parents[id(node)] = parent
+        flow_id = node.get('FlowID')
+        if flow_id is not None:
+            self._by_flow_id[flow_id] = node
+        self._by_type.setdefault(node.get('Type'), []).append(node)
+        description = node.get('Description')
+        if description is not None:
+            self._by_description.setdefault(description, []).append(node)
+        if node.get('Type') == 'Branch':
+            for condition in branch_conditions(node):
+                for field in ('LeftOperand', 'RightOperand'):
+                    value = condition.get(field)
+                    if value not in (None, ''):
+                        matches = self._branches_by_operand.setdefault(value, [])
+                        if not matches or matches[-1] is not node:
+                            matches.append(node)
+
+    def _unindex_subtrees(self, nodes):
+        # One sweep over the tables however many subtrees are dropped
+        stack = list(nodes)
+        removed = set()
+        while stack:
+            current = stack.pop()
+            removed.add(id(current))
+            self._parents.pop(id(current), None)
+            if self._by_flow_id.get(current.get('FlowID')) is current:
+                del self._by_flow_id[current.get('FlowID')]
+            stack.extend(current.get('Flow') or [])
+        if not removed:
+            return
+        for table in (self._by_type, self._by_description, self._branches_by_operand):
+            for key in list(table):
+                table[key] = [n for n in table[key] if id(n) not in removed]
+                if not table[key]:
+                    del table[key]
+        self._order_dirty = True
+
+    def _sort(self, nodes):
+        return sorted(nodes, key=self.preorder_position)
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+
+    def node(self, flow_id):
+        """Return the flow node with the given FlowID, or None."""
+        return self._by_flow_id.get(flow_id)
+
+    def flow_ids(self):
+        """Every FlowID in the flow."""
+        return self._by_flow_id.keys()
+
+    def parent(self, node):
+        """Return the node (or root payload) whose Flow contains node."""
+        return self._parents.get(id(node))
+
+    def position(self, node):
+        """Return node's index within its parent's Flow list."""
+        for i, sibling in enumerate(self.parent(node).get('Flow', [])):
+            if sibling is node:
+                return i
+        raise ValueError('node is not in its indexed parent')
+
+    def preorder_position(self, node):
+        if self._order_dirty:
+            self._renumber()
+        return self._order.get(id(node), float('inf'))
+
+    def depth(self, node):
+        depth = 0
+        parent = self.parent(node)
+        while parent is not None and parent is not self.root:
+            depth += 1
+            parent = self.parent(parent)
+        return depth
+
+    def nodes_of_type(self, node_type):
+        """Every node of the given Type, in pre-order."""
+        return self._sort(self._by_type.get(node_type, []))
+
+    def nodes_by_description(self, description, node_type=None):
+        """Nodes with an exact Description (e.g. Group 'S1'), in pre-order."""
+        nodes = self._by_description.get(description, [])
+        if node_type is not None:
+            nodes = [n for n in nodes if n.get('Type') == node_type]
+        return self._sort(nodes)
+
+    def branches(self, operand):
+        """Branch nodes whose conditions use operand as a left or right value."""
+        return self._sort(self._branches_by_operand.get(operand, []))
+
+    def branch(self, operand):
+        """The first Branch (pre-order) conditioned on operand, or None."""
+        matches = self.branches(operand)
+        return matches[0] if matches else None
+
+    def child_of_type(self, parent, node_type):
+        """The first direct child of parent with the given Type, or None."""
+        for child in parent.get('Flow', []):
+            if child.get('Type') == node_type:
+                return child
+        return None
+
+    def randomizer_with_groups(self, *descriptions):
+        """First BlockRandomizer (pre-order) directly holding a Group with one of the descriptions."""
+        candidates = []
+        for description in descriptions:
+            for group in self._by_description.get(description, []):
+                parent = self.parent(group)
+                if group.get('Type') == 'Group' and parent is not None and parent.get('Type') == 'BlockRandomizer':
+                    candidates.append(parent)
+        return self._sort(candidates)[0] if candidates else None
+
+    # ------------------------------------------------------------------
+    # Mutations
+    # ------------------------------------------------------------------
+
+    def insert(self, parent, position, nodes):
+        """Splice nodes into parent's Flow at position and index them."""
+        nodes = list(nodes)
+        parent.setdefault('Flow', [])[position:position] = nodes
+        for node in nodes:
+            self._index_node(node, parent)
+            if node.get('Flow'):
+                self._index_children(node)
+        self._order_dirty = True
+        return nodes
+
+    def append(self, parent, nodes):
+        return self.insert(parent, len(parent.get('Flow', [])), nodes)
+
+    def remove(self, node):
+        """Remove node (and its subtree) from its parent's Flow."""
+        parent = self.parent(node)
+        del parent['Flow'][self.position(node)]
+        self._unindex_subtrees([node])
+        return node
+
+    def replace(self, node, new_node):
+        """Put new_node where node was."""
+        parent = self.parent(node)
+        position = self.position(node)
+        self.remove(node)
+        self.insert(parent, position, [new_node])
+        return new_node
+
+    def set_children(self, parent, nodes):
+        """Replace parent's whole Flow list with nodes."""
+        self._unindex_subtrees(parent.get('Flow', []))
+        parent['Flow'] = []
+        return self.insert(parent, 0, nodes)
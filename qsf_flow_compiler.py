@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Compile the Survey Flow for "show each respondent N of M scenarios".
+
+The repo has produced this flow three ways, and they differ hugely in size
+and in how much work Qualtrics does per respondent:
+
+- 'branches' (restructure_survey.py): assign scenario1..scenarioN, then N
+  position Branches each holding M sub-Branches (scenarioK == m) that show
+  S<m> plus the position's per-vignette block. N * (M + 1) conditions.
+- 'groups' (generate_102_groups.py): one BlockRandomizer with M Groups of
+  [S<m>, per-vignette-S<m>], SubSet N, EvenPresentation. No conditions.
+- 'piped' (simplify_survey.py + fix_randomizer.py): assign scenario1..N,
+  then N dynamic iframe blocks that pipe ${e://Field/scenarioK} into the
+  page URL. No conditions and no per-scenario blocks at all.
+
+'branches' and 'piped' assign scenarios the way fix_randomizer.py does: a
+SubSet 1 randomizer over M precomputed combinations of N distinct scenarios
+(restructure_survey.py's own M-way randomizer set every scenarioK to the
+same number).
+
+compile_flow() builds any of them for arbitrary M and N; flow_stats()
+reports node count, conditions evaluated along one simulated respondent
+path, and serialised size, so strategies can be compared before choosing.
+
+Usage:
+    python qsf_flow_compiler.py [M] [N]
+    python qsf_flow_compiler.py <input.qsf> <output.qsf> --strategy piped [--scenarios M] [--per-respondent N]
+"""
+
+import argparse
+import random
+import re
+import sys
+
+import qsf_json
+from qsf_clone import clone
+from qsf_design import cyclic_design
+from qsf_document import QSFDocument
+from qsf_ids import IDAllocator
+from simplify_survey import create_dynamic_iframe_question, create_dynamic_s_block
+
+STRATEGIES = ('branches', 'groups', 'piped')
+
+PER_VIG_TEMPLATE_ID = 'BL_8xeykGPs5f8ULQy'
+
+SCENARIO_GROUP = re.compile(r'^S\d+$')
+
+
+def _embedded_field(field, value=''):
+    return {"Description": field, "Type": "Custom", "Field": field, "VariableType": "String",
+            "DataVisibility": [], "AnalyzeText": False, "Value": value}
+
+
+def _condition(field, operator, value, description):
+    return {
+        "0": {
+            "0": {
+                "LogicType": "EmbeddedField",
+                "LeftOperand": field,
+                "Operator": operator,
+                "RightOperand": value,
+                "Description": description,
+                "Type": "Expression"
+            },
+            "Type": "If"
+        },
+        "Type": "BooleanExpression"
+    }
+
+
+def _standard(block_id, flow_id):
+    return {"Type": "Standard", "ID": block_id, "FlowID": flow_id}
+
+
+def _assignment_randomizer(m, n, flow_ids):
+    scenario_fields = [f'scenario{k}' for k in range(1, n + 1)]
+    randomizer = {"Type": "BlockRandomizer", "FlowID": next(flow_ids), "SubSet": "1",
+                  "EvenPresentation": True, "Flow": []}
+    for combination in cyclic_design(m, n):
+        randomizer["Flow"].append({
+            "Type": "EmbeddedData", "FlowID": next(flow_ids),
+            "EmbeddedData": [_embedded_field(field, str(s)) for field, s in zip(scenario_fields, combination)]
+        })
+    return randomizer
+
+
+def branch_flow(m, n, flow_ids, scenario_block, followup_block):
+    scenario_fields = [f'scenario{k}' for k in range(1, n + 1)]
+    flow = [_assignment_randomizer(m, n, flow_ids)]
+    for k, field in enumerate(scenario_fields, start=1):
+        branch = {
+            "Type": "Branch", "FlowID": next(flow_ids), "Description": f"Branch for Scenario {k}",
+            "BranchLogic": _condition(field, "!Empty", "", f"If {field} Is Not Empty"),
+            "Flow": []
+        }
+        for s in range(1, m + 1):
+            branch["Flow"].append({
+                "Type": "Branch", "FlowID": next(flow_ids), "Description": f"If {field} = {s}",
+                "BranchLogic": _condition(field, "EqualTo", str(s), f"If {field} Is Equal To {s}"),
+                "Flow": [_standard(scenario_block(s), next(flow_ids)),
+                         _standard(followup_block(k), next(flow_ids))]
+            })
+        flow.append(branch)
+    return flow
+
+
+def group_flow(m, n, flow_ids, scenario_block, followup_block):
+    # Follow-up blocks are per scenario here, as in generate_102_groups.py
+    randomizer = {"Type": "BlockRandomizer", "FlowID": next(flow_ids), "SubSet": str(n),
+                  "EvenPresentation": True, "Flow": []}
+    for s in range(1, m + 1):
+        randomizer["Flow"].append({
+            "Type": "Group", "FlowID": next(flow_ids), "Description": f"S{s}",
+            "Flow": [_standard(scenario_block(s), next(flow_ids)),
+                     _standard(followup_block(s), next(flow_ids))]
+        })
+    return [randomizer]
+
+
+def piped_flow(m, n, flow_ids, scenario_block, followup_block):
+    flow = [_assignment_randomizer(m, n, flow_ids)]
+    for k in range(1, n + 1):
+        flow.append(_standard(f'BL_S{k}_Dynamic', next(flow_ids)))
+        flow.append(_standard(followup_block(k), next(flow_ids)))
+    return flow
+
+
+BUILDERS = {
+    'branches': branch_flow,
+    'groups': group_flow,
+    'piped': piped_flow,
+}
+
+
+def compile_flow(strategy, m, n, flow_ids=None, scenario_block=None, followup_block=None):
+    """
+    Return the Survey Flow nodes for showing n of m scenarios.
+
+    scenario_block(s) and followup_block(k) give block IDs; the defaults
+    follow the repo's naming (BL_S<s>Generated, BL_PerVig_S<k>).
+    """
+    if strategy not in BUILDERS:
+        raise ValueError(f"Unknown strategy '{strategy}' (expected one of {', '.join(STRATEGIES)})")
+    if not 0 < n <= m:
+        raise ValueError(f"Need 0 < N <= M (got N={n}, M={m})")
+    if flow_ids is None:
+        flow_ids = IDAllocator().flow_ids(start=1)
+    scenario_block = scenario_block or (lambda s: f'BL_S{s}Generated')
+    followup_block = followup_block or (lambda k: f'BL_PerVig_S{k}')
+    return BUILDERS[strategy](m, n, flow_ids, scenario_block, followup_block)
+
+
+def _branch_matches(branch, fields):
+    # Only the EmbeddedField operators the compiled flows use
+    for group in (branch.get('BranchLogic') or {}).values():
+        if not isinstance(group, dict):
+            continue
+        for condition in group.values():
+            if not isinstance(condition, dict):
+                continue
+            value = fields.get(condition.get('LeftOperand'), '')
+            operator = condition.get('Operator')
+            if operator == 'EqualTo' and value != condition.get('RightOperand'):
+                return False
+            if operator in ('!Empty', 'NotEmpty') and value == '':
+                return False
+            if operator == 'Empty' and value != '':
+                return False
+    return True
+
+
+def simulate_respondent(flow, seed=0):
+    """
+    Walk one respondent through flow: randomizers pick SubSet children,
+    EmbeddedData sets fields, Branches are tested in order.
+    Returns (conditions evaluated, block IDs shown).
+    """
+    rng = random.Random(seed)
+    fields = {}
+    conditions = 0
+    shown = []
+    stack = list(reversed(flow))
+    while stack:
+        node = stack.pop()
+        node_type = node.get('Type')
+        if node_type == 'EmbeddedData':
+            for field in node.get('EmbeddedData', []):
+                fields[field.get('Field')] = field.get('Value', '')
+        elif node_type in ('Standard', 'Block'):
+            shown.append(node.get('ID'))
+        elif node_type == 'Branch':
+            conditions += 1
+            if _branch_matches(node, fields):
+                stack.extend(reversed(node.get('Flow') or []))
+        elif node_type == 'BlockRandomizer':
+            children = node.get('Flow') or []
+            picked = rng.sample(children, min(int(node.get('SubSet') or len(children)), len(children)))
+            stack.extend(reversed(picked))
+        else:
+            stack.extend(reversed(node.get('Flow') or []))
+    return conditions, shown
+
+
+def flow_stats(flow, seed=0):
+    """
+    Node count, per-respondent conditions/blocks, distinct blocks the flow
+    needs in the BL payload, and serialised size of flow.
+    """
+    nodes = 0
+    blocks = set()
+    stack = list(flow)
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        if node.get('Type') in ('Standard', 'Block'):
+            blocks.add(node.get('ID'))
+        stack.extend(node.get('Flow') or [])
+    conditions, shown = simulate_respondent(flow, seed)
+    return {
+        'nodes': nodes,
+        'conditions_per_respondent': conditions,
+        'blocks_per_respondent': len(shown),
+        'blocks_required': len(blocks),
+        'bytes_human': len(qsf_json.dumps(flow, 'human')),
+        'bytes_compact': len(qsf_json.dumps(flow, 'compact')),
+    }
+
+
+def compare_strategies(m, n):
+    """Return {strategy: flow_stats(...)} for every strategy."""
+    return {strategy: flow_stats(compile_flow(strategy, m, n)) for strategy in STRATEGIES}
+
+
+def print_comparison(m, n):
+    stats = compare_strategies(m, n)
+    print(f"Flow strategies for {n} of {m} scenarios:\n")
+    print(f"{'strategy':<10} {'nodes':>8} {'conditions':>11} {'shown':>6} {'blocks':>7} "
+          f"{'human bytes':>12} {'compact bytes':>14}")
+    for strategy, row in stats.items():
+        print(f"{strategy:<10} {row['nodes']:>8,} {row['conditions_per_respondent']:>11,} "
+              f"{row['blocks_per_respondent']:>6} {row['blocks_required']:>7,} "
+              f"{row['bytes_human']:>12,} {row['bytes_compact']:>14,}")
+    print("\n(conditions and shown are per respondent; blocks is how many blocks the flow needs)")
+    smallest = min(stats, key=lambda s: (stats[s]['conditions_per_respondent'], stats[s]['blocks_required'],
+                                         stats[s]['bytes_compact']))
+    print(f"\n✓ Smallest equivalent flow: {smallest}")
+    return stats
+
+
+def scenario_sections(doc):
+    """BlockRandomizers (in flow order) whose children are all scenario Groups S<n>."""
+    return [node for node in doc.flow_index.nodes_of_type('BlockRandomizer')
+            if node.get('Flow') and all(child.get('Type') == 'Group'
+                                        and SCENARIO_GROUP.match(child.get('Description', ''))
+                                        for child in node['Flow'])]
+
+
+def apply_strategy(doc, strategy, m, n):
+    """
+    Replace each scenario-assignment section of doc's Survey Flow (a
+    BlockRandomizer over S<n> Groups) with the compiled flow; everything
+    around it (embedded data, Branches, other blocks, EndSurvey) stays.
+    Returns the compiled nodes of each section.
+
+    Scenario blocks are looked up by Description S<s>; per-vignette blocks
+    BL_PerVig_S<k> are cloned from the per-vignette template when missing,
+    and 'piped' adds its N dynamic iframe blocks and questions.
+    """
+    sections = scenario_sections(doc)
+    if not sections:
+        raise ValueError("No BlockRandomizer of S<n> groups found to replace")
+
+    ids = IDAllocator(doc)
+    scenario_ids = {}
+    for s in range(1, m + 1):
+        block = doc.block_by_description(f'S{s}')
+        scenario_ids[s] = block.get('ID') if block else f'BL_S{s}Generated'
+
+    followups = m if strategy == 'groups' else n
+    template = doc.block(PER_VIG_TEMPLATE_ID)
+    new_blocks = []
+    for k in range(1, followups + 1):
+        if doc.block(f'BL_PerVig_S{k}') is None and template is not None:
+            new_blocks.append(clone(template, ID=f'BL_PerVig_S{k}', Description=f'per-vignette-S{k}'))
+
+    new_questions = []
+    if strategy == 'piped':
+        for k in range(1, n + 1):
+            if doc.block(f'BL_S{k}_Dynamic') is None:
+                new_blocks.append(create_dynamic_s_block(k))
+                question = create_dynamic_iframe_question(k)
+                payload = question['Payload']
+                payload['QuestionText'] = payload['QuestionText'].replace(
+                    f'${{q://QID_InputScenarios/ChoiceTextEntryValue/{k}}}', f'${{e://Field/scenario{k}}}')
+                if doc.survey_id:
+                    question['SurveyID'] = doc.survey_id
+                new_questions.append(question)
+
+    with doc.batch() as batch:
+        batch.append_blocks(new_blocks)
+        if new_questions:
+            batch.insert_before(doc.blocks_element, new_questions)
+
+    flow_index = doc.flow_index
+    flow_ids = ids.flow_ids()
+    flows = []
+    for section in sections:
+        flow = compile_flow(strategy, m, n, flow_ids, scenario_ids.get, lambda k: f'BL_PerVig_S{k}')
+        parent = flow_index.parent(section)
+        position = flow_index.position(section)
+        flow_index.remove(section)
+        flow_index.insert(parent, position, flow)
+        flows.append(flow)
+    # Qualtrics hands out FL_<Count + 1> next, so Count must cover every FlowID
+    doc.flow.setdefault('Properties', {})['Count'] = ids.highest(IDAllocator.FLOW_PREFIX)
+    return flows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare or apply N-of-M scenario flow strategies.")
+    parser.add_argument('args', nargs='*', help="[M] [N] to compare, or <input.qsf> <output.qsf> to apply")
+    parser.add_argument('--strategy', choices=STRATEGIES, default=None)
+    parser.add_argument('--scenarios', type=int, default=102, metavar='M')
+    parser.add_argument('--per-respondent', type=int, default=5, metavar='N')
+    parser.add_argument('--profile', choices=sorted(qsf_json.PROFILES), default='human')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.strategy is None:
+            numbers = [int(a) for a in args.args] if args.args else []
+            m = numbers[0] if numbers else args.scenarios
+            n = numbers[1] if len(numbers) > 1 else args.per_respondent
+            print_comparison(m, n)
+            return 0
+
+        if len(args.args) != 2:
+            parser.error("applying a strategy needs <input.qsf> <output.qsf>")
+        input_file, output_file = args.args
+        print(f"Loading {input_file}...")
+        doc = QSFDocument.load(input_file)
+        flows = apply_strategy(doc, args.strategy, args.scenarios, args.per_respondent)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+
+    stats = flow_stats(flows[0])
+    doc.save(output_file, profile=args.profile)
+    print(f"\n✅ Successfully created {output_file}")
+    print(f"   - Strategy: {args.strategy} ({args.per_respondent} of {args.scenarios} scenarios)")
+    print(f"   - Replaced {len(flows)} scenario section(s), each {stats['nodes']:,} flow nodes "
+          f"and {stats['conditions_per_respondent']:,} conditions per respondent")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Central FlowID / QID / block ID allocation for QSF transforms.
+
+The scripts used to hand out IDs from hand-picked ranges (FL_1000+, FL_2000+,
+FL_4000+, FL_5000+, FL_6200, QID1000+) and hope nothing else lived there.
+IDAllocator scans a document once, records every FlowID, QID and block ID
+already in use, and then hands out fresh IDs in O(1) per call. Sequences
+can still start at a script's historical number so existing output does
+not change, but an ID that is already taken (by the survey or by another
+sequence) is skipped instead of silently reused.
+"""
+
+
+class IDSequence:
+    """Numbered IDs such as FL_1000, FL_1001, ... that skip anything in use."""
+
+    def __init__(self, allocator, prefix, start):
+        self.allocator = allocator
+        self.prefix = prefix
+        self.next_number = start
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        used = self.allocator.used
+        while True:
+            candidate = f'{self.prefix}{self.next_number}'
+            self.next_number += 1
+            if candidate not in used:
+                self.allocator.claim(candidate)
+                return candidate
+
+    def take(self, count):
+        """Return the next count IDs as a list."""
+        return [next(self) for _ in range(count)]
+
+
+class IDAllocator:
+    """Collision-free ID source for one document (or for a standalone snippet)."""
+
+    FLOW_PREFIX = 'FL_'
+    QUESTION_PREFIX = 'QID'
+
+    def __init__(self, doc=None):
+        self.used = set()
+        self._highest = {}
+        if doc is not None:
+            self.scan(doc)
+
+    def scan(self, doc):
+        """Record every FlowID, QID and block ID used in doc (one pass each)."""
+        if doc.flow_index is not None:
+            for flow_id in doc.flow_index.flow_ids():
+                self.claim(flow_id)
+        for qid in doc.question_ids():
+            self.claim(qid)
+        for block in doc.blocks:
+            self.claim(block.get('ID'))
+            for block_element in block.get('BlockElements', []):
+                self.claim(block_element.get('QuestionID'))
+
+    def claim(self, value):
+        """Mark value as used so it is never handed out."""
+        if value is None:
+            return
+        self.used.add(value)
+        for prefix in (self.FLOW_PREFIX, self.QUESTION_PREFIX):
+            if value.startswith(prefix) and value[len(prefix):].isdigit():
+                number = int(value[len(prefix):])
+                if number > self._highest.get(prefix, 0):
+                    self._highest[prefix] = number
+
+    def is_free(self, value):
+        return value not in self.used
+
+    def highest(self, prefix):
+        """Highest number in use with prefix (0 if none), e.g. for Properties.Count."""
+        return self._highest.get(prefix, 0)
+
+    def sequence(self, prefix, start=None):
+        """
+        Return an IDSequence for prefix.
+
+        Without start the sequence begins just past the highest number
+        already used with that prefix.
+        """
+        if start is None:
+            start = self._highest.get(prefix, 0) + 1
+        return IDSequence(self, prefix, start)
+
+    def flow_ids(self, start=None):
+        return self.sequence(self.FLOW_PREFIX, start)
+
+    def qids(self, start=None):
+        return self.sequence(self.QUESTION_PREFIX, start)
+
+    def flow_id(self):
+        """One fresh FlowID past everything in use."""
+        return next(self.flow_ids())
+
+    def qid(self):
+        """One fresh QID past everything in use."""
+        return next(self.qids())
+
+    def named(self, preferred):
+        """
+        Return preferred (e.g. 'BL_PerVig_S3') if it is free, otherwise
+        preferred_2, preferred_3, ... and claim the result.
+        """
+        candidate = preferred
+        suffix = 2
+        while candidate in self.used:
+            candidate = f'{preferred}_{suffix}'
+            suffix += 1
+        self.used.add(candidate)
+        return candidate
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Per-phase timing and memory instrumentation for the survey transforms.
+
+Each transform is wrapped with @transform('name') and marks where its
+phases begin with phase('locate'), phase('clone'), phase('flow') and
+phase('dump'); everything before the first mark is 'load'. count() adds
+to the current phase's counts of elements created. When instrumentation
+is enabled, every phase is written as one JSON line:
+
+    {"transform": "generate_groups", "phase": "clone", "wall_s": 0.41,
+     "cpu_s": 0.40, "peak_bytes": 18874368, "counts": {"groups": 100},
+     "params": {"scenario_count": 102}, "ok": true}
+
+followed by a 'total' line for the whole call. peak_bytes is the
+tracemalloc peak above the memory in use when the phase started. With
+instrumentation off (the default) the wrappers call straight through.
+
+Enable it with enable(path) or --metrics on qsf_pipeline.py /
+qsf_benchmark.py. summarize() reads a metrics file back.
+
+Usage:
+    python qsf_pipeline.py ... --metrics metrics.jsonl
+    python qsf_instrument.py <metrics.jsonl>
+"""
+
+import argparse
+import functools
+import inspect
+import json
+import sys
+import time
+import tracemalloc
+
+PHASES = ('load', 'locate', 'clone', 'flow', 'dump')
+
+_sink = None
+_memory = True
+_tags = {}
+# Open transform calls, innermost last
+_stack = []
+
+
+def enable(path, memory=True):
+    """Append metrics to path; memory=False skips tracemalloc."""
+    global _sink, _memory
+    disable()
+    _sink = open(path, 'a', encoding='utf-8', buffering=1)
+    _memory = memory
+
+
+def disable():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+
+
+def enabled():
+    return _sink is not None
+
+
+def tag(**fields):
+    """Add fields to every following line (None removes a field)."""
+    for key, value in fields.items():
+        if value is None:
+            _tags.pop(key, None)
+        else:
+            _tags[key] = value
+
+
+def _memory_now():
+    if not _memory:
+        return None
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    current, peak = tracemalloc.get_traced_memory()
+    # Fold the peak so far into every open phase before resetting it
+    for run in _stack:
+        for record in (run.current, run.total):
+            if record is not None:
+                record['peak'] = max(record['peak'], peak)
+    tracemalloc.reset_peak()
+    return current
+
+
+def _start(name):
+    current = _memory_now()
+    return {'phase': name, 'wall': time.perf_counter(), 'cpu': time.process_time(),
+            'base': current, 'peak': current or 0, 'counts': {}}
+
+
+class _Run:
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        self.total = None
+        self.current = None
+
+    def begin(self):
+        self.total = _start('total')
+        self.current = _start('load')
+
+    def switch(self, name):
+        self._write(self.current, True)
+        self.current = _start(name)
+
+    def count(self, what, n):
+        for record in (self.current, self.total):
+            record['counts'][what] = record['counts'].get(what, 0) + n
+
+    def end(self, ok):
+        self._write(self.current, ok)
+        self.current = None
+        self._write(self.total, ok)
+
+    def _write(self, record, ok):
+        wall = time.perf_counter() - record['wall']
+        cpu = time.process_time() - record['cpu']
+        _memory_now()
+        line = {
+            'transform': self.name,
+            'phase': record['phase'],
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_bytes': record['peak'] - record['base'] if record['base'] is not None else None,
+            'counts': record['counts'],
+            'params': self.params,
+            'ok': ok,
+        }
+        line.update(_tags)
+        _sink.write(json.dumps(line) + '\n')
+
+
+def _params(signature, args, kwargs):
+    try:
+        bound = signature.bind(*args, **kwargs)
+    except TypeError:
+        return {}
+    bound.apply_defaults()
+    return {name: value for name, value in bound.arguments.items()
+            if value is None or isinstance(value, (bool, int, float, str))}
+
+
+def transform(name):
+    """Decorator: record the wrapped call's phases while instrumentation is on."""
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _sink is None:
+                return fn(*args, **kwargs)
+            run = _Run(name, _params(signature, args, kwargs))
+            _stack.append(run)
+            run.begin()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = result is not False
+                return result
+            finally:
+                _stack.pop()
+                # The run is off the stack, so fold its final peak in by hand
+                if _memory:
+                    peak = tracemalloc.get_traced_memory()[1]
+                    run.current['peak'] = max(run.current['peak'], peak)
+                    run.total['peak'] = max(run.total['peak'], peak)
+                run.end(ok)
+        return wrapper
+    return decorate
+
+
+def phase(name):
+    """Start the named phase of the innermost running transform."""
+    if _stack:
+        _stack[-1].switch(name)
+
+
+def count(what, n=1):
+    """Add n created elements of kind what to the current phase."""
+    if _stack:
+        _stack[-1].count(what, n)
+
+
+def summarize(path):
+    """{(transform, scenarios or None): {phase: line}} from a metrics file."""
+    summary = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for text in f:
+            if not text.strip():
+                continue
+            line = json.loads(text)
+            scale = line.get('scenarios', line['params'].get('scenario_count'))
+            summary.setdefault((line['transform'], scale), {})[line['phase']] = line
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise a transform metrics file.")
+    parser.add_argument('metrics_file')
+    args = parser.parse_args(argv)
+
+    summary = summarize(args.metrics_file)
+    if not summary:
+        print(f"❌ No metrics in {args.metrics_file}")
+        return 1
+    print(f"📊 {'transform':<28} {'scale':>7} {'phase':<7} {'wall s':>9} {'cpu s':>9} {'peak MB':>9}  counts")
+    for (name, scale), phases in summary.items():
+        total = phases.get('total', {}).get('wall_s') or 0
+        slowest = max((p for p in phases if p != 'total'), key=lambda p: phases[p]['wall_s'], default=None)
+        for phase_name in [p for p in PHASES if p in phases] + [p for p in phases if p not in PHASES]:
+            line = phases[phase_name]
+            peak = line['peak_bytes']
+            marker = ' ◀' if phase_name == slowest and total else ''
+            counts = ', '.join(f'{k} {v:,}' for k, v in line['counts'].items()) if phase_name != 'total' else ''
+            print(f"   {name:<28} {scale if scale is not None else '-':>7} {phase_name:<7} "
+                  f"{line['wall_s']:>9.3f} {line['cpu_s']:>9.3f} "
+                  f"{peak / 1e6 if peak is not None else float('nan'):>9.1f}  {counts}{marker}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
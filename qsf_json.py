@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+QSF writer with a choice of output profile and JSON backend.
+
+Profiles:
+- 'human'   indent=2, the layout every script has always written (diffable)
+- 'compact' minified (',' and ':' separators), same key order; about 40%
+            smaller and what you want for Qualtrics imports
+
+Backends:
+- 'json'    the standard library (always available)
+- 'orjson'  used automatically when installed; much faster for 'human',
+            since the stdlib indent encoder is pure Python
+
+Both backends give byte-identical output for a given profile and
+ensure_ascii setting. Anything orjson would write differently from the
+stdlib (exponent-form or non-finite floats, integers outside 64 bits,
+non-string keys, containers other than dict/list) sends that document
+through the stdlib encoder instead.
+
+Usage:
+    python qsf_json.py <input.qsf> <output.qsf> [--profile compact|human] [--ascii]
+"""
+
+import argparse
+import json
+import re
+import sys
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+PROFILES = {
+    'human': {'indent': 2},
+    'compact': {'separators': (',', ':')},
+}
+
+BACKENDS = ('json', 'orjson')
+
+_NON_ASCII = re.compile('[\x7f-\U0010ffff]')
+
+
+def default_backend():
+    return 'orjson' if orjson is not None else 'json'
+
+
+def _orjson_safe(value):
+    """True if orjson would encode value exactly like the stdlib does."""
+    stack = [value]
+    pop = stack.pop
+    extend = stack.extend
+    while stack:
+        item = pop()
+        kind = type(item)
+        if kind is str or kind is bool or item is None:
+            continue
+        if kind is dict:
+            for key in item:
+                if type(key) is not str:
+                    return False
+            extend(item.values())
+        elif kind is list:
+            extend(item)
+        elif kind is int:
+            if not -(1 << 63) <= item < (1 << 64):
+                return False
+        elif kind is float:
+            # repr() and orjson disagree on exponent form (1e-05 vs 0.00001,
+            # 1e+16 vs 1e16) and on nan/inf
+            text = repr(item)
+            if 'e' in text or 'n' in text:
+                return False
+        else:
+            return False
+    return True
+
+
+def _escape_non_ascii(match):
+    # Same escapes json.dumps(..., ensure_ascii=True) produces
+    code = ord(match.group())
+    if code < 0x10000:
+        return f'\\u{code:04x}'
+    code -= 0x10000
+    return f'\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}'
+
+
+def dumps(data, profile='human', ensure_ascii=False, backend=None):
+    """Encode data as UTF-8 JSON bytes using the given profile."""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown profile '{profile}' (expected one of {', '.join(PROFILES)})")
+    if backend is None:
+        backend = default_backend()
+    elif backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}' (expected one of {', '.join(BACKENDS)})")
+    elif backend == 'orjson' and orjson is None:
+        raise ValueError("The orjson backend was requested but orjson is not installed")
+
+    encoded = None
+    if backend == 'orjson' and _orjson_safe(data):
+        try:
+            encoded = orjson.dumps(data, option=orjson.OPT_INDENT_2 if profile == 'human' else 0)
+        except orjson.JSONEncodeError:
+            # e.g. lone surrogates, which the stdlib escapes instead
+            encoded = None
+    if encoded is not None:
+        if ensure_ascii:
+            # orjson always writes UTF-8; escaping afterwards is still far
+            # cheaper than the stdlib indent encoder
+            text = encoded.decode('utf-8')
+            encoded = _NON_ASCII.sub(_escape_non_ascii, text).encode('ascii')
+        return encoded
+
+    return json.dumps(data, ensure_ascii=ensure_ascii, **PROFILES[profile]).encode('utf-8')
+
+
+def dump(data, path, profile='human', ensure_ascii=False, backend=None):
+    """Write data to path using the given profile."""
+    encoded = dumps(data, profile, ensure_ascii, backend)
+    with open(path, 'wb') as f:
+        f.write(encoded)
+    return len(encoded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rewrite a QSF file in a different output profile.")
+    parser.add_argument('input_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='compact')
+    parser.add_argument('--backend', choices=BACKENDS, default=None)
+    parser.add_argument('--ascii', action='store_true', help="escape non-ASCII characters")
+    args = parser.parse_args(argv)
+
+    with open(args.input_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    try:
+        size = dump(data, args.output_file, args.profile, args.ascii, args.backend)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Wrote {args.output_file} ({args.profile}, {size:,} bytes)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
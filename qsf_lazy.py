@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Lazy QSF loading: parse SurveyElement payloads on first access.
+
+Most transforms read the FL and BL elements and a handful of SQs, yet
+QSFDocument.load() parses all 371+ question payloads into dicts.
+LazyQSFDocument.load() instead makes one structural pass over the file
+bytes that records each SurveyElement's byte span and parses only its
+header (Element, PrimaryAttribute, ...). Each element is a LazyElement
+whose Payload is parsed the first time it is read.
+
+dumps()/save() copy the raw bytes of every element that was never opened
+straight through to the output; only the elements that were opened, added
+or replaced are serialised. A targeted edit therefore costs time in
+proportion to what it touches.
+
+The structural pass relies on the 'human' layout (indent=2) that
+json.dump and qsf_json write: an element starts at a line '    {' and ends
+at the next line '    }', and no JSON string can hold a raw newline.
+Files in any other layout are parsed in full, as are saves in another
+profile. An element is re-encoded rather than copied if its bytes hold
+escapes the writer would render differently (\\u sequences, '\\/'), or
+non-ASCII text when ensure_ascii is set. So for any file this repo wrote,
+the output is byte-identical to an eager load and save.
+
+Usage:
+    python qsf_lazy.py <survey.qsf> [<survey.qsf> ...]
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections.abc import Mapping, MutableMapping
+
+import qsf_json
+from qsf_clone import materialize
+from qsf_document import QSFDocument
+
+_ELEMENTS_KEY = b'\n  "SurveyElements": ['
+_ELEMENTS_END = b'\n  ]'
+_ELEMENT_END = b'\n    }'
+# Element starts and ends: the only '{' / '}' lines indented by 4. A regex
+# finds these faster than bytes.find, whose skip-ahead stalls on the spaces
+_BOUNDARY = re.compile(rb'\n    ([{}])')
+# Ends at ':' rather than the following space, for the same reason
+_PAYLOAD_KEY = b'\n      "Payload":'
+_VALUE_INDENT = b'\n      '
+_ELEMENT_INDENT = b'\n    '
+
+# Bytes the writer might encode differently from the source file
+_REENCODE = re.compile(rb'\\u|\\/')
+_NON_ASCII = re.compile(rb'[\x7f-\xff]')
+
+# Stands in for the element list while the rest of the document is encoded
+_PLACEHOLDER = '\x00qsf-lazy-survey-elements\x00'
+
+
+class LazyElement(MutableMapping):
+    """A SurveyElement whose Payload stays as source bytes until it is read."""
+
+    __slots__ = ('_fields', '_source', '_span', '_payload_span', '_pristine')
+
+    def __init__(self, fields, source, span, payload_span):
+        self._fields = fields
+        self._source = source
+        self._span = span
+        self._payload_span = payload_span
+        self._pristine = True
+
+    def _load_payload(self):
+        if self._payload_span is not None:
+            start, end = self._payload_span
+            self._fields['Payload'] = json.loads(self._source[start:end])
+            self._payload_span = None
+
+    def __getitem__(self, key):
+        if key == 'Payload':
+            self._load_payload()
+        value = self._fields[key]
+        if isinstance(value, (Mapping, list)):
+            # Writes through the returned container would not be seen here
+            self._pristine = False
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'Payload':
+            self._payload_span = None
+        self._fields[key] = value
+        self._pristine = False
+
+    def __delitem__(self, key):
+        if key == 'Payload':
+            self._payload_span = None
+        del self._fields[key]
+        self._pristine = False
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def get(self, key, default=None):
+        if key not in self._fields:
+            return default
+        return self[key]
+
+    def __repr__(self):
+        state = 'unparsed' if self._payload_span is not None else 'parsed'
+        return (f"LazyElement({self._fields.get('Element')!r}, "
+                f"{self._fields.get('PrimaryAttribute')!r}, {state})")
+
+    @property
+    def span(self):
+        """(start, end) byte offsets of the element in the source file."""
+        return self._span
+
+    @property
+    def parsed(self):
+        return self._payload_span is None
+
+    @property
+    def pristine(self):
+        """True while the element is known to match its source bytes."""
+        return self._pristine
+
+    def raw(self):
+        start, end = self._span
+        return self._source[start:end]
+
+
+def _value_end(source, start, limit):
+    """End offset of the JSON value starting at source[start], within an element."""
+    opener = source[start:start + 1]
+    if opener in (b'{', b'['):
+        if source[start + 1:start + 2] in (b'}', b']'):
+            return start + 2
+        close = _VALUE_INDENT + (b'}' if opener == b'{' else b']')
+        # Payload is usually the element's last field
+        last = limit - len(_ELEMENT_END)
+        if source[last - len(close):last] == close:
+            return last
+        end = source.find(close, start, limit)
+        return -1 if end < 0 else end + len(close)
+    end = source.find(b'\n', start, limit)
+    end = limit if end < 0 else end
+    return end - 1 if source[end - 1:end] == b',' else end
+
+
+def scan(source):
+    """
+    Split a human-layout QSF into (skeleton without elements, [LazyElement]).
+    Returns None if source is not in that layout.
+    """
+    if not source.startswith(b'{\n  "'):
+        return None
+    key = source.find(_ELEMENTS_KEY)
+    if key < 0:
+        return None
+    array_start = key + len(_ELEMENTS_KEY)
+    if source[array_start:array_start + 1] == b']':
+        array_end = array_start
+        closing = array_start + 1
+    else:
+        array_end = source.find(_ELEMENTS_END, array_start)
+        if array_end < 0:
+            return None
+        closing = array_end + len(_ELEMENTS_END)
+
+    elements = []
+    boundaries = _BOUNDARY.finditer(source, array_start - 1, array_end + 1)
+    position = array_start
+    for opening in boundaries:
+        closing_match = next(boundaries, None)
+        if opening.group(1) != b'{' or closing_match is None or closing_match.group(1) != b'}':
+            return None
+        start = opening.start(1)
+        end = closing_match.end()
+        if source[position:start].strip(b' \n,') or start < position:
+            return None
+        payload_span = None
+        payload_key = source.find(_PAYLOAD_KEY, start, end)
+        if payload_key >= 0:
+            value_start = payload_key + len(_PAYLOAD_KEY) + 1
+            value_end = _value_end(source, value_start, end)
+            if value_end < 0:
+                return None
+            payload_span = (value_start, value_end)
+            header = json.loads(source[start:value_start] + b'null' + source[value_end:end])
+        else:
+            header = json.loads(source[start:end])
+        if not isinstance(header, dict):
+            return None
+        elements.append(LazyElement(header, source, (start, end), payload_span))
+        position = end
+    if source[position:array_end].strip(b' \n,'):
+        return None
+
+    skeleton = json.loads(source[:array_start - 1] + b'[]' + source[closing:])
+    return skeleton, elements
+
+
+class LazyQSFDocument(QSFDocument):
+    """A QSFDocument whose question payloads are parsed on demand."""
+
+    def __init__(self, data, source=None):
+        # source is the file the LazyElements point into (None: plain data)
+        self.source = source
+        super().__init__(data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            source = f.read()
+        scanned = scan(source)
+        if scanned is None:
+            return cls(json.loads(source))
+        data, elements = scanned
+        data['SurveyElements'] = elements
+        return cls(data, source)
+
+    def save(self, path, ensure_ascii=False, profile='human'):
+        encoded = self.dumps(ensure_ascii, profile)
+        with open(path, 'wb') as f:
+            f.write(encoded)
+
+    def dumps(self, ensure_ascii=False, profile='human'):
+        if self.source is None or profile != 'human':
+            return super().dumps(ensure_ascii, profile)
+        parts = []
+        for element in self.elements:
+            raw = element.raw() if isinstance(element, LazyElement) and element.pristine else None
+            if raw is not None and not _REENCODE.search(raw) and not (ensure_ascii and _NON_ASCII.search(raw)):
+                parts.append(raw)
+            else:
+                encoded = qsf_json.dumps(materialize(element), 'human', ensure_ascii)
+                parts.append(encoded.replace(b'\n', _ELEMENT_INDENT))
+        body = b'[' + _ELEMENT_INDENT + (b',' + _ELEMENT_INDENT).join(parts) + _ELEMENTS_END if parts else b'[]'
+
+        data = dict(self.data)
+        data['SurveyElements'] = _PLACEHOLDER
+        skeleton = qsf_json.dumps(materialize(data), 'human', ensure_ascii)
+        return skeleton.replace(json.dumps(_PLACEHOLDER).encode('ascii'), body, 1)
+
+    def parsed_count(self):
+        """(elements whose payload has been parsed, all elements)."""
+        lazy = [e for e in self.elements if isinstance(e, LazyElement)]
+        return (len(self.elements) - len(lazy) + sum(e.parsed for e in lazy), len(self.elements))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare lazy and full QSF loading.")
+    parser.add_argument('qsf_files', nargs='+')
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path in args.qsf_files:
+        start = time.perf_counter()
+        eager = QSFDocument.load(path)
+        eager_load = time.perf_counter() - start
+        expected = eager.dumps()
+
+        start = time.perf_counter()
+        doc = LazyQSFDocument.load(path)
+        lazy_load = time.perf_counter() - start
+        parsed, total = doc.parsed_count()
+        start = time.perf_counter()
+        output = doc.dumps()
+        lazy_save = time.perf_counter() - start
+
+        status = '✓' if output == expected else '❌'
+        failed += output != expected
+        mode = 'lazy' if doc.source is not None else 'full parse (not human layout)'
+        print(f"{status} {path}: {mode}, {parsed}/{total} payloads parsed after indexing; "
+              f"load {lazy_load * 1000:.1f} ms (eager {eager_load * 1000:.1f} ms), "
+              f"save {lazy_save * 1000:.1f} ms")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
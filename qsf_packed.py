@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Packed scenario assignment: one embedded data field instead of 102.
+
+modify_for_102_randomization_fixed.py originally had each of the 102
+randomizer children set its own Selected<i> field. JavaScript on QID371
+then looped over all 102 piped values in the browser, wrote Pos1..Pos5
+and re-rendered the question after a timeout. The response export also
+gained 102 mostly empty Selected* columns.
+
+In packed mode a SubSet 1 randomizer picks one precomputed combination
+(see qsf_design.py) and sets a single field, e.g. AssignedScenarios =
+"1, 21, 41, 61, 81". QID371 pipes ${e://Field/AssignedScenarios}
+directly, so no JavaScript runs and the export has one column.
+decode_responses() splits that column back into Scenario1..ScenarioN, and
+it does the same for old exports that only have Selected* columns.
+
+Usage:
+    python qsf_packed.py <responses.csv> <decoded.csv> [--field NAME] [--keep]
+"""
+
+import argparse
+import csv
+import re
+import sys
+
+ASSIGNMENT_FIELD = 'AssignedScenarios'
+SEPARATOR = ', '
+
+LEGACY_COLUMN = re.compile(r'^Selected(\d+)$')
+
+
+def pack(scenarios):
+    """The packed field value for a list of scenario numbers."""
+    return SEPARATOR.join(str(s) for s in scenarios)
+
+
+def unpack(value):
+    """Scenario numbers (as ints, in position order) from a packed value."""
+    return [int(part) for part in value.split(SEPARATOR.strip()) if part.strip()]
+
+
+def packed_children(rows, flow_ids, field=ASSIGNMENT_FIELD):
+    """One EmbeddedData randomizer child per row, setting field to the packed row."""
+    return [{
+        "Type": "EmbeddedData",
+        "FlowID": next(flow_ids),
+        "EmbeddedData": [{
+            "Description": field,
+            "Type": "Custom",
+            "Field": field,
+            "VariableType": "String",
+            "DataVisibility": [],
+            "AnalyzeText": False,
+            "Value": pack(row)
+        }]
+    } for row in rows]
+
+
+def _decodes(decode, row):
+    try:
+        decode(row)
+    except ValueError:
+        return False
+    return True
+
+
+def _metadata_rows(rows, decode):
+    # Qualtrics CSV exports repeat the question text in the second row and
+    # put {"ImportId": ...} objects in the third (older exports stop at the
+    # question text). Neither holds responses, and the question text in the
+    # assignment columns is no scenario number.
+    metadata = 0
+    for row in rows[:2]:
+        if not (row and row[0].startswith('{"ImportId"')) and _decodes(decode, row):
+            break
+        metadata += 1
+    return metadata
+
+
+def decode_responses(input_file, output_file, field=ASSIGNMENT_FIELD, keep=False):
+    """
+    Rewrite a Qualtrics response export with Scenario1..ScenarioN columns.
+
+    The scenarios come from the packed field if the export has it,
+    otherwise from the non-empty Selected<i> columns in field order (the
+    order the old QID371 JavaScript used). The source columns are dropped
+    unless keep=True. Rows whose assignment is not numeric are reported and
+    left undecoded. Returns the number of responses written.
+    """
+    with open(input_file, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+
+    if field in header:
+        source = [header.index(field)]
+        decode = lambda row: unpack(row[source[0]] if source[0] < len(row) else '')
+    else:
+        legacy = sorted((int(m.group(1)), i) for i, name in enumerate(header)
+                        if (m := LEGACY_COLUMN.match(name)))
+        if not legacy:
+            raise ValueError(f"{input_file} has neither a {field} column nor Selected* columns")
+        source = [i for _, i in legacy]
+        decode = lambda row: [int(row[i]) for i in source if i < len(row) and row[i].strip()]
+
+    metadata = _metadata_rows(rows, decode)
+    decoded = []
+    for line, row in enumerate(rows[metadata:], start=metadata + 2):
+        try:
+            decoded.append(decode(row))
+        except ValueError:
+            # Written out as it is, with empty Scenario columns
+            print(f"⚠️  Line {line} of {input_file} has no readable scenario numbers; left undecoded")
+            decoded.append([])
+    width = max((len(scenarios) for scenarios in decoded), default=0)
+    drop = set() if keep else set(source)
+    kept = [i for i in range(len(header)) if i not in drop]
+    new_columns = [f'Scenario{k}' for k in range(1, width + 1)]
+
+    with open(output_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([header[i] for i in kept] + new_columns)
+        for row in rows[:metadata]:
+            writer.writerow([row[i] if i < len(row) else '' for i in kept] + new_columns)
+        for row, scenarios in zip(rows[metadata:], decoded):
+            padded = [str(s) for s in scenarios] + [''] * (width - len(scenarios))
+            writer.writerow([row[i] if i < len(row) else '' for i in kept] + padded)
+    return len(decoded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode packed scenario assignments in a response export.")
+    parser.add_argument('input_file')
+    parser.add_argument('output_file')
+    parser.add_argument('--field', default=ASSIGNMENT_FIELD)
+    parser.add_argument('--keep', action='store_true', help="keep the packed/Selected* columns")
+    args = parser.parse_args(argv)
+
+    try:
+        count = decode_responses(args.input_file, args.output_file, args.field, args.keep)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Decoded {count} responses into {args.output_file}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
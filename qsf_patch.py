@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Store derived surveys as a base QSF plus a JSON Patch (RFC 6902).
+
+Most checked-in QSF files are full copies that differ from their parent by
+one transform. make_patch() computes an ordered list of add/remove/replace
+operations turning the base into the variant; apply_patch() replays them,
+touching only the paths the patch names. A stored patch records the base
+file, both SHA-256 digests and how the variant was serialised, so
+materialising it reproduces the original file byte for byte (and checks
+that it did).
+
+Lists are aligned on identity keys (PrimaryAttribute, FlowID, ID,
+QuestionID, Field) rather than position, so inserting one SurveyElement
+or flow node is one 'add' instead of a replace of everything after it.
+Operations are generated from the end of each list backwards, so every
+index refers to the list as it is when that operation runs.
+
+Usage:
+    python qsf_patch.py store <base.qsf> <variant.qsf> [-o variant.qsfpatch]
+    python qsf_patch.py apply <variant.qsfpatch> [-o variant.qsf]
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import sys
+from collections.abc import Mapping
+
+import qsf_json
+
+PATCH_SUFFIX = '.qsfpatch'
+
+# Fields that identify an item within a list, in order of preference
+IDENTITY_FIELDS = ('PrimaryAttribute', 'FlowID', 'ID', 'QuestionID', 'Field')
+
+
+def _escape(token):
+    return str(token).replace('~', '~0').replace('/', '~1')
+
+
+def _unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def _item_key(item):
+    if isinstance(item, Mapping):
+        for field in IDENTITY_FIELDS:
+            if field in item:
+                return (field, str(item[field]), str(item.get('Element', item.get('Type', ''))))
+        return json.dumps(item, sort_keys=True, ensure_ascii=False)
+    return json.dumps(item, ensure_ascii=False)
+
+
+def _same_order(a, b):
+    """For a == b: whether every dict also lists its keys in the same order."""
+    if isinstance(a, Mapping):
+        return list(a) == list(b) and all(_same_order(a[key], b[key]) for key in a)
+    if isinstance(a, list):
+        return all(map(_same_order, a, b))
+    return True
+
+
+def _diff_value(a, b, path, ops):
+    # Dicts that are equal but ordered differently still serialise differently
+    if a == b and _same_order(a, b):
+        return
+    if isinstance(a, Mapping) and isinstance(b, Mapping):
+        _diff_dict(a, b, path, ops)
+    elif isinstance(a, list) and isinstance(b, list):
+        _diff_list(a, b, path, ops)
+    else:
+        ops.append({'op': 'replace', 'path': path, 'value': b})
+
+
+def _diff_dict(a, b, path, ops):
+    # Key order is part of the serialised bytes: removed keys vanish and
+    # added keys land at the end, so any other reordering replaces the dict
+    survivors = [key for key in a if key in b]
+    if list(b) != survivors + [key for key in b if key not in a]:
+        ops.append({'op': 'replace', 'path': path, 'value': b})
+        return
+    for key in a:
+        if key not in b:
+            ops.append({'op': 'remove', 'path': f'{path}/{_escape(key)}'})
+    for key in survivors:
+        _diff_value(a[key], b[key], f'{path}/{_escape(key)}', ops)
+    for key in b:
+        if key not in a:
+            ops.append({'op': 'add', 'path': f'{path}/{_escape(key)}', 'value': b[key]})
+
+
+def _diff_list(a, b, path, ops):
+    matcher = difflib.SequenceMatcher(None, [_item_key(x) for x in a], [_item_key(x) for x in b],
+                                      autojunk=False)
+    # From the end backwards, so earlier indexes are still those of a
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        paired = min(i2 - i1, j2 - j1) if tag != 'equal' else i2 - i1
+        if tag in ('replace', 'delete'):
+            for i in range(i2 - 1, i1 + paired - 1, -1):
+                ops.append({'op': 'remove', 'path': f'{path}/{i}'})
+        if tag in ('replace', 'insert'):
+            for offset, j in enumerate(range(j1 + paired, j2)):
+                ops.append({'op': 'add', 'path': f'{path}/{i1 + paired + offset}', 'value': b[j]})
+        for offset in range(paired - 1, -1, -1):
+            _diff_value(a[i1 + offset], b[j1 + offset], f'{path}/{i1 + offset}', ops)
+
+
+def make_patch(base, target):
+    """RFC 6902 operations turning base into target (both parsed JSON)."""
+    ops = []
+    _diff_value(base, target, '', ops)
+    return ops
+
+
+def _parent(root, path):
+    tokens = [_unescape(token) for token in path.split('/')[1:]]
+    if not tokens:
+        raise ValueError("Patches may not replace the whole document")
+    container = root
+    for token in tokens[:-1]:
+        container = container[int(token)] if isinstance(container, list) else container[token]
+    return container, tokens[-1]
+
+
+def apply_patch(data, ops):
+    """Apply ops to data in place and return it; cost is linear in the patch."""
+    for op in ops:
+        container, token = _parent(data, op['path'])
+        kind = op['op']
+        if isinstance(container, list):
+            index = len(container) if token == '-' else int(token)
+            if kind == 'add':
+                container.insert(index, op['value'])
+            elif kind == 'remove':
+                del container[index]
+            elif kind == 'replace':
+                container[index] = op['value']
+            else:
+                raise ValueError(f"Unsupported patch operation '{kind}'")
+        else:
+            if kind in ('add', 'replace'):
+                container[token] = op['value']
+            elif kind == 'remove':
+                del container[token]
+            else:
+                raise ValueError(f"Unsupported patch operation '{kind}'")
+    return data
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _serialisation(data, raw):
+    """The (profile, ensure_ascii) that reproduces raw exactly, or None."""
+    for profile in ('human', 'compact'):
+        for ensure_ascii in (False, True):
+            if qsf_json.dumps(data, profile, ensure_ascii) == raw:
+                return {'profile': profile, 'ensure_ascii': ensure_ascii}
+    return None
+
+
+def _rebuild(base_raw, stored):
+    data = apply_patch(json.loads(base_raw), stored['patch'])
+    serialisation = stored.get('serialisation') or {'profile': 'human', 'ensure_ascii': False}
+    return qsf_json.dumps(data, serialisation['profile'], serialisation['ensure_ascii'])
+
+
+def store(base_file, variant_file, patch_file=None):
+    """
+    Write variant_file as a patch against base_file; return (path, stored
+    dict). The patch is replayed first and nothing is written (ValueError)
+    unless it reproduces the variant.
+    """
+    with open(base_file, 'rb') as f:
+        base_raw = f.read()
+    with open(variant_file, 'rb') as f:
+        variant_raw = f.read()
+    base = json.loads(base_raw)
+    variant = json.loads(variant_raw)
+
+    patch_file = patch_file or os.path.splitext(variant_file)[0] + PATCH_SUFFIX
+    # Relative to the patch file, which is where materialize() resolves it
+    stored = {
+        'base': os.path.relpath(os.path.abspath(base_file), os.path.dirname(os.path.abspath(patch_file))),
+        'base_sha256': _sha256(base_raw),
+        'target_sha256': _sha256(variant_raw),
+        'serialisation': _serialisation(variant, variant_raw),
+        'patch': make_patch(base, variant),
+    }
+    if stored['serialisation'] and _sha256(_rebuild(base_raw, stored)) != stored['target_sha256']:
+        raise ValueError(f"Patch from {base_file} does not reproduce {variant_file}; nothing stored")
+    qsf_json.dump(stored, patch_file, 'compact')
+    return patch_file, stored
+
+
+def materialize(patch_file, output_file=None):
+    """
+    Rebuild the variant a patch file describes. Returns the serialised
+    bytes (and writes them to output_file if given). Raises ValueError if
+    the base changed or the result does not match the recorded digest.
+    """
+    with open(patch_file, 'rb') as f:
+        stored = json.loads(f.read())
+    base_file = os.path.join(os.path.dirname(os.path.abspath(patch_file)), stored['base'])
+    with open(base_file, 'rb') as f:
+        base_raw = f.read()
+    if _sha256(base_raw) != stored['base_sha256']:
+        raise ValueError(f"{stored['base']} has changed since {patch_file} was stored")
+
+    raw = _rebuild(base_raw, stored)
+    if stored.get('serialisation') and _sha256(raw) != stored['target_sha256']:
+        raise ValueError(f"Materialised {patch_file} does not match the stored digest")
+    if output_file:
+        with open(output_file, 'wb') as f:
+            f.write(raw)
+    return raw
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Store and rebuild QSF variants as JSON patches.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    store_cmd = commands.add_parser('store', help="write a variant as a patch against a base")
+    store_cmd.add_argument('base_file')
+    store_cmd.add_argument('variant_file')
+    store_cmd.add_argument('-o', '--output', default=None)
+    apply_cmd = commands.add_parser('apply', help="materialise a stored variant")
+    apply_cmd.add_argument('patch_file')
+    apply_cmd.add_argument('-o', '--output', default=None)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == 'store':
+            patch_file, stored = store(args.base_file, args.variant_file, args.output)
+            print(f"✅ Stored {args.variant_file} as {patch_file}")
+            print(f"   - {len(stored['patch']):,} operation(s), {os.path.getsize(patch_file):,} bytes "
+                  f"(variant is {os.path.getsize(args.variant_file):,} bytes)")
+            if stored['serialisation'] is None:
+                print("   ⚠️  Variant layout not reproducible; it will be rebuilt with indent=2")
+            return 0
+
+        output_file = args.output or os.path.splitext(args.patch_file)[0] + '.qsf'
+        raw = materialize(args.patch_file, output_file)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Materialised {output_file} ({len(raw):,} bytes)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
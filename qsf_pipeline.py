@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Run several survey transforms in memory on one parsed QSF.
+
+Chaining the scripts by hand (simplify_survey.py, then fix_randomizer.py on
+its output, ...) parses and re-serialises the whole survey at every step.
+run_pipeline() loads the input once, hands the same QSFDocument to each
+transform in turn, and writes the result once at the end. Intermediate
+files are only written for steps named as checkpoints.
+
+With --cache, every step's output is kept in a content-hash build cache
+(qsf_cache.py) and a rerun starts from the last step whose input, script
+and parameters are unchanged.
+
+Usage:
+    python qsf_pipeline.py <input.qsf> <output.qsf> <step> [<step> ...]
+    python qsf_pipeline.py <input.qsf> <output.qsf> simplified-fixed
+    python qsf_pipeline.py ... --checkpoint simplify=simplified.qsf
+    python qsf_pipeline.py ... --profile compact
+    python qsf_pipeline.py ... --validate
+    python qsf_pipeline.py ... --cache [--cache-dir .qsf_cache]
+    python qsf_pipeline.py ... --metrics metrics.jsonl
+    python qsf_pipeline.py ... --lazy
+    python qsf_pipeline.py ... --snapshots [--snapshot-dir .qsf_snapshots]
+    python qsf_pipeline.py --list
+"""
+
+import argparse
+import sys
+
+import create_clean_survey
+import fix_per_vig_blocks
+import fix_randomizer
+import restructure_survey
+import qsf_instrument
+import qsf_snapshot
+import simplify_survey
+from fix_s1_s5_qids import fix_qids_for_s1_to_s5
+from generate_102_groups import generate_groups
+from modify_for_102_randomization import modify_qsf
+from modify_for_102_randomization_fixed import modify_qsf_correct
+from qsf_assignment_table import table_variant
+from qsf_cache import DEFAULT_CACHE_DIR, BuildCache, file_sha256
+from qsf_document import QSFDocument
+from qsf_lazy import LazyQSFDocument
+from qsf_validate import print_report, validate
+
+# Step name -> callable(doc) returning True on success. Every transform is
+# called with output_file=None so it edits doc without writing anything.
+TRANSFORMS = {
+    'generate-102-groups': lambda doc: generate_groups(None, None, doc=doc),
+    'modify-102-randomization': lambda doc: modify_qsf(None, None, doc=doc),
+    'modify-102-randomization-fixed': lambda doc: modify_qsf_correct(None, None, doc=doc),
+    'modify-102-randomization-packed': lambda doc: modify_qsf_correct(None, None, doc=doc, packed=True),
+    'fix-per-vig-blocks': lambda doc: fix_per_vig_blocks.main(output_file=None, doc=doc),
+    'fix-s1-s5-qids': lambda doc: bool(fix_qids_for_s1_to_s5(None, doc=doc)),
+    'restructure': lambda doc: restructure_survey.main(output_file=None, doc=doc),
+    'simplify': lambda doc: simplify_survey.main(output_file=None, doc=doc),
+    'fix-randomizer': lambda doc: fix_randomizer.main(output_file=None, doc=doc),
+    'clean': lambda doc: create_clean_survey.main(output_file=None, doc=doc),
+    'assignment-table': lambda doc: bool(table_variant(doc)),
+}
+
+# Steps whose script writes its output with ensure_ascii=True
+ASCII_STEPS = {'fix-s1-s5-qids'}
+
+# Named chains matching how the checked-in surveys were produced
+PRESETS = {
+    'simplified-fixed': ['simplify', 'fix-randomizer'],
+}
+
+
+def expand_steps(steps):
+    """Replace preset names with their steps and reject unknown names."""
+    expanded = []
+    for step in steps:
+        if step in PRESETS:
+            expanded.extend(PRESETS[step])
+        elif step in TRANSFORMS:
+            expanded.append(step)
+        else:
+            raise ValueError(f"Unknown step '{step}'")
+    return expanded
+
+
+def run_pipeline(input_file, steps, output_file=None, checkpoints=None, doc=None,
+                 profile='human', check=False, cache=None, lazy=False):
+    """
+    Apply steps to input_file (or an already loaded doc) in memory.
+
+    checkpoints maps a step name to a path written right after that step.
+    profile applies to the final output; checkpoints are always 'human'.
+    With check=True the integrity validator runs after every step.
+    cache is a BuildCache: cached steps are skipped (and not validated),
+    only the last of them is parsed, and every step run is stored.
+    lazy=True parses question payloads only when a step reads them and
+    copies the untouched ones through to the output (qsf_lazy.py).
+    Returns the document, or None if a step reported failure.
+    """
+    steps = expand_steps(steps)
+    checkpoints = dict(checkpoints or {})
+    for step in checkpoints:
+        if step not in steps:
+            raise ValueError(f"Checkpoint step '{step}' is not in the pipeline")
+
+    start = 0
+    if cache is not None:
+        if doc is not None:
+            raise ValueError("The build cache needs an input file, not a loaded document")
+        input_sha256 = file_sha256(input_file)
+        resume_key = None
+        for number, step in enumerate(steps, start=1):
+            key = cache.key(input_sha256, step, TRANSFORMS[step])
+            meta = cache.lookup(key)
+            if meta is None:
+                break
+            print(f"\n⏭ Step {number}/{len(steps)}: {step} (cached)")
+            if step in checkpoints:
+                cache.load(key).save(checkpoints[step], ensure_ascii=step in ASCII_STEPS)
+                print(f"💾 Checkpoint written to {checkpoints[step]}")
+            resume_key, input_sha256, start = key, meta['output_sha256'], number
+        if resume_key is not None:
+            print(f"Loading cached output of step {start} from {cache.directory}...")
+            doc = cache.load(resume_key)
+
+    if doc is None:
+        print(f"Loading {input_file}...")
+        doc = (LazyQSFDocument if lazy else QSFDocument).load(input_file)
+
+    for number, step in enumerate(steps[start:], start=start + 1):
+        print(f"\n▶ Step {number}/{len(steps)}: {step}")
+        if not TRANSFORMS[step](doc):
+            print(f"❌ Step '{step}' failed")
+            return None
+        if cache is not None:
+            input_sha256 = cache.store(cache.key(input_sha256, step, TRANSFORMS[step]), doc, step, input_sha256)
+        if check:
+            print_report(validate(doc), f"after {step}")
+        if step in checkpoints:
+            doc.save(checkpoints[step], ensure_ascii=step in ASCII_STEPS)
+            print(f"💾 Checkpoint written to {checkpoints[step]}")
+
+    if output_file:
+        doc.save(output_file, ensure_ascii=bool(steps) and steps[-1] in ASCII_STEPS,
+                 profile=profile)
+        print(f"\n✅ Successfully created {output_file}")
+    return doc
+
+
+def parse_checkpoint(value):
+    step, sep, path = value.partition('=')
+    if not sep or not step or not path:
+        raise argparse.ArgumentTypeError("checkpoints look like STEP=PATH")
+    return step, path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run QSF transforms in memory on one parsed survey.")
+    parser.add_argument('input_file', nargs='?')
+    parser.add_argument('output_file', nargs='?')
+    parser.add_argument('steps', nargs='*', help="transform or preset names, applied in order")
+    parser.add_argument('--checkpoint', action='append', type=parse_checkpoint, default=[],
+                        metavar='STEP=PATH', help="also write the survey after STEP")
+    parser.add_argument('--profile', choices=['human', 'compact'], default='human',
+                        help="output layout for output_file (default: human)")
+    parser.add_argument('--validate', action='store_true',
+                        help="run the integrity validator after every step")
+    parser.add_argument('--cache', action='store_true',
+                        help="reuse and store step outputs in the build cache")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f"build cache directory (default: {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--lazy', action='store_true',
+                        help="parse question payloads on first access (qsf_lazy.py)")
+    parser.add_argument('--snapshots', action='store_true',
+                        help="load the input from a parsed-survey snapshot (qsf_snapshot.py)")
+    parser.add_argument('--snapshot-dir', default=qsf_snapshot.DEFAULT_SNAPSHOT_DIR,
+                        help=f"snapshot directory (default: {qsf_snapshot.DEFAULT_SNAPSHOT_DIR})")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="append per-phase timing and memory JSON lines (qsf_instrument.py)")
+    parser.add_argument('--list', action='store_true', help="list available steps and presets")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("Steps:")
+        for name in TRANSFORMS:
+            print(f"  {name}")
+        print("Presets:")
+        for name, steps in PRESETS.items():
+            print(f"  {name}: {' -> '.join(steps)}")
+        return 0
+
+    if not (args.input_file and args.output_file and args.steps):
+        parser.error("input_file, output_file and at least one step are required")
+
+    if args.metrics:
+        qsf_instrument.enable(args.metrics)
+    if args.snapshots:
+        qsf_snapshot.enable(args.snapshot_dir)
+    try:
+        doc = run_pipeline(args.input_file, args.steps, args.output_file, dict(args.checkpoint),
+                           profile=args.profile, check=args.validate,
+                           cache=BuildCache(args.cache_dir) if args.cache else None, lazy=args.lazy)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    return 0 if doc is not None else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Read-only queries against QSF files without parsing the whole survey.
+
+Each file is memory-mapped and described by a small offset index, stored
+next to it as <file>.qsfidx. The index holds:
+
+- every SurveyElement (Element, PrimaryAttribute, byte span)
+- every block in the BL element (ID, Description, byte span)
+- every flow node (FlowID, Type, ID, Description, parent FlowID, span)
+- every EmbeddedData field name in the flow, with its count
+
+It is built by one tokenising pass (any layout, indented or compact) and
+reused while the file's size and mtime are unchanged; if only the mtime
+moved, a matching SHA-256 keeps it, otherwise it is rebuilt. A query
+then parses only the spans it needs ('refs' parses nothing at all: it
+finds the quoted value in the mapped bytes and maps each hit to the
+innermost indexed object).
+
+Usage:
+    python qsf_query.py refs BL_PerVig_S37            # every *.qsf here
+    python qsf_query.py -f survey.qsf question QID371 --field Payload.QuestionJS
+    python qsf_query.py fields 'Selected*'
+    python qsf_query.py block BL_PerVig_S1 | flow FL_5001 | element FL
+"""
+
+import argparse
+import bisect
+import fnmatch
+import glob
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+import time
+
+INDEX_SUFFIX = '.qsfidx'
+INDEX_VERSION = 1
+
+_TOKENS = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],]')
+# Fields recorded for every object while indexing
+_RECORDED = frozenset(('Element', 'PrimaryAttribute', 'ID', 'Description', 'FlowID', 'Type', 'Field'))
+_KEY_BEFORE = re.compile(rb'"((?:[^"\\]|\\.)*)"\s*:\s*\[?\s*$')
+
+
+def _decode(token):
+    return json.loads(token)
+
+
+def build_index(buf):
+    """One pass over buf (bytes or mmap) -> the index dict (without file stamps)."""
+    elements, blocks, flow, fields = [], [], [], {}
+    # Frames: [opener, start, fields, key, expecting key]
+    stack = []
+    element = None  # (frame, nested objects) of the SurveyElement being read
+    in_elements = False
+    for match in _TOKENS.finditer(buf):
+        token = match.group()
+        first = token[:1]
+        if first == b'"':
+            if not stack:
+                continue
+            frame = stack[-1]
+            if frame[0] == b'{' and frame[4]:
+                frame[3] = _decode(token)
+                frame[4] = False
+            elif frame[0] == b'{' and frame[3] in _RECORDED:
+                frame[2][frame[3]] = _decode(token)
+        elif first in (b'{', b'['):
+            if len(stack) == 1 and first == b'[' and stack[0][3] == 'SurveyElements':
+                in_elements = True
+            frame = [first, match.start(), {}, None, first == b'{']
+            if in_elements and len(stack) == 2 and first == b'{':
+                element = (frame, [])
+            stack.append(frame)
+        elif first in (b'}', b']'):
+            frame = stack.pop()
+            end = match.end()
+            if frame[0] == b'{' and element is not None:
+                if frame is element[0]:
+                    _file_element(frame, end, element[1], elements, blocks, flow, fields)
+                    element = None
+                elif frame[2]:
+                    element[1].append((len(stack), frame[1], end, frame[2]))
+            if len(stack) == 1 and frame[0] == b'[':
+                in_elements = False
+        elif stack and stack[-1][0] == b'{':  # ','
+            stack[-1][4] = True
+    return {'elements': elements, 'blocks': blocks, 'flow': flow, 'fields': fields}
+
+
+def _file_element(frame, end, nested, elements, blocks, flow, fields):
+    info = frame[2]
+    kind = info.get('Element')
+    elements.append([kind, info.get('PrimaryAttribute'), frame[1], end])
+    if kind == 'BL':
+        # Blocks are the objects directly inside the payload (list or dict)
+        for depth, start, stop, obj in nested:
+            if depth == 4 and 'ID' in obj:
+                blocks.append([obj['ID'], obj.get('Description'), start, stop])
+    elif kind == 'FL':
+        # Nested objects arrive innermost first; parents are found by span
+        nodes = sorted((n for n in nested if 'FlowID' in n[3]), key=lambda n: n[1])
+        open_nodes = []
+        for depth, start, stop, obj in nodes:
+            while open_nodes and open_nodes[-1][1] <= start:
+                open_nodes.pop()
+            parent = open_nodes[-1][0] if open_nodes else None
+            flow.append([obj['FlowID'], obj.get('Type'), obj.get('ID'), obj.get('Description'), parent, start, stop])
+            open_nodes.append((obj['FlowID'], stop))
+        for depth, start, stop, obj in nested:
+            if 'Field' in obj:
+                fields[obj['Field']] = fields.get(obj['Field'], 0) + 1
+
+
+def _sha256(buf):
+    return hashlib.sha256(buf).hexdigest()
+
+
+class QSFQuery:
+    """A memory-mapped QSF file and its offset index."""
+
+    def __init__(self, path, rebuild=False):
+        self.path = path
+        self.index_path = path + INDEX_SUFFIX
+        with open(path, 'rb') as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.rebuilt = False
+        self.index = None if rebuild else self._load_index()
+        if self.index is None:
+            self.index = self._build_index()
+        # Lazily built lookups over the index rows
+        self._starts = {}
+
+    def close(self):
+        self.buf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _stamp(self):
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('version') != INDEX_VERSION:
+            return None
+        stamp = self._stamp()
+        if index['size'] == stamp['size'] and index['mtime_ns'] == stamp['mtime_ns']:
+            return index
+        # Touched but maybe not changed: the content hash decides
+        if index['size'] != stamp['size'] or index['sha256'] != _sha256(self.buf):
+            return None
+        index.update(stamp)
+        self._write_index(index)
+        return index
+
+    def _build_index(self):
+        index = {'version': INDEX_VERSION, **self._stamp(), 'sha256': _sha256(self.buf)}
+        index.update(build_index(self.buf))
+        self._write_index(index)
+        self.rebuilt = True
+        return index
+
+    def _write_index(self, index):
+        try:
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, separators=(',', ':'))
+        except OSError:
+            pass  # Read-only location: the index just is not persisted
+
+    def parse(self, start, end):
+        return json.loads(self.buf[start:end])
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def elements(self, kind, primary=None):
+        """Parsed SurveyElements of a type (and PrimaryAttribute, if given)."""
+        return [self.parse(start, end) for k, p, start, end in self.index['elements']
+                if k == kind and primary in (None, p)]
+
+    def blocks(self, key):
+        """Parsed blocks whose ID or Description is key."""
+        return [self.parse(start, end) for block_id, description, start, end in self.index['blocks']
+                if key in (block_id, description)]
+
+    def flow_node(self, flow_id):
+        for node in self.index['flow']:
+            if node[0] == flow_id:
+                return self.parse(node[5], node[6])
+        return None
+
+    def fields(self, pattern='*'):
+        """{EmbeddedData field: count} for fields matching a glob pattern."""
+        return {name: count for name, count in self.index['fields'].items() if fnmatch.fnmatchcase(name, pattern)}
+
+    def _innermost(self, section, start_col, offset):
+        # Index rows are in document order, so nested rows follow their parents
+        rows = self.index[section]
+        if section not in self._starts:
+            self._starts[section] = [row[start_col] for row in rows]
+        i = bisect.bisect_right(self._starts[section], offset) - 1
+        while i >= 0:
+            if rows[i][start_col] <= offset < rows[i][start_col + 1]:
+                return rows[i]
+            i -= 1
+        return None
+
+    def _flow_by_id(self):
+        if 'flow_by_id' not in self._starts:
+            self._starts['flow_by_id'] = {node[0]: node for node in self.index['flow']}
+        return self._starts['flow_by_id']
+
+    def refs(self, value):
+        """[(where, key)] for every occurrence of the string value."""
+        # Non-ASCII text is raw UTF-8 in most files, \u escapes in ensure_ascii ones
+        needles = {json.dumps(value, ensure_ascii=ascii).encode('utf-8') for ascii in (False, True)}
+        positions = []
+        for needle in needles:
+            position = self.buf.find(needle)
+            while position >= 0:
+                positions.append(position)
+                position = self.buf.find(needle, position + 1)
+        hits = []
+        for position in sorted(positions):
+            window = self.buf[max(0, position - 200):position]
+            key_match = _KEY_BEFORE.search(window)
+            key = key_match.group(1).decode('utf-8', 'replace') if key_match else None
+            node = self._innermost('flow', 5, position)
+            block = self._innermost('blocks', 2, position) if node is None else None
+            element = self._innermost('elements', 2, position)
+            if node is not None:
+                label = f"flow {_describe(node)}"
+                parent = self._flow_by_id().get(node[4])
+                if parent is not None and parent[1] != 'Root':
+                    label += f" in {_describe(parent)}"
+            elif block is not None:
+                label = f"block {block[0]} ('{block[1]}')"
+            elif element is not None:
+                label = f"{element[0]} {element[1] or ''}".rstrip()
+            else:
+                label = 'survey'
+            hits.append((label, key))
+        return hits
+
+
+def _describe(node):
+    return f"{node[0]} ({node[1]}" + (f" '{node[3]}'" if node[3] else '') + ")"
+
+
+def _field(value, path):
+    for part in path.split('.'):
+        if isinstance(value, list) and part.isdigit():
+            value = value[int(part)]
+        elif isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return None
+    return value
+
+
+def _show(value):
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, indent=2)
+
+
+def run_query(query, args):
+    """Print the answer for one file; returns the number of matches."""
+    if args.command == 'refs':
+        hits = query.refs(args.value)
+        for label, key in hits:
+            print(f"   {label}" + (f" .{key}" if key else ''))
+        return len(hits)
+    if args.command == 'fields':
+        found = query.fields(args.pattern)
+        for name, count in sorted(found.items(), key=lambda item: _natural(item[0])):
+            print(f"   {name}" + (f" (x{count})" if count > 1 else ''))
+        print(f"   {len(found)} distinct field(s) match {args.pattern}")
+        return len(found)
+    if args.command == 'question':
+        found = query.elements('SQ', args.qid)
+    elif args.command == 'element':
+        found = query.elements(args.kind, args.primary)
+    elif args.command == 'block':
+        found = query.blocks(args.block)
+    else:
+        node = query.flow_node(args.flow_id)
+        found = [node] if node is not None else []
+    for item in found:
+        print(_show(_field(item, args.field) if args.field else item))
+    return len(found)
+
+
+def _natural(text):
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', text)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query QSF files through a persisted offset index.")
+    parser.add_argument('-f', '--file', action='append', default=[],
+                        help="QSF file to query (repeatable; default: every *.qsf here)")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the index even if it is current")
+    parser.add_argument('--time', action='store_true', help="print the time taken per file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    refs = commands.add_parser('refs', help="where a string value (ID, QID, FlowID, ...) occurs")
+    refs.add_argument('value')
+    fields = commands.add_parser('fields', help="EmbeddedData field names matching a glob")
+    fields.add_argument('pattern', nargs='?', default='*')
+    question = commands.add_parser('question', help="an SQ element by QID")
+    question.add_argument('qid')
+    element = commands.add_parser('element', help="SurveyElements by type (and PrimaryAttribute)")
+    element.add_argument('kind')
+    element.add_argument('primary', nargs='?')
+    block = commands.add_parser('block', help="a block by ID or Description")
+    block.add_argument('block')
+    flow = commands.add_parser('flow', help="a flow node by FlowID")
+    flow.add_argument('flow_id')
+    for sub in (question, element, block, flow):
+        sub.add_argument('--field', default=None, help="dotted path to print, e.g. Payload.QuestionJS")
+    args = parser.parse_args(argv)
+
+    paths = args.file or sorted(glob.glob('*.qsf'))
+    if not paths:
+        print("❌ No QSF files to query")
+        return 1
+    total = 0
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            query = QSFQuery(path, args.rebuild)
+        except (OSError, ValueError) as e:
+            print(f"❌ {path}: {e}")
+            continue
+        with query:
+            print(f"📋 {path}" + (" (index rebuilt)" if query.rebuilt else ''))
+            total += run_query(query, args)
+        if args.time:
+            print(f"   ({(time.perf_counter() - start) * 1000:.1f} ms)")
+    return 0 if total else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
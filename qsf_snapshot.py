@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Binary snapshots of parsed, indexed surveys.
+
+Every script starts by parsing a 0.5-1.5 MB QSF and indexing it; during
+iterative work that is the same file again and again. With snapshots
+enabled, QSFDocument.load() keys the file by the SHA-256 of its bytes and:
+
+- on a miss, parses and indexes it as usual (flow index included) and
+  pickles the finished QSFDocument into the snapshot directory
+- on a hit, unpickles that document instead of parsing JSON
+
+The key also covers the document class and the source of the modules
+whose state is pickled (qsf_document.py, qsf_flow.py, ...), so changing
+those drops every snapshot. Each load is reported on stderr as a hit or
+miss with its time; a load inside an instrumented transform is also
+counted as 'snapshot hits' / 'snapshot misses' in its load phase.
+
+A snapshot file is two pickles: a small metadata dict, then the document.
+Snapshots are plain pickles, so only point this at a directory you trust.
+
+Snapshots are off until enable() is called, e.g. by --snapshots on
+qsf_pipeline.py.
+
+Usage:
+    python qsf_pipeline.py ... --snapshots [--snapshot-dir .qsf_snapshots]
+    python qsf_snapshot.py time <survey.qsf> [<survey.qsf> ...]
+    python qsf_snapshot.py inspect [--snapshot-dir .qsf_snapshots]
+    python qsf_snapshot.py clear [--keep N] [--snapshot-dir .qsf_snapshots]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+
+import qsf_document
+import qsf_instrument
+
+DEFAULT_SNAPSHOT_DIR = '.qsf_snapshots'
+
+# Bump when the snapshot layout itself changes
+SNAPSHOT_VERSION = 1
+
+# Modules besides the document class's own whose objects are pickled
+STATE_MODULES = ('qsf_flow',)
+
+_PROTOCOL = 5
+
+# Anything a truncated or outdated snapshot can raise while unpickling
+_UNREADABLE = (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError,
+               IndexError, KeyError, TypeError, ValueError)
+
+_active = None
+
+
+def enable(directory=DEFAULT_SNAPSHOT_DIR, report=True):
+    """Serve QSFDocument.load() from snapshots in directory."""
+    global _active
+    _active = SnapshotCache(directory, report)
+    return _active
+
+
+def disable():
+    global _active
+    _active = None
+
+
+def active():
+    """The enabled SnapshotCache, or None."""
+    return _active
+
+
+def code_hash(cls):
+    """SHA-256 over the source of cls's modules and STATE_MODULES."""
+    names = [c.__module__ for c in cls.__mro__ if c is not object] + list(STATE_MODULES)
+    paths = sorted({getattr(sys.modules.get(name), '__file__', None) or name for name in names})
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode('utf-8') + b'\0')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+class SnapshotCache:
+    """Pickled QSFDocuments stored by the SHA-256 of their source file."""
+
+    def __init__(self, directory=DEFAULT_SNAPSHOT_DIR, report=True):
+        self.directory = directory
+        self.report = report
+        # One {'path', 'hit', 'seconds', ...} dict per load
+        self.stats = []
+        self._code_hashes = {}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.snapshot')
+
+    def key(self, source_sha256, cls):
+        if cls not in self._code_hashes:
+            self._code_hashes[cls] = code_hash(cls)
+        material = json.dumps([SNAPSHOT_VERSION, source_sha256,
+                               f'{cls.__module__}.{cls.__qualname__}', self._code_hashes[cls]])
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def load(self, path, cls):
+        """Load path as a cls, from its snapshot if there is one."""
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            source = f.read()
+        source_sha256 = hashlib.sha256(source).hexdigest()
+        key = self.key(source_sha256, cls)
+
+        doc, meta = self._read(key, cls)
+        if doc is not None:
+            seconds = time.perf_counter() - start
+            os.utime(self._path(key))
+            self._record(path, True, seconds, meta['parse_s'])
+            return doc
+
+        doc = cls(json.loads(source))
+        # Build the lazy flow index now so the snapshot carries it
+        doc.flow_index
+        parse_s = time.perf_counter() - start
+        meta = {
+            'version': SNAPSHOT_VERSION,
+            'source': os.path.basename(path),
+            'source_sha256': source_sha256,
+            'source_size': len(source),
+            'parse_s': parse_s,
+            'created': time.time(),
+        }
+        self._write(key, meta, doc)
+        self._record(path, False, parse_s, parse_s, time.perf_counter() - start - parse_s)
+        return doc
+
+    def _read(self, key, cls):
+        try:
+            with open(self._path(key), 'rb') as f:
+                meta = pickle.load(f)
+                doc = pickle.load(f)
+        except _UNREADABLE:
+            # Missing, truncated or outdated: rewritten as for any miss
+            return None, None
+        if type(doc) is not cls:
+            return None, None
+        return doc, meta
+
+    def _write(self, key, meta, doc):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        partial = f'{path}.{os.getpid()}.tmp'
+        with open(partial, 'wb') as f:
+            pickle.dump(meta, f, _PROTOCOL)
+            pickle.dump(doc, f, _PROTOCOL)
+        # Readers never see a half-written snapshot
+        os.replace(partial, path)
+
+    def _record(self, path, hit, seconds, parse_s, store_s=None):
+        self.stats.append({'path': path, 'hit': hit, 'seconds': seconds,
+                           'parse_s': parse_s, 'store_s': store_s})
+        qsf_instrument.count('snapshot hits' if hit else 'snapshot misses')
+        if not self.report:
+            return
+        if hit:
+            print(f"📦 Snapshot hit for {path}: loaded in {seconds * 1000:.1f} ms "
+                  f"(parsing took {parse_s * 1000:.1f} ms)", file=sys.stderr)
+        else:
+            print(f"📦 Snapshot miss for {path}: parsed in {seconds * 1000:.1f} ms, "
+                  f"stored in {store_s * 1000:.1f} ms", file=sys.stderr)
+
+    def entries(self):
+        """[(key, metadata, size, last used)] for every snapshot, oldest use first."""
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.snapshot'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, 'rb') as f:
+                    meta = pickle.load(f)
+                stat = os.stat(path)
+            except _UNREADABLE:
+                continue
+            result.append((name[:-len('.snapshot')], meta, stat.st_size, stat.st_mtime))
+        result.sort(key=lambda entry: entry[3])
+        return result
+
+    def clear(self, keep=0):
+        """Remove all but the keep most recently used snapshots; return how many went."""
+        entries = self.entries()
+        stale = entries[:max(len(entries) - keep, 0)]
+        for key, _, _, _ in stale:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+        return len(stale)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage and time parsed-survey snapshots.")
+    parser.add_argument('--snapshot-dir', default=DEFAULT_SNAPSHOT_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    timing = commands.add_parser('time', help="compare a JSON parse with a snapshot load")
+    timing.add_argument('qsf_files', nargs='+')
+    commands.add_parser('inspect', help="list snapshots, least recently used first")
+    clear = commands.add_parser('clear', help="remove snapshots")
+    clear.add_argument('--keep', type=int, default=0, help="keep the N most recently used")
+    args = parser.parse_args(argv)
+
+    cache = SnapshotCache(args.snapshot_dir, report=False)
+    if args.command == 'time':
+        for path in args.qsf_files:
+            start = time.perf_counter()
+            with open(path, 'rb') as f:
+                parsed = qsf_document.QSFDocument(json.loads(f.read()))
+            parsed.flow_index
+            parse_s = time.perf_counter() - start
+            cache.load(path, qsf_document.QSFDocument)
+            stored = not cache.stats[-1]['hit']
+            doc = cache.load(path, qsf_document.QSFDocument)
+            hit_s = cache.stats[-1]['seconds']
+            same = doc.dumps() == parsed.dumps()
+            print(f"{'✓' if same else '❌'} {path}: parse + index {parse_s * 1000:.1f} ms, "
+                  f"snapshot {hit_s * 1000:.1f} ms ({parse_s / hit_s:.1f}x faster"
+                  f"{', snapshot stored' if stored else ''})")
+        return 0
+
+    if args.command == 'inspect':
+        entries = cache.entries()
+        if not entries:
+            print(f"📋 {args.snapshot_dir} is empty")
+            return 0
+        print(f"📋 {len(entries)} snapshot(s) in {args.snapshot_dir}")
+        now = time.time()
+        for key, meta, size, used in entries:
+            print(f"   {key[:12]}  {meta['source']:<48} {size:>10,} bytes  "
+                  f"parse {meta['parse_s'] * 1000:6.1f} ms  used {(now - used) / 3600:.1f}h ago")
+        print(f"   Total: {sum(size for _, _, size, _ in entries):,} bytes")
+        return 0
+
+    removed = cache.clear(args.keep)
+    print(f"✓ Removed {removed} snapshot(s) from {args.snapshot_dir}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+SQLite store of survey variants for indexed cross-version queries.
+
+Questions like "which variants show pages/57 under both the Student and
+the Teaching branch" otherwise mean reparsing every QSF and walking it in
+Python. import_variants() loads each variant once into a local SQLite
+database with one table per kind of thing:
+
+- variants          one row per file: absolute path, name, SHA-256, size, mtime
+- elements          SurveyElements (Element, PrimaryAttribute, Payload JSON)
+- blocks            BL payload blocks (ID, Description, Type)
+- block_elements    each block's BlockElements (QuestionID)
+- flow_nodes        every flow node with its parent FlowID and depth, and
+                    its pre-order position and the last position in its
+                    subtree, so "node is inside branch B" is a range test
+- branch_conditions every BranchLogic expression (e.g. Role EqualTo Student)
+- embedded_fields   EmbeddedData fields set by the flow
+- iframe_urls       iframe src URLs in question text, with the part after
+                    'pages/' as page
+
+QIDs, block IDs, FlowIDs, pages and field names are indexed. Re-importing
+skips every file whose size and mtime are unchanged (or whose SHA-256
+still matches), and replaces the rows of a changed variant in one
+transaction.
+
+Usage:
+    python qsf_store.py import [<survey.qsf> ...] [--prune] [--db qsf_variants.db]
+    python qsf_store.py variants
+    python qsf_store.py page 57 [--roles Student Teaching]
+    python qsf_store.py sql "SELECT ... FROM flow_nodes WHERE flow_id = 'FL_11'"
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections.abc import Mapping
+
+from qsf_cache import file_sha256
+from qsf_document import QSFDocument
+from qsf_flow import branch_conditions
+
+DEFAULT_DB = 'qsf_variants.db'
+
+# Bump when the tables change; an older database is rebuilt from scratch
+SCHEMA_VERSION = 2
+
+DEFAULT_PATTERN = 'ai-attribution-in-cs-ed-master*.qsf'
+
+SCHEMA = """
+CREATE TABLE variants (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    imported REAL NOT NULL
+);
+CREATE TABLE elements (
+    variant_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    element TEXT,
+    primary_attribute TEXT,
+    secondary_attribute TEXT,
+    payload TEXT,
+    PRIMARY KEY (variant_id, position)
+);
+CREATE INDEX elements_primary ON elements (primary_attribute);
+CREATE INDEX elements_type ON elements (variant_id, element);
+CREATE TABLE blocks (
+    variant_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    block_id TEXT,
+    description TEXT,
+    type TEXT,
+    PRIMARY KEY (variant_id, position)
+);
+CREATE INDEX blocks_id ON blocks (block_id);
+CREATE TABLE block_elements (
+    variant_id INTEGER NOT NULL,
+    block_id TEXT,
+    position INTEGER NOT NULL,
+    type TEXT,
+    question_id TEXT
+);
+CREATE INDEX block_elements_question ON block_elements (question_id);
+CREATE INDEX block_elements_block ON block_elements (variant_id, block_id);
+CREATE TABLE flow_nodes (
+    variant_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    end_position INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    flow_id TEXT,
+    parent_flow_id TEXT,
+    type TEXT,
+    block_id TEXT,
+    description TEXT,
+    PRIMARY KEY (variant_id, position)
+);
+CREATE INDEX flow_nodes_flow_id ON flow_nodes (flow_id);
+CREATE INDEX flow_nodes_block ON flow_nodes (variant_id, block_id);
+CREATE TABLE branch_conditions (
+    variant_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    flow_id TEXT,
+    logic_type TEXT,
+    left_operand TEXT,
+    operator TEXT,
+    right_operand TEXT
+);
+CREATE INDEX branch_conditions_operand ON branch_conditions (left_operand, right_operand);
+CREATE TABLE embedded_fields (
+    variant_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    flow_id TEXT,
+    field TEXT,
+    type TEXT,
+    value TEXT
+);
+CREATE INDEX embedded_fields_field ON embedded_fields (field);
+CREATE TABLE iframe_urls (
+    variant_id INTEGER NOT NULL,
+    qid TEXT,
+    url TEXT,
+    page TEXT
+);
+CREATE INDEX iframe_urls_page ON iframe_urls (page);
+CREATE INDEX iframe_urls_qid ON iframe_urls (variant_id, qid);
+"""
+
+# Every table holding per-variant rows, in insertion order
+TABLES = ('elements', 'blocks', 'block_elements', 'flow_nodes', 'branch_conditions',
+          'embedded_fields', 'iframe_urls')
+
+_IFRAME_SRC = re.compile(r'<iframe\b[^>]*?\bsrc\s*=\s*["\']([^"\']+)', re.IGNORECASE)
+
+# Variants whose Role branch shows a page, through the block holding it
+PAGE_QUERY = """
+SELECT DISTINCT v.path, c.right_operand, u.qid, be.block_id
+FROM iframe_urls u
+JOIN variants v ON v.id = u.variant_id
+JOIN block_elements be ON be.variant_id = u.variant_id AND be.question_id = u.qid
+JOIN flow_nodes f ON f.variant_id = be.variant_id AND f.block_id = be.block_id
+JOIN branch_conditions c ON c.variant_id = f.variant_id AND c.left_operand = ?
+JOIN flow_nodes branch ON branch.variant_id = c.variant_id AND branch.position = c.position
+WHERE u.page = ? AND f.position > branch.position AND f.position <= branch.end_position
+ORDER BY v.path, c.right_operand, u.qid
+"""
+
+
+def connect(path=DEFAULT_DB):
+    """Open the store, creating (or rebuilding an outdated) schema."""
+    conn = sqlite3.connect(path)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version != SCHEMA_VERSION:
+        with conn:
+            for table in ('variants',) + TABLES:
+                conn.execute(f'DROP TABLE IF EXISTS {table}')
+            conn.executescript(SCHEMA)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return conn
+
+
+def _walk_flow(flow):
+    """[(node, row)] in pre-order; row is [position, end_position, depth, flow_id, parent, type, ID, Description]."""
+    nodes = []
+    parents = []
+    stack = [(child, flow.get('FlowID'), -1, 0) for child in reversed(flow.get('Flow') or [])]
+    while stack:
+        node, parent_flow_id, parent, depth = stack.pop()
+        position = len(nodes)
+        nodes.append((node, [position, position, depth, node.get('FlowID'), parent_flow_id,
+                             node.get('Type'), node.get('ID'), node.get('Description')]))
+        parents.append(parent)
+        stack.extend((child, node.get('FlowID'), position, depth + 1)
+                     for child in reversed(node.get('Flow') or []))
+    # Children come after their parent, so one backwards pass sets every subtree end
+    for position in range(len(nodes) - 1, -1, -1):
+        parent = parents[position]
+        if parent >= 0:
+            nodes[parent][1][1] = max(nodes[parent][1][1], nodes[position][1][1])
+    return nodes
+
+
+def _page(url):
+    _, sep, page = url.partition('pages/')
+    return page if sep else None
+
+
+def survey_rows(doc):
+    """{table: [row, ...]} for one survey, without the variant_id column."""
+    rows = {table: [] for table in TABLES}
+    for position, element in enumerate(doc.elements):
+        payload = element.get('Payload')
+        rows['elements'].append((position, element.get('Element'), element.get('PrimaryAttribute'),
+                                 element.get('SecondaryAttribute'),
+                                 json.dumps(payload, ensure_ascii=False) if payload is not None else None))
+        if element.get('Element') == 'SQ' and isinstance(payload, Mapping):
+            for url in _IFRAME_SRC.findall(payload.get('QuestionText') or ''):
+                rows['iframe_urls'].append((element.get('PrimaryAttribute'), url, _page(url)))
+
+    for position, block in enumerate(doc.blocks):
+        if not isinstance(block, Mapping):
+            continue
+        rows['blocks'].append((position, block.get('ID'), block.get('Description'), block.get('Type')))
+        for index, item in enumerate(block.get('BlockElements') or []):
+            if isinstance(item, Mapping):
+                rows['block_elements'].append((block.get('ID'), index, item.get('Type'), item.get('QuestionID')))
+
+    if doc.flow is not None:
+        for node, row in _walk_flow(doc.flow):
+            rows['flow_nodes'].append(tuple(row))
+            position, flow_id = row[0], row[3]
+            if node.get('Type') == 'Branch':
+                for condition in branch_conditions(node):
+                    rows['branch_conditions'].append((position, flow_id, condition.get('LogicType'),
+                                                      condition.get('LeftOperand'), condition.get('Operator'),
+                                                      condition.get('RightOperand')))
+            for field in node.get('EmbeddedData') or []:
+                if isinstance(field, Mapping):
+                    value = field.get('Value')
+                    rows['embedded_fields'].append((position, flow_id, field.get('Field'), field.get('Type'),
+                                                    value if value is None or isinstance(value, str) else json.dumps(value)))
+    return rows
+
+
+def _replace_rows(conn, variant_id, rows):
+    for table in TABLES:
+        conn.execute(f'DELETE FROM {table} WHERE variant_id = ?', (variant_id,))
+        if rows[table]:
+            marks = ', '.join('?' * (len(rows[table][0]) + 1))
+            conn.executemany(f'INSERT INTO {table} VALUES ({marks})',
+                             ((variant_id,) + tuple(row) for row in rows[table]))
+
+
+def import_variant(conn, path, force=False):
+    """
+    Import one QSF file; returns 'imported', 'updated', 'touched' or
+    'unchanged'. Variants are keyed by absolute path.
+    """
+    path = os.path.abspath(path)
+    name = os.path.basename(path)
+    stat = os.stat(path)
+    existing = conn.execute('SELECT id, sha256, size, mtime_ns FROM variants WHERE path = ?', (path,)).fetchone()
+    if existing and not force and (existing[2], existing[3]) == (stat.st_size, stat.st_mtime_ns):
+        return 'unchanged'
+    sha256 = file_sha256(path)
+    with conn:
+        if existing and not force and existing[1] == sha256:
+            # Touched but not edited: only the stamp moves
+            conn.execute('UPDATE variants SET size = ?, mtime_ns = ? WHERE id = ?',
+                         (stat.st_size, stat.st_mtime_ns, existing[0]))
+            return 'touched'
+        rows = survey_rows(QSFDocument.load(path))
+        if existing:
+            variant_id = existing[0]
+            conn.execute('UPDATE variants SET sha256 = ?, size = ?, mtime_ns = ?, imported = ? WHERE id = ?',
+                         (sha256, stat.st_size, stat.st_mtime_ns, time.time(), variant_id))
+        else:
+            variant_id = conn.execute('INSERT INTO variants (path, name, sha256, size, mtime_ns, imported) '
+                                      'VALUES (?, ?, ?, ?, ?, ?)',
+                                      (path, name, sha256, stat.st_size, stat.st_mtime_ns, time.time())).lastrowid
+        _replace_rows(conn, variant_id, rows)
+    return 'updated' if existing else 'imported'
+
+
+def remove_variant(conn, path):
+    with conn:
+        row = conn.execute('SELECT id FROM variants WHERE path = ?', (os.path.abspath(path),)).fetchone()
+        if row is None:
+            return False
+        for table in TABLES:
+            conn.execute(f'DELETE FROM {table} WHERE variant_id = ?', row)
+        conn.execute('DELETE FROM variants WHERE id = ?', row)
+    return True
+
+
+def import_variants(conn, paths, prune=False, force=False):
+    """
+    Import every path; with prune, drop variants whose file is gone.
+    Returns {path: status}; a file that cannot be read gets 'missing'.
+    """
+    results = {}
+    for path in paths:
+        try:
+            results[path] = import_variant(conn, path, force)
+        except FileNotFoundError:
+            results[path] = 'missing'
+    if prune:
+        for (path,) in conn.execute('SELECT path FROM variants').fetchall():
+            if not os.path.exists(path):
+                remove_variant(conn, path)
+                results[path] = 'removed'
+    return results
+
+
+def page_roles(conn, page, role_field='Role'):
+    """{variant path: {role: [(qid, block_id)]}} for the Role branches that show page."""
+    result = {}
+    for path, role, qid, block_id in conn.execute(PAGE_QUERY, (role_field, str(page))):
+        result.setdefault(path, {}).setdefault(role, []).append((qid, block_id))
+    return result
+
+
+def _shown(path):
+    """path relative to the current directory when it lies below it."""
+    relative = os.path.relpath(path)
+    return path if relative.startswith('..') else relative
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query survey variants through a SQLite store.")
+    parser.add_argument('--db', default=DEFAULT_DB, help=f"database file (default: {DEFAULT_DB})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    load = commands.add_parser('import', help="import new and changed variants")
+    load.add_argument('qsf_files', nargs='*', help=f"default: {DEFAULT_PATTERN}")
+    load.add_argument('--prune', action='store_true', help="drop variants whose file no longer exists")
+    load.add_argument('--force', action='store_true', help="re-import unchanged files too")
+    commands.add_parser('variants', help="list imported variants")
+    page = commands.add_parser('page', help="variants whose role branches show pages/PAGE")
+    page.add_argument('page')
+    page.add_argument('--role-field', default='Role')
+    page.add_argument('--roles', nargs='+', default=['Student', 'Teaching'])
+    sql = commands.add_parser('sql', help="run a query and print the rows")
+    sql.add_argument('query')
+    args = parser.parse_args(argv)
+
+    conn = connect(args.db)
+    if args.command == 'import':
+        paths = args.qsf_files or sorted(glob.glob(DEFAULT_PATTERN))
+        start = time.perf_counter()
+        results = import_variants(conn, paths, args.prune, args.force)
+        marks = {'imported': '✓', 'updated': '✓', 'touched': '⏭', 'unchanged': '⏭', 'removed': '🗑',
+                 'missing': '❌'}
+        for path, status in results.items():
+            print(f"{marks[status]} {status:<9} {_shown(path)}")
+        changed = sum(status in ('imported', 'updated', 'removed') for status in results.values())
+        missing = sum(status == 'missing' for status in results.values())
+        print(f"\n{'❌' if missing else '✅'} {changed} of {len(results)} variant(s) written to {args.db} "
+              f"in {time.perf_counter() - start:.2f}s" + (f"; {missing} file(s) not found" if missing else ''))
+        return 1 if missing else 0
+
+    if args.command == 'variants':
+        rows = conn.execute('SELECT v.path, v.sha256, v.size, '
+                            '(SELECT COUNT(*) FROM elements e WHERE e.variant_id = v.id), '
+                            '(SELECT COUNT(*) FROM flow_nodes f WHERE f.variant_id = v.id) '
+                            'FROM variants v ORDER BY v.path').fetchall()
+        print(f"📋 {len(rows)} variant(s) in {args.db}")
+        for path, sha256, size, elements, nodes in rows:
+            print(f"   {sha256[:12]}  {_shown(path):<52} {size:>10,} bytes  {elements:>5} elements  {nodes:>5} flow nodes")
+        return 0
+
+    if args.command == 'page':
+        start = time.perf_counter()
+        found = page_roles(conn, args.page, args.role_field)
+        elapsed = time.perf_counter() - start
+        paths = [row[0] for row in conn.execute('SELECT path FROM variants ORDER BY path')]
+        both = 0
+        print(f"📋 pages/{args.page} under {args.role_field} = {' / '.join(args.roles)}:")
+        for path in paths:
+            roles = found.get(path, {})
+            shown = all(role in roles for role in args.roles)
+            both += shown
+            detail = '; '.join(f"{role}: {', '.join(qid for qid, _ in roles[role])}"
+                               for role in args.roles if role in roles) or 'not shown'
+            print(f"   {'✓' if shown else '-'} {_shown(path):<52} {detail}")
+        print(f"\n📊 {both} of {len(paths)} variant(s) show it to every role ({elapsed * 1000:.1f} ms)")
+        return 0
+
+    try:
+        cursor = conn.execute(args.query)
+    except sqlite3.Error as e:
+        print(f"❌ {e}")
+        return 1
+    if cursor.description:
+        print('\t'.join(column[0] for column in cursor.description))
+        for row in cursor:
+            print('\t'.join('' if value is None else str(value) for value in row))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
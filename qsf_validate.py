@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Referential integrity checks for generated QSF surveys.
+
+Qualtrics either rejects or silently mangles a survey whose flow points at
+blocks that do not exist, whose blocks list questions that have no SQ
+element, or whose FlowIDs collide. validate() reports every such problem
+at once instead of stopping at the first, in one walk over the Survey Flow
+and one pass over the BL payload; every reference is resolved through the
+QSFDocument indexes, so the cost is linear in the size of the survey.
+
+Checks:
+- every Block/Standard flow item's ID exists in the BL payload
+- every BlockElements QuestionID has an SQ element
+- every Branch condition QuestionID has an SQ element
+- FlowIDs are present and unique
+- Properties.Count is at least the highest numeric FlowID (Qualtrics hands
+  out FL_<Count + 1> next, so a lower Count leads to collisions)
+- BlockRandomizer SubSet is not larger than its number of children
+- block IDs and QIDs are unique
+
+Usage:
+    python qsf_validate.py <survey.qsf> [<survey.qsf> ...]
+"""
+
+import sys
+from collections import namedtuple
+from collections.abc import Mapping
+
+from qsf_document import QSFDocument
+from qsf_flow import branch_conditions
+
+Issue = namedtuple('Issue', ['severity', 'kind', 'location', 'message'])
+
+ERROR = 'error'
+WARNING = 'warning'
+
+BLOCK_FLOW_TYPES = ('Block', 'Standard')
+
+
+def _check_flow(doc, issues):
+    flow = doc.flow
+    if flow is None:
+        issues.append(Issue(ERROR, 'missing-flow', 'SurveyElements', "No FL element"))
+        return
+
+    seen_flow_ids = {}
+    highest = 0
+    stack = [(node, 'Flow') for node in reversed(flow.get('Flow') or [])]
+    while stack:
+        node, path = stack.pop()
+        node_type = node.get('Type')
+        flow_id = node.get('FlowID')
+        location = flow_id or path
+
+        if flow_id is None:
+            issues.append(Issue(ERROR, 'missing-flow-id', path, f"{node_type} flow item has no FlowID"))
+        elif flow_id in seen_flow_ids:
+            issues.append(Issue(ERROR, 'duplicate-flow-id', flow_id,
+                                f"FlowID also used by a {seen_flow_ids[flow_id]} item"))
+        else:
+            seen_flow_ids[flow_id] = node_type
+            if flow_id.startswith('FL_') and flow_id[3:].isdigit():
+                highest = max(highest, int(flow_id[3:]))
+
+        if node_type in BLOCK_FLOW_TYPES:
+            block_id = node.get('ID')
+            if doc.block(block_id) is None:
+                issues.append(Issue(ERROR, 'dangling-block', location,
+                                    f"{node_type} flow item points at missing block {block_id}"))
+        elif node_type == 'Branch':
+            for condition in branch_conditions(node):
+                qid = condition.get('QuestionID')
+                if qid and doc.question(qid) is None:
+                    issues.append(Issue(ERROR, 'dangling-question', location,
+                                        f"Branch condition uses missing question {qid}"))
+        elif node_type == 'BlockRandomizer':
+            subset = node.get('SubSet')
+            children = len(node.get('Flow') or [])
+            if isinstance(subset, str) and subset.isdigit():
+                subset = int(subset)
+            if isinstance(subset, int) and subset > children:
+                issues.append(Issue(ERROR, 'randomizer-subset', location,
+                                    f"SubSet {subset} exceeds its {children} children"))
+
+        children = node.get('Flow') or []
+        for i in range(len(children) - 1, -1, -1):
+            stack.append((children[i], f'{location}/Flow[{i}]'))
+
+    count = (flow.get('Properties') or {}).get('Count')
+    if not isinstance(count, int):
+        issues.append(Issue(WARNING, 'flow-count', 'Properties.Count', "Properties.Count is missing"))
+    elif count < highest:
+        issues.append(Issue(ERROR, 'flow-count', 'Properties.Count',
+                            f"Count is {count} but the flow uses FL_{highest}"))
+
+
+def _check_blocks(doc, issues):
+    seen_block_ids = set()
+    for i, block in enumerate(doc.blocks):
+        if not isinstance(block, Mapping):
+            continue
+        block_id = block.get('ID')
+        location = block_id or f'BL[{i}]'
+        if block_id in seen_block_ids:
+            issues.append(Issue(ERROR, 'duplicate-block-id', location, "Block ID is used more than once"))
+        seen_block_ids.add(block_id)
+        for element in block.get('BlockElements') or []:
+            if element.get('Type') != 'Question':
+                continue
+            qid = element.get('QuestionID')
+            if doc.question(qid) is None:
+                issues.append(Issue(ERROR, 'dangling-question', location,
+                                    f"BlockElements lists missing question {qid}"))
+
+
+def _check_questions(doc, issues):
+    questions = doc.elements_of_type('SQ')
+    if len(questions) == len(doc.question_ids()):
+        return
+    # Only walk the SQ elements again when the index says something collided
+    seen = set()
+    for element in questions:
+        qid = element.get('PrimaryAttribute')
+        if qid in seen:
+            issues.append(Issue(ERROR, 'duplicate-qid', qid, "More than one SQ element has this QID"))
+        seen.add(qid)
+
+
+def validate(doc):
+    """Return a list of Issues for doc (empty if the survey is consistent)."""
+    issues = []
+    _check_flow(doc, issues)
+    _check_blocks(doc, issues)
+    _check_questions(doc, issues)
+    return issues
+
+
+def print_report(issues, label=None):
+    """Print issues grouped by severity; return the number of errors."""
+    errors = [issue for issue in issues if issue.severity == ERROR]
+    warnings = [issue for issue in issues if issue.severity == WARNING]
+    prefix = f"{label}: " if label else ""
+    if not issues:
+        print(f"✅ {prefix}no integrity problems found")
+        return 0
+    print(f"{'❌' if errors else '⚠️'} {prefix}{len(errors)} error(s), {len(warnings)} warning(s)")
+    for issue in errors + warnings:
+        print(f"   - [{issue.severity}] {issue.kind} at {issue.location}: {issue.message}")
+    return len(errors)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python qsf_validate.py <survey.qsf> [<survey.qsf> ...]")
+        sys.exit(1)
+
+    total_errors = 0
+    for path in sys.argv[1:]:
+        total_errors += print_report(validate(QSFDocument.load(path)), path)
+    sys.exit(1 if total_errors else 0)
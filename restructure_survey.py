@@ -7,7 +7,9 @@ Restructure the survey to:
 4. Display 5 S blocks + 5 per-vignette blocks based on assigned numbers
 """
 
-import json
+import qsf_instrument
+from qsf_clone import clone
+from qsf_document import QSFDocument
 
 def create_display_block():
     """Create a block that displays the assigned scenario numbers."""
@@ -120,23 +122,21 @@ def create_input_question():
         }
     }
 
-def main():
-    input_file = 'ai-attribution-in-cs-ed-master (2).qsf'
-    output_file = 'ai-attribution-in-cs-ed-master-restructured.qsf'
-    
-    print(f"Loading {input_file}...")
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+@qsf_instrument.transform('restructure_survey')
+def main(input_file='ai-attribution-in-cs-ed-master (2).qsf',
+         output_file='ai-attribution-in-cs-ed-master-restructured.qsf',
+         doc=None, scenario_count=102):
+    """
+    Run the transform; pass doc (and output_file=None) to work in memory.
+    scenario_count replaces 102 (the scaling benchmark uses this).
+    """
+    if doc is None:
+        print(f"Loading {input_file}...")
+        doc = QSFDocument.load(input_file)
+    qsf_instrument.phase('locate')
     
     # Find blocks element
-    blocks_element = None
-    blocks_index = None
-    for i, elem in enumerate(data.get('SurveyElements', [])):
-        if elem.get('Element') == 'BL':
-            blocks_element = elem
-            blocks_index = i
-            break
+    blocks_element = doc.blocks_element
     
     if not blocks_element:
         print("Error: Could not find blocks element")
@@ -161,21 +161,22 @@ def main():
     print(f"✓ Found {len(s_blocks)} S blocks")
     print(f"✓ Found per-vignette block: {per_vig_block.get('ID') if per_vig_block else 'NOT FOUND'}")
     
+    qsf_instrument.phase('clone')
     # Create 5 copies of per-vignette block
     new_per_vig_blocks = []
     for i in range(1, 6):
-        new_block = json.loads(json.dumps(per_vig_block))
+        new_block = clone(per_vig_block)
         new_block['Description'] = f'per-vignette-S{i}'
         new_block['ID'] = f'BL_PerVig_S{i}'
         new_per_vig_blocks.append(new_block)
     
-    blocks_payload.extend(new_per_vig_blocks)
+    doc.add_blocks(new_per_vig_blocks)
     print(f"✓ Created 5 per-vignette blocks (BL_PerVig_S1 - BL_PerVig_S5)")
     
     # Add display and input blocks
     display_block = create_display_block()
     input_block = create_input_validation_block()
-    blocks_payload.extend([display_block, input_block])
+    doc.add_blocks([display_block, input_block])
     print(f"✓ Created display and input blocks")
     
     # Add questions
@@ -183,16 +184,15 @@ def main():
     input_question = create_input_question()
     
     # Insert questions into SurveyElements (before blocks element)
-    data['SurveyElements'].insert(blocks_index, display_question)
-    data['SurveyElements'].insert(blocks_index + 1, input_question)
+    with doc.batch() as batch:
+        batch.insert_before(blocks_element, [display_question, input_question])
     print(f"✓ Created display and input questions")
+    qsf_instrument.count('blocks', len(new_per_vig_blocks) + 2)
+    qsf_instrument.count('questions', 2)
     
+    qsf_instrument.phase('flow')
     # Now restructure the Survey Flow
-    flow_element = None
-    for elem in data.get('SurveyElements', []):
-        if elem.get('Element') == 'FL':
-            flow_element = elem
-            break
+    flow_element = doc.flow_element
     
     if not flow_element:
         print("Error: Could not find Survey Flow element")
@@ -267,7 +267,7 @@ def main():
     }
     
     # Add all 102 scenarios to the randomizer
-    for i in range(1, 103):
+    for i in range(1, scenario_count + 1):
         randomizer["Flow"].append({
             "Type": "EmbeddedData",
             "FlowID": f"FL_Scenario{i}",
@@ -321,7 +321,7 @@ def main():
         }
         
         # Add all 102 possible S blocks + per-vig pairs as sub-branches
-        for scenario_num in range(1, 103):
+        for scenario_num in range(1, scenario_count + 1):
             sub_branch = {
                 "Type": "Branch",
                 "FlowID": f"FL_Branch_S{i}_Num{scenario_num}",
@@ -359,18 +359,20 @@ def main():
     
     # Replace the flow
     flow_payload['Flow'] = new_flow
+    qsf_instrument.count('flow_nodes', len(new_flow))
+    doc.invalidate_flow_index()
     flow_payload['Properties'] = {
         "Count": len(new_flow)
     }
     
     print(f"✓ Created new flow structure with randomization and branching")
     
+    qsf_instrument.phase('dump')
     # Write output
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Successfully created {output_file}")
-    print(f"   - Randomly assigns 5 scenario numbers (1-102) with even presentation")
+    if output_file:
+        doc.save(output_file)
+        print(f"\n✅ Successfully created {output_file}")
+    print(f"   - Randomly assigns 5 scenario numbers (1-{scenario_count}) with even presentation")
     print(f"   - Displays assigned numbers to participants")
     print(f"   - Asks participants to input the numbers")
     print(f"   - Shows 5 S blocks + 5 per-vignette blocks based on assignments")
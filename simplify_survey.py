@@ -7,7 +7,9 @@ Simplified restructure:
 4. Show 5 pairs of blocks: S1-S5 with dynamic iframe URLs using piped text from user input
 """
 
-import json
+import qsf_instrument
+from qsf_clone import clone
+from qsf_document import QSFDocument
 
 def create_display_block():
     """Create a block that displays the assigned scenario numbers."""
@@ -175,48 +177,41 @@ def create_dynamic_iframe_question(num):
         }
     }
 
-def main():
-    input_file = 'ai-attribution-in-cs-ed-master (2).qsf'
-    output_file = 'ai-attribution-in-cs-ed-master-simplified.qsf'
-    
-    print(f"Loading {input_file}...")
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+@qsf_instrument.transform('simplify_survey')
+def main(input_file='ai-attribution-in-cs-ed-master (2).qsf',
+         output_file='ai-attribution-in-cs-ed-master-simplified.qsf',
+         doc=None, scenario_count=102):
+    """
+    Run the transform; pass doc (and output_file=None) to work in memory.
+    scenario_count replaces 102 (the scaling benchmark uses this).
+    """
+    if doc is None:
+        print(f"Loading {input_file}...")
+        doc = QSFDocument.load(input_file)
+    qsf_instrument.phase('locate')
     
     # Find blocks element
-    blocks_element = None
-    blocks_index = None
-    for i, elem in enumerate(data.get('SurveyElements', [])):
-        if elem.get('Element') == 'BL':
-            blocks_element = elem
-            blocks_index = i
-            break
+    blocks_element = doc.blocks_element
     
     if not blocks_element:
         print("Error: Could not find blocks element")
         return False
     
-    blocks_payload = blocks_element.get('Payload', [])
-    
     # Find per-vignette block
-    per_vig_block = None
-    for block in blocks_payload:
-        if block.get('ID') == 'BL_8xeykGPs5f8ULQy':
-            per_vig_block = block
-            break
+    per_vig_block = doc.block('BL_8xeykGPs5f8ULQy')
     
     print(f"✓ Found per-vignette block: {per_vig_block.get('ID') if per_vig_block else 'NOT FOUND'}")
     
+    qsf_instrument.phase('clone')
     # Create 5 copies of per-vignette block
     new_per_vig_blocks = []
     for i in range(1, 6):
-        new_block = json.loads(json.dumps(per_vig_block))
+        new_block = clone(per_vig_block)
         new_block['Description'] = f'per-vignette-S{i}'
         new_block['ID'] = f'BL_PerVig_S{i}'
         new_per_vig_blocks.append(new_block)
     
-    blocks_payload.extend(new_per_vig_blocks)
+    doc.add_blocks(new_per_vig_blocks)
     print(f"✓ Created 5 per-vignette blocks (BL_PerVig_S1 - BL_PerVig_S5)")
     
     # Create 5 dynamic S blocks
@@ -224,13 +219,13 @@ def main():
     for i in range(1, 6):
         dynamic_s_blocks.append(create_dynamic_s_block(i))
     
-    blocks_payload.extend(dynamic_s_blocks)
+    doc.add_blocks(dynamic_s_blocks)
     print(f"✓ Created 5 dynamic S blocks (BL_S1_Dynamic - BL_S5_Dynamic)")
     
     # Add display and input blocks
     display_block = create_display_block()
     input_block = create_input_validation_block()
-    blocks_payload.extend([display_block, input_block])
+    doc.add_blocks([display_block, input_block])
     print(f"✓ Created display and input blocks")
     
     # Add questions
@@ -244,17 +239,16 @@ def main():
     
     # Insert all questions before blocks element
     questions_to_insert = [display_question, input_question] + dynamic_iframe_questions
-    for i, q in enumerate(questions_to_insert):
-        data['SurveyElements'].insert(blocks_index + i, q)
+    with doc.batch() as batch:
+        batch.insert_before(blocks_element, questions_to_insert)
     
     print(f"✓ Created display, input, and 5 dynamic iframe questions")
+    qsf_instrument.count('blocks', len(new_per_vig_blocks) + len(dynamic_s_blocks) + 2)
+    qsf_instrument.count('questions', len(questions_to_insert))
     
+    qsf_instrument.phase('flow')
     # Now restructure the Survey Flow
-    flow_element = None
-    for elem in data.get('SurveyElements', []):
-        if elem.get('Element') == 'FL':
-            flow_element = elem
-            break
+    flow_element = doc.flow_element
     
     if not flow_element:
         print("Error: Could not find Survey Flow element")
@@ -329,7 +323,7 @@ def main():
     }
     
     # Add all 102 scenarios to the randomizer
-    for i in range(1, 103):
+    for i in range(1, scenario_count + 1):
         randomizer["Flow"].append({
             "Type": "EmbeddedData",
             "FlowID": f"FL_Scenario{i}",
@@ -379,18 +373,20 @@ def main():
     
     # Replace the flow
     flow_payload['Flow'] = new_flow
+    qsf_instrument.count('flow_nodes', len(new_flow))
+    doc.invalidate_flow_index()
     flow_payload['Properties'] = {
         "Count": len(new_flow)
     }
     
     print(f"✓ Created simplified flow structure (no branches needed)")
     
+    qsf_instrument.phase('dump')
     # Write output
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Successfully created {output_file}")
-    print(f"   - Randomly assigns 5 scenario numbers (1-102) with even presentation")
+    if output_file:
+        doc.save(output_file)
+        print(f"\n✅ Successfully created {output_file}")
+    print(f"   - Randomly assigns 5 scenario numbers (1-{scenario_count}) with even presentation")
     print(f"   - Displays assigned numbers to participants")
     print(f"   - Asks participants to input the numbers")
     print(f"   - Shows 5 S blocks with dynamic iframe URLs based on user input")
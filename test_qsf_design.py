@@ -0,0 +1,46 @@
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from qsf_design import balanced_design, cyclic_design, pair_target, summarize
+
+
+def test_balanced_design_rows_equal_m_meets_pair_target():
+    stats = summarize(balanced_design(102, 5), 102)
+    assert (stats['exposure_min'], stats['exposure_max']) == (5, 5)
+    assert stats['repeats_in_row'] == 0
+    assert stats['pair_max'] == pair_target(102, 5, 102)
+
+
+@pytest.mark.parametrize('rows', [50, 500, 1000, 2000])
+def test_balanced_design_rows_not_m_returns_relaxed_design(rows):
+    start = time.perf_counter()
+    design = balanced_design(102, 5, rows=rows)
+    assert time.perf_counter() - start < 60
+
+    stats = summarize(design, 102)
+    assert design.shape == (rows, 5)
+    # Exposure stays exact (+-1) and rows never repeat a scenario
+    assert stats['exposure_max'] - stats['exposure_min'] <= 1
+    assert stats['repeats_in_row'] == 0
+    # The pair limit is only relaxed up to max_slack (2) above ceil(lambda)
+    assert stats['pair_max'] <= pair_target(102, 5, rows) + 2
+
+
+def test_balanced_design_max_slack_bounds_pair_counts():
+    stats = summarize(balanced_design(102, 5, rows=1000, max_slack=1), 102)
+    assert stats['repeats_in_row'] == 0
+    assert stats['pair_max'] <= pair_target(102, 5, 1000) + 1
+
+
+def test_balanced_design_is_reproducible():
+    assert (balanced_design(102, 5, rows=500) == balanced_design(102, 5, rows=500)).all()
+
+
+def test_cyclic_design_shows_every_scenario_n_times():
+    rows = cyclic_design(102, 5)
+    assert rows[0] == [1, 21, 41, 61, 81]
+    assert all(len(set(row)) == 5 for row in rows)
+    assert sorted(s for row in rows for s in row) == sorted(list(range(1, 103)) * 5)
@@ -0,0 +1,58 @@
+from qsf_document import QSFDocument
+
+
+def _question(qid, text):
+    return {"SurveyID": "SV_test", "Element": "SQ", "PrimaryAttribute": qid,
+            "Payload": {"QuestionID": qid, "QuestionText": text}}
+
+
+def _doc():
+    return QSFDocument({"SurveyElements": [
+        {"Element": "BL", "Payload": []},
+        {"Element": "FL", "Payload": {"Flow": []}},
+        _question('QID1', 'first'),
+        _question('QID2', 'other'),
+        _question('QID1', 'second'),
+    ]})
+
+
+def _matches_reindex(doc):
+    fresh = QSFDocument(doc.data)
+    return all(doc.question(qid) is fresh.question(qid) for qid in set(doc.question_ids()) | set(fresh.question_ids()))
+
+
+def test_duplicate_qids_resolve_to_the_first_in_document_order():
+    doc = _doc()
+    assert doc.question('QID1')['Payload']['QuestionText'] == 'first'
+
+
+def test_insert_elements_keeps_the_first_duplicate():
+    doc = _doc()
+    doc.append_elements([_question('QID1', 'appended')])
+    assert doc.question('QID1')['Payload']['QuestionText'] == 'first'
+    doc.insert_elements(0, [_question('QID1', 'inserted')])
+    assert doc.question('QID1')['Payload']['QuestionText'] == 'inserted'
+    assert _matches_reindex(doc)
+
+
+def test_remove_element_falls_back_to_the_next_duplicate():
+    doc = _doc()
+    doc.remove_element(doc.question('QID1'))
+    assert doc.question('QID1')['Payload']['QuestionText'] == 'second'
+    doc.remove_element(doc.question('QID1'))
+    assert doc.question('QID1') is None
+    assert _matches_reindex(doc)
+
+
+def test_rename_question_follows_document_order():
+    doc = _doc()
+    # Renaming the later duplicate onto an earlier QID leaves the earlier one indexed
+    second = doc.elements[4]
+    doc.rename_question(second, 'QID2')
+    assert doc.question('QID1')['Payload']['QuestionText'] == 'first'
+    assert doc.question('QID2')['Payload']['QuestionText'] == 'other'
+    # Renaming the indexed one away exposes the next SQ with its old QID
+    doc.rename_question(doc.question('QID2'), 'QID3')
+    assert doc.question('QID2') is second
+    assert doc.question('QID3')['Payload']['QuestionText'] == 'other'
+    assert _matches_reindex(doc)
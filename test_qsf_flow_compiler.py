@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from qsf_document import QSFDocument
+from qsf_flow_compiler import STRATEGIES, apply_strategy
+
+SURVEY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ai-attribution-in-cs-ed-master (2).qsf')
+
+
+def _outline(nodes):
+    return [(node.get('Type'), node.get('FlowID'), node.get('ID')) for node in nodes]
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_apply_strategy_keeps_the_surrounding_flow(strategy):
+    doc = QSFDocument.load(SURVEY)
+    top_level = _outline(doc.flow['Flow'])
+    student = doc.flow_index.node('FL_11')
+    kept_student_items = _outline(student['Flow'][:3])
+
+    flows = apply_strategy(doc, strategy, 102, 5)
+
+    # Role EmbeddedData, consent Block, Branches and EndSurvey all survive
+    assert _outline(doc.flow['Flow']) == top_level
+    student = doc.flow_index.node('FL_11')
+    assert _outline(student['Flow'][:3]) == kept_student_items
+    # Only the two S<n> randomizers were swapped for the compiled nodes
+    assert len(flows) == 2
+    assert student['Flow'][3:] == flows[0]
+    assert doc.flow_index.node('FL_29') is None
+    assert doc.flow_index.node('FL_2721') is None
+    assert doc.flow['Properties']['Count'] >= max(int(f[3:]) for f in doc.flow_index.flow_ids()
+                                                  if f[3:].isdigit())
+
+
+def test_apply_strategy_without_scenario_groups_raises():
+    doc = QSFDocument.load(SURVEY)
+    apply_strategy(doc, 'piped', 102, 5)
+    with pytest.raises(ValueError):
+        apply_strategy(doc, 'piped', 102, 5)
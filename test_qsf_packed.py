@@ -0,0 +1,41 @@
+import csv
+
+from qsf_packed import decode_responses
+
+HEADER = ['ResponseId', 'Selected1', 'Selected2', 'Selected3', 'Q1']
+QUESTION_TEXT = ['Response ID', 'Selected1', 'Selected2', 'Selected3', 'How clear was it?']
+IMPORT_IDS = ['{"ImportId":"_recordId"}', '{"ImportId":"Selected1"}', '{"ImportId":"Selected2"}',
+              '{"ImportId":"Selected3"}', '{"ImportId":"QID1"}']
+RESPONSES = [['R_1', '3', '', '7', 'Very'], ['R_2', '', '2', '', 'Somewhat']]
+
+
+def _decode(tmp_path, rows):
+    source = tmp_path / 'responses.csv'
+    output = tmp_path / 'decoded.csv'
+    with open(source, 'w', newline='') as f:
+        csv.writer(f).writerows([HEADER] + rows)
+    count = decode_responses(str(source), str(output))
+    with open(output, newline='') as f:
+        return count, list(csv.reader(f))
+
+
+def test_decode_current_export_layout(tmp_path):
+    count, rows = _decode(tmp_path, [QUESTION_TEXT, IMPORT_IDS] + RESPONSES)
+    assert count == 2
+    assert rows[0] == ['ResponseId', 'Q1', 'Scenario1', 'Scenario2']
+    assert rows[3:] == [['R_1', 'Very', '3', '7'], ['R_2', 'Somewhat', '2', '']]
+
+
+def test_decode_legacy_export_without_import_ids(tmp_path):
+    count, rows = _decode(tmp_path, [QUESTION_TEXT] + RESPONSES)
+    assert count == 2
+    assert rows[1] == ['Response ID', 'How clear was it?', 'Scenario1', 'Scenario2']
+    assert rows[2:] == [['R_1', 'Very', '3', '7'], ['R_2', 'Somewhat', '2', '']]
+
+
+def test_decode_leaves_unreadable_rows_undecoded(tmp_path, capsys):
+    bad = ['R_3', 'n/a', '', '', 'Not at all']
+    count, rows = _decode(tmp_path, [QUESTION_TEXT] + RESPONSES[:1] + [bad])
+    assert count == 2
+    assert rows[3] == ['R_3', 'Not at all', '', '']
+    assert 'Line 4' in capsys.readouterr().out